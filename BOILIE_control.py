@@ -1,9 +1,12 @@
 import threading
 import os
+import subprocess
 import sys
-from core import tx_worker
-from bots import tipping_bot, catch_bot, raffle_bot, info_bot, factory_bot
-import backup_json
+import time
+from core import lock_metrics, metrics, profiling
+from components import COMPONENTS, load_entry
+import supervisor
+from paths import DEBUG_FILE
 import tkinter as tk
 from queue import Queue
 from tkinter.scrolledtext import ScrolledText
@@ -16,20 +19,41 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-# Bot functions
-SCRIPTS = {
-    "TX Worker": lambda ev: tx_worker.process_pending_transactions(ev),
-    "Hourly Backups": lambda ev: backup_json.main(ev),
-    "Tipping Bot": lambda ev: tipping_bot.run_bot(ev),
-    "Catch Bot": lambda ev: catch_bot.create_catch_bot().run(stop_event=ev),
-    "Raffle Bot": lambda ev: raffle_bot.run_bot(ev),
-    "Info Bot": lambda ev: info_bot.run_bot(ev),
-    "Factory Bot": lambda ev: factory_bot.run_bot(ev)
-}
+# Bot functions; a component's module (and discord.py for the bots) is only imported when it is started
+SCRIPTS = {name: (lambda ev, name=name: load_entry(name)(ev)) for name in COMPONENTS}
 
 PROCESSES = {}
 STATUSES = {}
 
+# Attach to supervisor.py, which runs every component in its own process, instead of running them as threads here
+SUPERVISOR = os.getenv("SUPERVISOR", "0").strip().lower() in ("1", "true", "yes")
+supervisor_client = supervisor.SupervisorClient(timeout=2) if SUPERVISOR else None
+# Supervisor states shown as controller states
+SUPERVISOR_STATES = {"running": "running", "stopped": "stopped", "starting": "starting", "stopping": "starting", "backoff": "error", "failed": "error"}
+
+if not SUPERVISOR:
+    COMPONENT_RUNNING = metrics.gauge("boilies_component_running", "1 while a component started from the controller is running", ("component",))
+    for _name in SCRIPTS:
+        COMPONENT_RUNNING.set_function(lambda name=_name: STATUSES.get(name) == "running", component=_name)
+
+
+def ensure_supervisor():
+    # Starts a supervisor in the background if none is running; it outlives the controller
+    if supervisor_client.running():
+        return
+    if getattr(sys, 'frozen', False):
+        print("⚠️ No supervisor running. Start it with: python supervisor.py --none")
+        return
+    print("🧭 Starting the supervisor...")
+    with open(DEBUG_FILE, "a") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.join(PROJECT_ROOT, "supervisor.py"), "--none"],
+            cwd=PROJECT_ROOT, stdout=log, stderr=log, stdin=subprocess.DEVNULL, start_new_session=True,
+        )
+    deadline = time.monotonic() + 5
+    while not supervisor_client.running() and time.monotonic() < deadline:
+        time.sleep(0.1)
+
 def create_gui():
     root = ttk.Window(themename="darkly")
     log_queue = Queue()
@@ -37,17 +61,29 @@ def create_gui():
 
     STATUS_COLORS = {
         "running": "green",
+        "starting": "yellow",
         "stopped": "grey",
         "error": "red",
     }
+    supervisor_state = {"last_event": 0, "reachable": True, "components": {}}
 
     status_labels = {}
     toggle_buttons = {}
 
     def start_script(name, func):
+        if supervisor_client:
+            try:
+                supervisor_client.call("start", name=name)
+                STATUSES[name] = "starting"
+            except (supervisor.SupervisorUnavailable, ValueError) as e:
+                print(f"❌ Failed to start {name}: {e}")
+                STATUSES[name] = "error"
+            update_status()
+            return
         try:
             shutdown_events[name] = threading.Event()
-            thread = threading.Thread(target=func, args=(shutdown_events[name],), daemon=True)
+            # Named after the component, so the profiler can pick out its thread
+            thread = threading.Thread(target=func, args=(shutdown_events[name],), name=name, daemon=True)
             thread.start()
             PROCESSES[name] = thread
             STATUSES[name] = "running"
@@ -58,6 +94,13 @@ def create_gui():
             update_status()
 
     def stop_script(name):
+        if supervisor_client:
+            try:
+                supervisor_client.call("stop", name=name)
+            except (supervisor.SupervisorUnavailable, ValueError) as e:
+                print(f"❌ Failed to stop {name}: {e}")
+            update_status()
+            return
         if name in shutdown_events:
             shutdown_events[name].set()
         thread = PROCESSES.get(name)
@@ -70,7 +113,7 @@ def create_gui():
         status = STATUSES.get(name, "stopped")
         toggle_buttons[name].config(state="disabled")
         def run_toggle():
-            if status == "running":
+            if status in ("running", "starting"):
                 stop_script(name)
             else:
                 start_script(name, SCRIPTS[name])
@@ -84,18 +127,44 @@ def create_gui():
             canvas, circle = status_labels[name]
             canvas.itemconfig(circle, fill=color, outline=color)
             btn = toggle_buttons[name]
-            btn_text = "OFF" if status == "running" else "ON"
+            btn_text = "OFF" if status in ("running", "starting") else "ON"
             if btn.cget("text") != btn_text:
                 btn.config(text=btn_text)
 
             style = {
                 "running": "success.TButton",
+                "starting": "warning.TButton",
                 "stopped": "secondary.TButton",
                 "error": "danger.TButton"
             }.get(status, "secondary.TButton")
             btn.config(style=style)
 
+    def check_supervisor():
+        try:
+            status = supervisor_client.call("status", since=supervisor_state["last_event"])
+        except supervisor.SupervisorUnavailable as e:
+            if supervisor_state["reachable"]:
+                print(f"⚠️ {e}")
+                supervisor_state["reachable"] = False
+            for name in SCRIPTS:
+                STATUSES[name] = "error"
+            return
+        if not supervisor_state["reachable"]:
+            print("🧭 Supervisor reachable again.")
+            supervisor_state["reachable"] = True
+        for event_id, text in status["events"]:
+            print(text)
+            supervisor_state["last_event"] = event_id
+        supervisor_state["components"] = status["components"]
+        for name, component in status["components"].items():
+            STATUSES[name] = SUPERVISOR_STATES.get(component["state"], "error")
+
     def check_threads():
+        if supervisor_client:
+            check_supervisor()
+            update_status()
+            root.after(1000, check_threads)
+            return
         for name, thread in PROCESSES.items():
             if not thread.is_alive() and STATUSES.get(name) == "running":
                 STATUSES[name] = "error"
@@ -121,6 +190,127 @@ def create_gui():
     output_text = ScrolledText(root, height=15, width=70, state="disabled")
     output_text.grid(row=len(SCRIPTS), column=0, columnspan=3, padx=5, pady=5)
 
+    # Lock wait/hold percentiles per call site (LOCK_METRICS=1)
+    LOCK_COLUMNS = ("count", "wait p50", "wait p99", "wait max", "hold p50", "hold p99", "hold max")
+    lock_window = {}
+
+    def refresh_lock_stats():
+        window = lock_window.get("window")
+        if window is None or not window.winfo_exists():
+            return
+        tree = lock_window["tree"]
+        tree.delete(*tree.get_children())
+        for site, s in lock_metrics.lock_stats().items():
+            wait, hold = s["wait"], s["hold"]
+            tree.insert("", tk.END, text=site, values=(
+                hold["count"], f"{wait['p50_ms']:.3f}", f"{wait['p99_ms']:.3f}", f"{wait['max_ms']:.3f}",
+                f"{hold['p50_ms']:.3f}", f"{hold['p99_ms']:.3f}", f"{hold['max_ms']:.3f}",
+            ))
+        window.after(2000, refresh_lock_stats)
+
+    def show_lock_stats():
+        window = lock_window.get("window")
+        if window is not None and window.winfo_exists():
+            window.lift()
+            return
+        window = ttk.Toplevel(root)
+        window.title("Lock contention (ms)")
+        if supervisor_client:
+            ttk.Label(window, text="Components run in their own processes. Run python -m core.lock_metrics for their dumps.").pack(padx=10, pady=10)
+            lock_window["window"] = window
+            return
+        if not lock_metrics.LOCK_METRICS:
+            ttk.Label(window, text="Lock metrics are off. Start the controller with LOCK_METRICS=1.").pack(padx=10, pady=10)
+            lock_window["window"] = window
+            return
+        tree = ttk.Treeview(window, columns=LOCK_COLUMNS, height=15)
+        tree.heading("#0", text="call site")
+        tree.column("#0", width=240)
+        for column in LOCK_COLUMNS:
+            tree.heading(column, text=column)
+            tree.column(column, width=75, anchor="e")
+        tree.pack(fill="both", expand=True, padx=5, pady=5)
+        lock_window.update(window=window, tree=tree)
+        refresh_lock_stats()
+
+    # Sampling profiler for a running component; results go to data/profiles
+    profile_window = {}
+
+    def profiler(target):
+        # In-process, or the metrics endpoint of the component's own process when attached to the supervisor
+        if not supervisor_client:
+            return profiling
+        return profiling.RemoteProfiler(supervisor_state["components"].get(target, {}).get("metrics_port"))
+
+    def refresh_profile_status():
+        window = profile_window.get("window")
+        if window is None or not window.winfo_exists():
+            return
+        try:
+            status = profiler(profile_window["target"].get()).status()
+        except Exception:
+            status = {"running": False}
+        running = status["running"]
+        profile_window["status"].config(
+            text=f"Sampling {status['target']}: {status['samples']} samples in {status['seconds']} s" if running else "Idle"
+        )
+        profile_window["button"].config(text="⏹ Stop" if running else "▶ Start", style="danger.TButton" if running else "success.TButton")
+        window.after(1000, refresh_profile_status)
+
+    def show_output(title, text):
+        window = ttk.Toplevel(root)
+        window.title(title)
+        box = ScrolledText(window, height=30, width=120)
+        box.insert(tk.END, text)
+        box.config(state="disabled")
+        box.pack(fill="both", expand=True, padx=5, pady=5)
+
+    def toggle_profile():
+        target = profile_window["target"].get()
+        def run_toggle():
+            try:
+                backend = profiler(target)
+                if backend.status()["running"]:
+                    result = backend.stop()
+                    print(f"⏱️ {result['samples']} samples of {result['target']}: " + ", ".join(result["files"].values()))
+                else:
+                    backend.start(target)
+            except (LookupError, RuntimeError, OSError) as e:
+                print(f"⚠️ Profiler: {e}")
+        threading.Thread(target=run_toggle, daemon=True).start()
+
+    def show_task_stacks():
+        target = profile_window["target"].get()
+        try:
+            show_output(f"asyncio tasks: {target}", profiler(target).task_stacks(target))
+        except (LookupError, RuntimeError, OSError) as e:
+            print(f"⚠️ Profiler: {e}")
+
+    def show_profiler():
+        window = profile_window.get("window")
+        if window is not None and window.winfo_exists():
+            window.lift()
+            return
+        window = ttk.Toplevel(root)
+        window.title("Profiler")
+        # Attached, every component is a process of its own, so there is no "all"
+        targets = list(SCRIPTS.keys()) if supervisor_client else ["all"] + list(SCRIPTS.keys())
+        target = ttk.Combobox(window, values=targets, state="readonly", width=20)
+        target.set(targets[0])
+        target.grid(row=0, column=0, padx=5, pady=5)
+        button = ttk.Button(window, text="▶ Start", width=8, command=toggle_profile)
+        button.grid(row=0, column=1, padx=5, pady=5)
+        ttk.Button(window, text="🧵 Tasks", command=show_task_stacks).grid(row=0, column=2, padx=5, pady=5)
+        status = ttk.Label(window, text="Idle", width=45)
+        status.grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+        profile_window.update(window=window, target=target, button=button, status=status)
+        refresh_profile_status()
+
+    tools = ttk.Frame(root)
+    tools.grid(row=len(SCRIPTS) + 1, column=0, columnspan=3, pady=5)
+    ttk.Button(tools, text="🔒 Locks", command=show_lock_stats).pack(side="left", padx=5)
+    ttk.Button(tools, text="⏱️ Profile", command=show_profiler).pack(side="left", padx=5)
+
     # Redirect stdout and stderr to the output_text widget using a queue
     class StdoutRedirector:
         def __init__(self, queue):
@@ -150,13 +340,25 @@ def create_gui():
     poll_log_queue()
 
     def on_closing():
+        if supervisor_client:
+            print("🔌 Detached from the supervisor, components keep running.")
+            root.destroy()
+            return
         print("🛑 Shutting down all bots...")
         for event_ in shutdown_events.values():
             event_.set()
+        if lock_metrics.LOCK_METRICS:
+            lock_metrics.dump()
+        if profiling.status()["running"]:
+            profiling.stop()
         root.destroy()
 
     root.protocol("WM_DELETE_WINDOW", on_closing)
 
+    if supervisor_client:
+        ensure_supervisor()
+    else:
+        metrics.start_server()
     check_threads()
     root.mainloop()
 
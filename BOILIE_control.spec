@@ -6,6 +6,11 @@ from PyInstaller.utils.hooks import collect_submodules
 import os
 
 hidden = collect_submodules("ttkbootstrap")
+# Components are imported by name when started (components.load_entry), so the analysis cannot see them
+hidden += [
+    "core.tx_worker", "core.ledger_service", "backup_json",
+    "bots.tipping_bot", "bots.catch_bot", "bots.raffle_bot", "bots.info_bot", "bots.factory_bot",
+]
 
 a = Analysis(
     ['BOILIE_control.py'],
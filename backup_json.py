@@ -2,16 +2,20 @@ import os
 import time
 import zipfile
 import datetime
-import sys
-from paths import BACKUP_DIR, DEBUG_FILE, DATA_DIR
-
-# Optional: Nur loggen, wenn nicht in GUI-Umgebung
-if __name__ != "__main__":
-    sys.stdout = open(DEBUG_FILE, "a")
-    sys.stderr = sys.stdout
+from paths import BACKUP_DIR, DATA_DIR
+from core.storage import backup_database
+from core import metrics
+from components import heartbeat
 
 MAX_AGE_HOURS = 72
 BACKUP_INTERVAL_SECONDS = 3600  # 1 hour
+# The interval is waited out in steps this long, so an idle loop keeps reporting that it is alive
+IDLE_BEAT_SECONDS = 5
+
+BACKUP_SECONDS = metrics.histogram("boilies_backup_seconds", "Duration of a backup run", ("stage",))
+BACKUPS = metrics.counter("boilies_backups_total", "Backup runs by result", ("result",))
+LAST_BACKUP = metrics.gauge("boilies_backup_last_success_timestamp_seconds", "Unix time of the last successful backup")
+BACKUP_BYTES = metrics.gauge("boilies_backup_size_bytes", "Size of the last backup archive")
 
 
 def create_backup():
@@ -21,13 +25,27 @@ def create_backup():
     os.makedirs(BACKUP_DIR, exist_ok=True)
     zip_path = os.path.join(BACKUP_DIR, zip_name)
 
+    # Files are zipped straight from disk, without a lock. The log's index.json is written before
+    # its segments, so each copied segment holds at least the bytes the index lists for it.
+    started = time.perf_counter()
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         for root, _, files in os.walk(DATA_DIR):
-            for file in files:
-                if file.endswith(".json"):
+            for file in sorted(files, key=lambda name: name != "index.json"):
+                if file.endswith((".json", ".jsonl")):
                     full_path = os.path.join(root, file)
                     arcname = os.path.relpath(str(full_path), start=str(DATA_DIR))
                     zipf.write(str(full_path), str(arcname))
+                    heartbeat()
+        # The SQLite ledger is copied through the backup API so WAL contents are included consistently
+        db_copy = os.path.join(BACKUP_DIR, f"ledger_{timestamp}.db")
+        try:
+            if backup_database(db_copy):
+                zipf.write(db_copy, "ledger.db")
+        finally:
+            if os.path.exists(db_copy):
+                os.remove(db_copy)
+    BACKUP_SECONDS.observe(time.perf_counter() - started, stage="total")
+    BACKUP_BYTES.set(os.path.getsize(zip_path))
     print(f"[{timestamp}] ✅ Created backup: {zip_path}")
 
 
@@ -48,15 +66,22 @@ def cleanup_old_backups():
 
 def run_backup_loop(stop_event):
     print("🌀 Backup loop started.")
+    metrics.start_server()
     while not stop_event.is_set():
         try:
             create_backup()
             cleanup_old_backups()
+            BACKUPS.inc(result="ok")
+            LAST_BACKUP.set(time.time())
         except Exception as e:
+            BACKUPS.inc(result="error")
             print(f"❌ Backup error: {e}")
         # Stop wait: returns early if stop_event is set
-        if stop_event.wait(BACKUP_INTERVAL_SECONDS):
-            break
+        next_run = time.monotonic() + BACKUP_INTERVAL_SECONDS
+        while not stop_event.wait(max(0, min(IDLE_BEAT_SECONDS, next_run - time.monotonic()))):
+            heartbeat()
+            if time.monotonic() >= next_run:
+                break
     print("🛑 Backup loop stopped.")
 
 
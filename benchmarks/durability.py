@@ -0,0 +1,112 @@
+# durability.py
+# Compares transfer submit throughput and latency under each DURABILITY level.
+#
+#   python -m benchmarks.durability
+#   python -m benchmarks.durability --threads 1 8 32 --submits 200 --json
+#
+# Every level and thread count runs in its own process against a scratch data
+# directory. Each thread submits transfers for its own sender, so the threads
+# only contend for the group commit, not for one shard lock.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+LEVELS = ["none", "batch", "every"]
+DEFAULT_THREADS = [1, 8, 32]
+DEFAULT_SUBMITS = 100
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, len(values) * p // 100)], 3) if values else None
+
+
+def run_single(threads, submits):
+    # Imported here so BOILIES_DATA_DIR and DURABILITY are already set
+    from paths import WALLET_FILE
+    from core.storage import get_storage
+    from core.tx_utils import submit_transfer
+    from core.durability import DURABILITY, durability_stats
+
+    storage = get_storage()
+    storage.save_document(WALLET_FILE, {f"u{i}": {"name": f"user{i}", "carp_balance": 10**9, "nonce": 0} for i in range(threads)})
+    latencies = [[] for _ in range(threads)]
+    failures = []
+
+    def submitter(i):
+        for n in range(submits):
+            started = time.perf_counter()
+            result = submit_transfer(f"u{i}", f"u{(i + 1) % threads}", 1 + n % 7)
+            latencies[i].append((time.perf_counter() - started) * 1000)
+            if not result["ok"]:
+                failures.append(result["status"])
+
+    workers = [threading.Thread(target=submitter, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    flat = [ms for per_thread in latencies for ms in per_thread]
+    stats = durability_stats()
+    return {
+        "durability": DURABILITY,
+        "backend": storage.name,
+        "threads": threads,
+        "submits": len(flat),
+        "failed": len(failures),
+        "submits_per_s": round(len(flat) / elapsed, 1),
+        "p50_ms": percentile(flat, 50),
+        "p99_ms": percentile(flat, 99),
+        "fsyncs": stats["fsyncs"],
+        "groups": stats["groups"],
+    }
+
+
+def run_isolated(level, threads, submits):
+    with tempfile.TemporaryDirectory(prefix="boilies-bench-") as data_dir:
+        env = dict(os.environ, BOILIES_DATA_DIR=data_dir, BOILIES_DEBUG_FILE=os.devnull, DURABILITY=level)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.durability", "--single", str(threads), "--submits", str(submits)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transfer submits under each DURABILITY level")
+    parser.add_argument("--levels", nargs="+", default=LEVELS, choices=LEVELS)
+    parser.add_argument("--threads", type=int, nargs="+", default=DEFAULT_THREADS)
+    parser.add_argument("--submits", type=int, default=DEFAULT_SUBMITS, help="Submits per thread")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per run")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # The worker's per-tx prints go to BOILIES_DEBUG_FILE; the result goes to the original stream
+        from components import redirect_output
+        redirect_output()
+        sys.__stdout__.write(json.dumps(run_single(args.single, args.submits)) + "\n")
+        return
+
+    for threads in args.threads:
+        for level in args.levels:
+            result = run_isolated(level, threads, args.submits)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(
+                    f"{result['backend']:>6} {level:<5} {threads:>3} threads: {result['submits_per_s']:>8.1f} submits/s, "
+                    f"p50 {result['p50_ms']:>7.2f} ms, p99 {result['p99_ms']:>7.2f} ms, "
+                    f"{result['fsyncs']} fsyncs in {result['groups']} groups, {result['failed']} failed"
+                )
+
+
+if __name__ == "__main__":
+    main()
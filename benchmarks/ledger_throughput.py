@@ -0,0 +1,285 @@
+# ledger_throughput.py
+# Drives submit/settle cycles through core.tx_utils and core.tx_worker against synthetic wallets.
+#
+#   python -m benchmarks.ledger_throughput                                   # 1k, 10k, 100k wallets
+#   python -m benchmarks.ledger_throughput --wallets 10000 --mix tip=50,reward=30,buyticket=20 --threads 8
+#   python -m benchmarks.ledger_throughput --json --out results.jsonl        # append results for later runs
+#   python -m benchmarks.ledger_throughput --compare results.jsonl           # ratios against earlier results
+#
+# Every wallet count runs in its own process against a scratch data directory,
+# so the real ledger is never touched. STORAGE_BACKEND, DURABILITY and
+# DATA_FORMAT are passed through. Each result is one JSON object carrying the
+# commit it was measured on, so runs from different commits can be diffed.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_WALLETS = [1_000, 10_000, 100_000]
+DEFAULT_MIX = "tip=50,reward=25,bait=10,mint=5,buyticket=10"
+TX_TYPES = ("tip", "reward", "bait", "mint", "buyticket")
+TREASURY = "treasury"
+START_BALANCE = 1_000_000
+# Metrics --compare reports; for all of them lower is better
+COMPARED = ("submit_p50_ms", "submit_p99_ms", "settle_p50_ms", "settle_p99_ms", "pass_p50_ms", "us_per_tx", "ledger_bytes")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in TX_TYPES:
+            raise argparse.ArgumentTypeError(f"Unknown tx type in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, len(values) * p // 100)], 3) if values else None
+
+
+def build_wallets(count):
+    wallets = {f"u{i}": {"name": f"user{i}", "carp_balance": START_BALANCE, "nonce": 0} for i in range(count)}
+    wallets[TREASURY] = {"name": "Treasury", "carp_balance": START_BALANCE * count, "nonce": 0}
+    return wallets
+
+
+def build_cycle(rng, mix, wallets, size):
+    # (sender, recipient, amount, tx_type, extra fields) in submit order
+    types = rng.choices(list(mix), weights=list(mix.values()), k=size)
+    txs = []
+    for tx_type in types:
+        user = f"u{rng.randrange(wallets)}"
+        if tx_type == "tip":
+            txs.append((user, f"u{rng.randrange(wallets)}", rng.randint(1, 50), "tip", {}))
+        elif tx_type == "reward":
+            txs.append((TREASURY, user, rng.randint(1, 200), "reward", {}))
+        elif tx_type == "bait":
+            txs.append((user, TREASURY, rng.randint(1, 30), "bait", {}))
+        elif tx_type == "mint":
+            txs.append((user, None, rng.randint(1, 500), "mint", {}))
+        else:
+            count = rng.randint(1, 3)
+            txs.append((user, TREASURY, 1000 * count, "buyticket", {"raffle": "bench", "ticket_count": count}))
+    return txs
+
+
+def io_write_bytes():
+    # Bytes this process caused to be written to storage; None where /proc is not available
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def submit_all(txs, threads):
+    # Round-robin over the threads, as several bots submit at once. Returns [(tx_id, ok, status, latency_ms, done_at)]
+    from core.tx_utils import submit_transfer
+
+    results = [None] * len(txs)
+
+    def submitter(offset):
+        for i in range(offset, len(txs), threads):
+            sender, recipient, amount, tx_type, fields = txs[i]
+            started = time.perf_counter()
+            result = submit_transfer(sender, recipient, amount, tx_type=tx_type, **fields)
+            done = time.perf_counter()
+            results[i] = (result["tx_id"], result["ok"], result["status"], (done - started) * 1000, done)
+
+    workers = [threading.Thread(target=submitter, args=(t,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def run_single(args):
+    # Imported here so BOILIES_DATA_DIR is already set when paths.py loads
+    from paths import DATA_DIR, WALLET_FILE, PENDING_FILE
+    from core.storage import get_storage
+    from core.tx_worker import run_worker_pass
+    from core import durability
+
+    storage = get_storage()
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    storage.save_document(WALLET_FILE, build_wallets(args.single))
+    bytes_before = durability.durability_stats()["bytes"]
+    io_before = io_write_bytes()
+
+    submit_ms, settle_ms, pass_ms = [], [], []
+    statuses = {}
+    waiting = {}
+    totals = {"processed": 0, "rejected": 0, "held": 0}
+    submit_seconds = 0.0
+    for _ in range(args.cycles):
+        txs = build_cycle(rng, mix, args.single, args.txs_per_cycle)
+        started = time.perf_counter()
+        for tx_id, ok, status, latency, done in submit_all(txs, args.threads):
+            submit_ms.append(latency)
+            statuses[status] = statuses.get(status, 0) + 1
+            if ok:
+                waiting[tx_id] = done
+        submit_seconds += time.perf_counter() - started
+
+        pass_started = time.perf_counter()
+        stats = run_worker_pass() or {}
+        settled_at = time.perf_counter()
+        pass_ms.append((settled_at - pass_started) * 1000)
+        for key in totals:
+            totals[key] += stats.get(key, 0)
+        # Whatever left the pool was settled (or rejected) by this pass; held txs wait for the next one
+        still_pending = {tx.get("tx_id") for tx in storage.load_document(PENDING_FILE).get("txs", [])}
+        for tx_id in [tx_id for tx_id in waiting if tx_id not in still_pending]:
+            settle_ms.append((settled_at - waiting.pop(tx_id)) * 1000)
+
+    submitted = len(submit_ms)
+    io_after = io_write_bytes()
+    return {
+        "backend": storage.name,
+        "durability": durability.DURABILITY,
+        "wallets": args.single,
+        "mix": args.mix,
+        "threads": args.threads,
+        "cycles": args.cycles,
+        "txs_per_cycle": args.txs_per_cycle,
+        "seed": args.seed,
+        "submitted": submitted,
+        "statuses": statuses,
+        "submits_per_s": round(submitted / submit_seconds, 1) if submit_seconds else None,
+        "submit_p50_ms": percentile(submit_ms, 50),
+        "submit_p90_ms": percentile(submit_ms, 90),
+        "submit_p99_ms": percentile(submit_ms, 99),
+        "submit_max_ms": round(max(submit_ms), 3) if submit_ms else None,
+        "settle_p50_ms": percentile(settle_ms, 50),
+        "settle_p90_ms": percentile(settle_ms, 90),
+        "settle_p99_ms": percentile(settle_ms, 99),
+        "pass_ms": [round(ms, 2) for ms in pass_ms],
+        "pass_p50_ms": percentile(pass_ms, 50),
+        "pass_max_ms": round(max(pass_ms), 2) if pass_ms else None,
+        "us_per_tx": round(sum(pass_ms) * 1000 / max(1, totals["processed"] + totals["rejected"]), 2),
+        **totals,
+        "unsettled": len(waiting),
+        "ledger_bytes": durability.durability_stats()["bytes"] - bytes_before,
+        "io_write_bytes": io_after - io_before if io_before is not None and io_after is not None else None,
+        "data_dir_bytes": dir_bytes(DATA_DIR),
+    }
+
+
+def current_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_isolated(wallets, args):
+    with tempfile.TemporaryDirectory(prefix="boilies-bench-") as data_dir:
+        env = dict(os.environ, BOILIES_DATA_DIR=data_dir, BOILIES_DEBUG_FILE=os.devnull, LEDGER_SERVICE="0")
+        out = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.ledger_throughput", "--single", str(wallets),
+                "--mix", args.mix, "--threads", str(args.threads), "--cycles", str(args.cycles),
+                "--txs-per-cycle", str(args.txs_per_cycle), "--seed", str(args.seed),
+            ],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _config_key(result):
+    return tuple(result.get(key) for key in ("backend", "durability", "wallets", "mix", "threads", "cycles", "txs_per_cycle", "seed"))
+
+
+def load_baseline(path):
+    # Latest result per configuration
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                baseline[_config_key(result)] = result
+    return baseline
+
+
+def compare(result, baseline):
+    # {"commit": ..., metric: new / old}, None without a matching earlier result
+    before = baseline.get(_config_key(result))
+    if before is None:
+        return None
+    ratios = {"commit": before.get("commit")}
+    for key in COMPARED:
+        if before.get(key) and result.get(key) is not None:
+            ratios[key] = round(result[key] / before[key], 3)
+    return ratios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark submit/settle cycles on synthetic wallets")
+    parser.add_argument("--wallets", type=int, nargs="+", default=DEFAULT_WALLETS)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted tx types, e.g. {DEFAULT_MIX}")
+    parser.add_argument("--threads", type=int, default=4, help="Concurrent submitters")
+    parser.add_argument("--cycles", type=int, default=5, help="Submit phases, each followed by one worker pass")
+    parser.add_argument("--txs-per-cycle", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per wallet count")
+    parser.add_argument("--out", help="Append the JSON results to this file")
+    parser.add_argument("--compare", help="Print ratios against the latest matching results in this file")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    if args.single:
+        # The worker's per-tx prints go to BOILIES_DEBUG_FILE; the result goes to the original stream
+        from components import redirect_output
+        redirect_output()
+        sys.__stdout__.write(json.dumps(run_single(args)) + "\n")
+        return
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    commit = current_commit()
+    for wallets in args.wallets:
+        result = dict(run_isolated(wallets, args), commit=commit, measured_at=int(time.time()))
+        ratios = compare(result, baseline) if baseline is not None else None
+        if args.out:
+            with open(args.out, "a") as f:
+                f.write(json.dumps(result) + "\n")
+        if args.json:
+            print(json.dumps(dict(result, baseline=ratios) if baseline is not None else result))
+        else:
+            print(
+                f"{result['backend']:>6} {wallets:>7} wallets: {result['submits_per_s']:>8.1f} submits/s "
+                f"(p50 {result['submit_p50_ms']} ms, p99 {result['submit_p99_ms']} ms), "
+                f"settle p50 {result['settle_p50_ms']} ms, pass p50 {result['pass_p50_ms']} ms "
+                f"({result['us_per_tx']} µs/tx), {result['processed']} processed, {result['rejected']} rejected, "
+                f"{result['ledger_bytes'] / 1024:.0f} KiB written"
+            )
+        if baseline is not None and not args.json:
+            if ratios is None:
+                print(f"   no baseline for {wallets} wallets with this configuration")
+            else:
+                print(f"   vs {ratios['commit'] or 'baseline'}: " + ", ".join(f"{k} {v:.2f}x" for k, v in ratios.items() if k != "commit"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# nonce_chain.py
+# Checks that a rejected tx does not block its sender: submit a chain whose first tx the worker
+# rejects, settle, then submit again and settle.
+#
+#   python -m benchmarks.nonce_chain                     # json, sqlite and the ledger service
+#   python -m benchmarks.nonce_chain --modes sqlite
+#
+# Every mode runs in its own process against a scratch data directory, so the real ledger is
+# never touched. The later txs of the broken chain must be rejected in the same pass as the
+# first one, not held for NONCE_GAP_HOLD_SECONDS, and the next submit must get the wallet's
+# next nonce and settle. Exits 1 on any failure.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODES = ["json", "sqlite", "service"]
+SENDER, RECIPIENT = "u1", "u2"
+
+
+def check_next_nonce():
+    from core.storage import next_nonce
+
+    problems = []
+    for wallet_nonce, pending, expected in [(0, [], 1), (0, [1, 2], 3), (4, [5, 6, 7], 8), (0, [2, 3], 1), (4, [6], 5)]:
+        got = next_nonce(wallet_nonce, pending)
+        if got != expected:
+            problems.append(f"next_nonce({wallet_nonce}, {pending}) is {got}, expected {expected}")
+    return problems
+
+
+def run_single(mode):
+    # Imported here so BOILIES_DATA_DIR and STORAGE_BACKEND are already set when paths.py loads
+    from paths import WALLET_FILE
+    from core.storage import get_storage
+    from core.tx_utils import transfer_tx, _submit_transfer_local
+
+    storage = get_storage()
+    storage.save_document(WALLET_FILE, {
+        SENDER: {"name": "sender", "carp_balance": 100, "nonce": 0},
+        RECIPIENT: {"name": "recipient", "carp_balance": 0, "nonce": 0},
+    })
+    if mode == "service":
+        from core.ledger_service import LedgerService
+        service = LedgerService()
+        service.load()
+        submit, settle = service.submit_transfer, service.settle
+        wallet = lambda: service.wallets[SENDER]
+    else:
+        from core.tx_worker import run_worker_pass
+        submit, settle = _submit_transfer_local, run_worker_pass
+        wallet = lambda: storage.load_wallets([SENDER])[SENDER]
+
+    problems = []
+    # A buyticket without a raffle passes the submit checks, but the worker rejects it
+    first = [
+        submit(transfer_tx(SENDER, None, 10, tx_type="buyticket", ticket_count=1)),
+        submit(transfer_tx(SENDER, RECIPIENT, 10)),
+        submit(transfer_tx(SENDER, RECIPIENT, 10)),
+    ]
+    if [r["nonce"] for r in first] != [1, 2, 3]:
+        problems.append(f"first chain got nonces {[r['nonce'] for r in first]}, expected [1, 2, 3]")
+    stats = settle() or {}
+    if stats.get("rejected") != 3 or stats.get("held"):
+        problems.append(f"first pass rejected {stats.get('rejected')} and held {stats.get('held')}, expected 3 and 0")
+
+    again = submit(transfer_tx(SENDER, RECIPIENT, 10))
+    if again["nonce"] != 1:
+        problems.append(f"submit after the rejection got nonce {again['nonce']}, expected 1")
+    stats = settle() or {}
+    if stats.get("processed") != 1:
+        problems.append(f"second pass processed {stats.get('processed')}, expected 1")
+    if (wallet()["carp_balance"], wallet()["nonce"]) != (90, 1):
+        problems.append(f"sender ended with balance {wallet()['carp_balance']} and nonce {wallet()['nonce']}, expected 90 and 1")
+    return {"mode": mode, "backend": storage.name, "problems": problems}
+
+
+def run_isolated(mode):
+    with tempfile.TemporaryDirectory(prefix="boilies-bench-") as data_dir:
+        env = dict(os.environ, BOILIES_DATA_DIR=data_dir, BOILIES_DEBUG_FILE=os.devnull)
+        env["STORAGE_BACKEND"] = "sqlite" if mode == "sqlite" else "json"
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.nonce_chain", "--single", mode],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that a rejected tx does not block its sender")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--single", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # The worker's per-tx prints go to BOILIES_DEBUG_FILE; the result goes to the original stream
+        from components import redirect_output
+        redirect_output()
+        result = run_single(args.single)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        return
+
+    problems = check_next_nonce()
+    for mode in args.modes:
+        result = run_isolated(mode)
+        problems += [f"{mode}: {problem}" for problem in result["problems"]]
+        print(f"{mode:>8} ({result['backend']}): {'ok' if not result['problems'] else 'FAILED'}")
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ A rejected tx no longer blocks its sender")
+
+
+if __name__ == "__main__":
+    main()
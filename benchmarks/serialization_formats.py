@@ -0,0 +1,120 @@
+# serialization_formats.py
+# Compares load/save time and file size of the data file formats on ledger-shaped data.
+#
+#   python -m benchmarks.serialization_formats
+#   python -m benchmarks.serialization_formats --wallets 10000 100000 --json
+#
+# "json-indent" is the old json.dump(..., indent=2) layout every data file used
+# before core.serialization; the other rows are the formats DATA_FORMAT selects.
+# Formats whose package is not installed are skipped.
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from core import serialization
+
+DEFAULT_WALLETS = [1_000, 10_000, 100_000]
+ROUNDS = 5
+
+
+def build_documents(wallets, seed=1):
+    rng = random.Random(seed)
+    ids = [str(rng.randrange(10**17, 10**18)) for _ in range(wallets)]
+    wallet_store = {
+        uid: {"name": f"angler_{i}#{rng.randrange(10000):04d}", "carp_balance": rng.randrange(0, 500_000), "nonce": rng.randrange(0, 3000)}
+        for i, uid in enumerate(ids)
+    }
+    pending = {"txs": []}
+    for _ in range(max(10, wallets // 20)):
+        uid, to = rng.choice(ids), rng.choice(ids)
+        pending["txs"].append({
+            "type": rng.choice(["tip", "reward", "bait", "buyticket"]),
+            "user_id": uid,
+            "username": wallet_store[uid]["name"],
+            "to": to,
+            "to_username": wallet_store[to]["name"],
+            "amount": rng.randrange(1, 5000),
+            "nonce": wallet_store[uid]["nonce"] + 1,
+            "tx_id": "%064x" % rng.getrandbits(256),
+            "submitted_at": round(1.7e9 + rng.random() * 1e6, 3),
+        })
+    factory = {
+        uid: {
+            "factory_level": rng.randrange(1, 10),
+            "last_harvest": 1_700_000_000 + rng.randrange(10**6),
+            "upgrade_ready_time": None,
+            "workers": [{"stars": rng.randrange(1, 6), "upgrade_ready_time": None} for _ in range(rng.randrange(0, 5))],
+            "machines": [{"stars": rng.randrange(1, 6), "upgrade_ready_time": None} for _ in range(rng.randrange(0, 5))],
+        }
+        for uid in ids[: max(1, wallets // 10)]
+    }
+    return {"wallet_store": wallet_store, "pending_tx": pending, "factory_data": factory}
+
+
+class _IndentedJson:
+    name = "json-indent"
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data, indent=2).encode("utf-8")
+
+    @staticmethod
+    def loads(raw):
+        return json.loads(raw)
+
+
+def _time(func, rounds=ROUNDS):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def measure(fmt, name, data, directory):
+    path = os.path.join(directory, f"{name}.{fmt.name}")
+
+    def save():
+        with open(path, "wb") as f:
+            f.write(fmt.dumps(data))
+
+    def load():
+        with open(path, "rb") as f:
+            return serialization.loads(f.read())
+
+    save_ms = _time(save)
+    load_ms = _time(load)
+    assert load() == data, f"{fmt.name} did not round-trip {name}"
+    return {"format": fmt.name, "document": name, "bytes": os.path.getsize(path), "save_ms": round(save_ms, 2), "load_ms": round(load_ms, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare data file formats on ledger-shaped data")
+    parser.add_argument("--wallets", type=int, nargs="+", default=DEFAULT_WALLETS)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per measurement")
+    args = parser.parse_args()
+
+    formats = [_IndentedJson] + [fmt for name, fmt in serialization.FORMATS.items() if serialization.AVAILABLE[name]]
+    with tempfile.TemporaryDirectory(prefix="boilies-formats-") as directory:
+        for wallets in args.wallets:
+            for name, data in build_documents(wallets).items():
+                baseline = None
+                for fmt in formats:
+                    result = dict(measure(fmt, name, data, directory), wallets=wallets)
+                    baseline = baseline or result
+                    result["size_ratio"] = round(result["bytes"] / baseline["bytes"], 3)
+                    if args.json:
+                        print(json.dumps(result))
+                    else:
+                        print(
+                            f"{wallets:>7} {name:<13} {result['format']:<11} {result['bytes'] / 1024:>10.1f} KiB "
+                            f"({result['size_ratio']:>5.2f}x)  save {result['save_ms']:>8.2f} ms  load {result['load_ms']:>8.2f} ms"
+                        )
+
+
+if __name__ == "__main__":
+    main()
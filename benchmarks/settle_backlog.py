@@ -0,0 +1,119 @@
+# settle_backlog.py
+# Times one TX worker pass over a large pending backlog, e.g. after downtime.
+#
+#   python -m benchmarks.settle_backlog                      # 10k, 25k, 50k, 100k
+#   python -m benchmarks.settle_backlog --sizes 10000 100000 --check
+#   STORAGE_BACKEND=sqlite python -m benchmarks.settle_backlog --json
+#
+# Every size runs in its own process against a scratch data directory, so the
+# real ledger is never touched. --check fails when the per-tx cost at the
+# largest size is more than MAX_SCALING_RATIO times the cost at the smallest.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [10_000, 25_000, 50_000, 100_000]
+TXS_PER_USER = 50
+MAX_SCALING_RATIO = 2.0
+
+
+def build_backlog(size, seed=1):
+    rng = random.Random(seed)
+    users = max(1, size // TXS_PER_USER)
+    wallets = {f"u{i}": {"name": f"user{i}", "carp_balance": 1_000, "nonce": 0} for i in range(users)}
+    txs = []
+    for i in range(size):
+        uid = f"u{i % users}"
+        to = f"u{rng.randrange(users)}"
+        txs.append({
+            "type": "tip",
+            "user_id": uid,
+            "username": wallets[uid]["name"],
+            "to": to,
+            "to_username": wallets[to]["name"],
+            "amount": rng.randint(1, 40),
+            "nonce": i // users + 1,
+        })
+    # Submissions from several bots interleave, so nonces do not arrive in order
+    rng.shuffle(txs)
+    return wallets, txs
+
+
+def run_single(size):
+    # Imported here so BOILIES_DATA_DIR is already set when paths.py loads
+    from paths import WALLET_FILE, PENDING_FILE
+    from core.storage import get_storage
+    from core.tx_worker import run_worker_pass
+
+    storage = get_storage()
+    wallets, txs = build_backlog(size)
+    storage.save_document(WALLET_FILE, wallets)
+    storage.save_document(PENDING_FILE, {"txs": txs})
+
+    started = time.perf_counter()
+    stats = run_worker_pass()
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": storage.name,
+        "size": size,
+        "pass_ms": round(elapsed * 1000, 2),
+        "us_per_tx": round(elapsed * 1e6 / size, 2),
+        **(stats or {}),
+    }
+
+
+def run_isolated(size):
+    with tempfile.TemporaryDirectory(prefix="boilies-bench-") as data_dir:
+        env = dict(os.environ, BOILIES_DATA_DIR=data_dir, BOILIES_DEBUG_FILE=os.devnull)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.settle_backlog", "--single", str(size)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a TX worker pass over a pending backlog")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per size")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero if scaling is not roughly linear")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # The worker's per-tx prints go to BOILIES_DEBUG_FILE; the result goes to the original stream
+        from components import redirect_output
+        redirect_output()
+        result = run_single(args.single)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        return
+
+    results = []
+    for size in sorted(args.sizes):
+        result = run_isolated(size)
+        results.append(result)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{result['backend']:>6} {size:>7} txs: pass {result['pass_ms']:>9.1f} ms, "
+                f"{result['us_per_tx']:>6.1f} µs/tx (stage {result.get('stage_ms', 0)} ms, "
+                f"commit {result.get('commit_ms', 0)} ms, {result.get('processed', 0)} processed, "
+                f"{result.get('rejected', 0)} rejected, {result.get('held', 0)} held)"
+            )
+
+    if args.check and len(results) > 1:
+        ratio = results[-1]["us_per_tx"] / results[0]["us_per_tx"]
+        print(f"Per-tx cost ratio {results[-1]['size']} vs {results[0]['size']}: {ratio:.2f}")
+        if ratio > MAX_SCALING_RATIO:
+            print(f"❌ Worker pass no longer scales linearly (ratio above {MAX_SCALING_RATIO}).")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# startup.py
+# Cold import time of the entry points and of every component, each in a fresh interpreter.
+#
+#   python -m benchmarks.startup                  # table of import times and heavy modules pulled in
+#   python -m benchmarks.startup --check          # fail when an entry point is over budget
+#   python -m benchmarks.startup --budget daemon=120 --repeat 5 --json
+#
+# Import time is what `python -X importtime -c "import <module>"` reports for the module itself,
+# the best of --repeat runs. --check fails when a module is over its budget in ms, or when a
+# module that must start without them (the daemon, the supervisor, the worker, the ledger service,
+# the backups) pulls in discord.py, tkinter, ttkbootstrap or numpy.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from components import COMPONENTS, entry_module
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("discord", "tkinter", "ttkbootstrap", "numpy")
+# Budgets in ms; generous enough for a small VPS, far below what discord.py alone costs
+DEFAULT_BUDGETS = {"daemon": 150, "supervisor": 150, "components": 50}
+# Modules that must never load a heavy module
+LIGHT_MODULES = ("daemon", "supervisor", "components", "core.tx_worker", "core.ledger_service", "backup_json")
+ENTRY_POINTS = ("components", "daemon", "supervisor", "BOILIE_control")
+
+
+def parse_budget(text):
+    module, _, ms = text.partition("=")
+    try:
+        return module.strip(), float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected module=ms, got {text}")
+
+
+def measure(module, data_dir):
+    # (import ms, heavy modules loaded) of one fresh interpreter
+    code = (
+        f"import {module}, sys\n"
+        f"sys.__stdout__.write(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules) + '\\n')\n"
+    )
+    env = dict(os.environ, BOILIES_DATA_DIR=data_dir, BOILIES_DEBUG_FILE=os.devnull, PYTHONDONTWRITEBYTECODE="1")
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    ms = None
+    for line in out.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and line.rsplit("|", 1)[-1].strip() == module:
+            ms = int(line.split("|")[1]) / 1000
+    heavy = out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ""
+    return ms, [m for m in heavy.split(",") if m]
+
+
+def run(modules, repeat):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="boilies-bench-") as data_dir:
+        for module in modules:
+            try:
+                runs = [measure(module, data_dir) for _ in range(repeat)]
+            except subprocess.CalledProcessError as e:
+                # e.g. tkinter or a bot dependency missing on a headless box
+                error = (e.stderr.strip().splitlines() or ["import failed"])[-1]
+                results.append({"module": module, "import_ms": None, "heavy": [], "error": error})
+                continue
+            results.append({"module": module, "import_ms": min(ms for ms, _ in runs), "heavy": runs[0][1], "error": None})
+    return results
+
+
+def violations(results, budgets):
+    problems = []
+    for r in results:
+        budget = budgets.get(r["module"])
+        if r["error"] and (budget is not None or r["module"] in LIGHT_MODULES):
+            problems.append(f"{r['module']} failed to import: {r['error']}")
+        if budget is not None and r["import_ms"] is not None and r["import_ms"] > budget:
+            problems.append(f"{r['module']} imports in {r['import_ms']:.0f} ms, budget {budget:.0f} ms")
+        if r["module"] in LIGHT_MODULES and r["heavy"]:
+            problems.append(f"{r['module']} pulls in {', '.join(r['heavy'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of entry points and components")
+    parser.add_argument("--modules", nargs="+", help="Modules to measure (default: entry points and every component)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module; the fastest counts")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[], help="module=ms, on top of the defaults")
+    parser.add_argument("--check", action="store_true", help="Exit 1 when a budget or a light module is violated")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per module")
+    args = parser.parse_args()
+
+    modules = args.modules or list(ENTRY_POINTS) + list(dict.fromkeys(entry_module(name) for name in COMPONENTS))
+    budgets = dict(DEFAULT_BUDGETS, **dict(args.budget))
+    results = run(modules, max(1, args.repeat))
+    for r in results:
+        if args.json:
+            print(json.dumps(dict(r, budget_ms=budgets.get(r["module"]))))
+        elif r["error"]:
+            print(f"{r['module']:<22} {'-':>8}    {r['error']}")
+        else:
+            budget = f"(budget {budgets[r['module']]:.0f} ms)" if r["module"] in budgets else ""
+            heavy = f"loads {', '.join(r['heavy'])}" if r["heavy"] else ""
+            print(f"{r['module']:<22} {r['import_ms']:>6.0f} ms {budget:<18} {heavy}")
+
+    if args.check:
+        problems = violations(results, budgets)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ Start-up within budget")
+
+
+if __name__ == "__main__":
+    main()
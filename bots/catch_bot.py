@@ -4,21 +4,14 @@ import discord
 from dotenv import load_dotenv
 import random
 import asyncio
-import json
 import os
-import sys
 from discord.ext import tasks, commands
 from paths import LEADERBOARD_FILE, FISH_IMAGES_DIR
-from core.tx_utils import (
-    safe_append_tx,
-    get_nonce,
-    get_effective_balance
-)
+from core.tx_utils import asubmit_transfer
+from core import serialization, metrics
 
-from paths import DEBUG_FILE
-
-sys.stdout = open(DEBUG_FILE, "a")
-sys.stderr = sys.stdout
+FISH_SPAWNS = metrics.counter("boilies_fish_spawns_total", "Fish spawned, per channel", ("channel",))
+FISH_CATCHES = metrics.counter("boilies_fish_catches_total", "Fish caught, per channel", ("channel",))
 
 
 class CatchBot:
@@ -57,11 +50,7 @@ class CatchBot:
         self.types, self.ranges, self.weights = zip(*self.fish_pool)
         self.range_dict = dict(zip(self.types, self.ranges))
 
-        if os.path.exists(LEADERBOARD_FILE):
-            with open(LEADERBOARD_FILE) as f:
-                self.leaderboard = json.load(f)
-        else:
-            self.leaderboard = {}
+        self.leaderboard = serialization.read_file(LEADERBOARD_FILE, {})
 
         self.last_catch_time = {}  # Cooldown tracking
         self.BASE_CATCH_COOLDOWN = 30 * 60
@@ -195,22 +184,14 @@ class CatchBot:
             self.claimed = True
             self.caught_by = str(interaction.user.id)
             self.caught_by_name = str(interaction.user.display_name)
-            effective = get_effective_balance(self.botref.CATCHBOT_ID)
-            if effective < self.reward:
+            result = await asubmit_transfer(
+                self.botref.CATCHBOT_ID, self.caught_by, self.reward,
+                sender_name="Catch Bot", recipient_name=str(interaction.user), tx_type="reward"
+            )
+            if result["status"] == "insufficient_balance":
                 await interaction.response.send_message("❌ Insufficient BOILIES.", ephemeral=True)
                 return
-
-            nonce = get_nonce(self.botref.CATCHBOT_ID)
-            tx = {
-                "type": "reward",
-                "user_id": self.botref.CATCHBOT_ID,
-                "username": "Catch Bot",
-                "to": self.caught_by,
-                "to_username": str(interaction.user),
-                "amount": self.reward,
-                "nonce": nonce
-            }
-            if not safe_append_tx(tx):
+            if not result["ok"]:
                 await interaction.response.send_message("⚠️ Reward transaction already in mempool.", ephemeral=True)
                 return
 
@@ -219,9 +200,9 @@ class CatchBot:
             if channel_id_str not in self.botref.leaderboard:
                 self.botref.leaderboard[channel_id_str] = {}
             self.botref.leaderboard[channel_id_str][name] = self.botref.leaderboard[channel_id_str].get(name, 0) + self.reward
-            with open(LEADERBOARD_FILE, "w") as f:
-                json.dump(self.botref.leaderboard, f, indent=2)
+            serialization.write_file(LEADERBOARD_FILE, self.botref.leaderboard)
             self.botref.last_catch_time[self.channel_id][user_id] = now
+            FISH_CATCHES.inc(channel=self.channel_id)
             if interaction.response.is_done():
                 await interaction.followup.send(f"🐟 You caught a **{self.fish_type}** weighing **{self.weight} lbs** and earned **{self.reward} BOILIES**!", ephemeral=True)
             else:
@@ -275,6 +256,7 @@ class CatchBot:
             try:
                 self.last_fish_message[channel_id] = await channel.send(message_text, file=file, view=view)
                 self.last_fish_view[channel_id] = view
+                FISH_SPAWNS.inc(channel=channel_id)
 
                 async def delete_later(message):
                     await asyncio.sleep(86400)
@@ -339,21 +321,13 @@ class CatchBot:
         if not self.treasury:
             await ctx.send("⚠️ Treasury not yet initialized.")
             return
-        effective = get_effective_balance(user)
-        if effective < price:
+        result = await asubmit_transfer(
+            user, self.treasury, price, sender_name=str(ctx.author), recipient_name="Catch Bot", tx_type="bait"
+        )
+        if result["status"] == "insufficient_balance":
             await ctx.send("❌ You do not have enough BOILIES.")
             return
-        nonce_user = get_nonce(user)
-        tx = {
-            "type": "bait",
-            "user_id": user,
-            "username": str(ctx.author),
-            "to": self.treasury,
-            "to_username": "Catch Bot",
-            "amount": price,
-            "nonce": nonce_user
-        }
-        if not safe_append_tx(tx):
+        if not result["ok"]:
             await ctx.send("⚠️ Bait transaction already in mempool for your account.")
             return
         self.bait_boost[channel_id] = (
@@ -397,6 +371,7 @@ class CatchBot:
     def run(self, stop_event=None):
         async def start_bot():
             try:
+                metrics.watch_discord(self.bot, "catch")
                 await self.bot.start(os.getenv("DISCORD_TOKEN_CATCH"))
             except asyncio.CancelledError:
                 pass
@@ -428,3 +403,7 @@ class CatchBot:
 # Factory for use elsewhere
 def create_catch_bot():
     return CatchBot()
+
+
+def run_bot(stop_event=None):
+    create_catch_bot().run(stop_event=stop_event)
@@ -2,9 +2,9 @@
 import discord
 from discord.ext import commands
 from discord.ui import View, Button
-import json
 import os
-from core.tx_utils import safe_append_tx, get_nonce, get_effective_balance
+from core.tx_utils import asubmit_transfer, aget_effective_balance, get_effective_balance
+from core import serialization, metrics
 from dotenv import load_dotenv
 from paths import FACTORY_FILE
 import math
@@ -57,19 +57,16 @@ class FactoryView(View):
                 await interaction.response.send_message("⏳ No boilies ready to roll yet. Please wait!", ephemeral=True)
                 return
 
-            tx = {
-                "type": "tip",
-                "user_id": str(view.factory_bot.FACTORYBOT_ID),
-                "username": "Factory Bot",
-                "to": str(view.user_id),
-                "to_username": str(interaction.user),
-                "amount": rolled,
-                "reason": "factory roll",
-                "nonce": get_nonce(view.factory_bot.FACTORYBOT_ID)
-            }
-
-            success = safe_append_tx(tx)
-            if not success:
+            result = await asubmit_transfer(
+                str(view.factory_bot.FACTORYBOT_ID), str(view.user_id), rolled,
+                sender_name="Factory Bot", recipient_name=str(interaction.user), reason="factory roll"
+            )
+            if result["status"] == "insufficient_balance":
+                await interaction.response.send_message(
+                    "❌ The factory treasury cannot cover this roll right now.", ephemeral=True
+                )
+                return
+            if not result["ok"]:
                 await interaction.response.send_message(
                     "❌ Failed to record transaction (possible duplicate).", ephemeral=True
                 )
@@ -112,23 +109,15 @@ class FactoryView(View):
                     ephemeral=True
                 )
                 return
-            # Check balance
-            balance = get_effective_balance(str(view.user_id))
-            if balance < WORKER_COST:
+            # Check balance and queue the payment
+            result = await asubmit_transfer(
+                str(view.user_id), str(view.factory_bot.FACTORYBOT_ID), WORKER_COST,
+                sender_name=str(interaction.user), recipient_name="Factory Bot", reason="buy worker"
+            )
+            if result["status"] == "insufficient_balance":
                 await interaction.response.send_message("❌ Not enough BOILIES to buy a worker.", ephemeral=True)
                 return
-            tx = {
-                "type": "tip",
-                "user_id": str(view.user_id),
-                "username": str(interaction.user),
-                "to": str(view.factory_bot.FACTORYBOT_ID),
-                "to_username": "Factory Bot",
-                "amount": WORKER_COST,
-                "reason": "buy worker",
-                "nonce": get_nonce(str(view.user_id))
-            }
-            success = safe_append_tx(tx)
-            if not success:
+            if not result["ok"]:
                 await interaction.response.send_message("❌ Still processing the previous action. Please try again.", ephemeral=True)
                 return
             # Add new worker
@@ -153,23 +142,15 @@ class FactoryView(View):
                     ephemeral=True
                 )
                 return
-            # Check balance
-            balance = get_effective_balance(str(view.user_id))
-            if balance < MACHINE_COST:
+            # Check balance and queue the payment
+            result = await asubmit_transfer(
+                str(view.user_id), str(view.factory_bot.FACTORYBOT_ID), MACHINE_COST,
+                sender_name=str(interaction.user), recipient_name="Factory Bot", reason="buy machine"
+            )
+            if result["status"] == "insufficient_balance":
                 await interaction.response.send_message("❌ Not enough BOILIES to buy a machine.", ephemeral=True)
                 return
-            tx = {
-                "type": "tip",
-                "user_id": str(view.user_id),
-                "username": str(interaction.user),
-                "to": str(view.factory_bot.FACTORYBOT_ID),
-                "to_username": "Factory Bot",
-                "amount": MACHINE_COST,
-                "reason": "buy machine",
-                "nonce": get_nonce(str(view.user_id))
-            }
-            success = safe_append_tx(tx)
-            if not success:
+            if not result["ok"]:
                 await interaction.response.send_message("❌ Still processing the previous action. Please try again.", ephemeral=True)
                 return
             # Add new machine
@@ -186,7 +167,8 @@ class FactoryView(View):
                 await interaction.response.send_message("This is not your factory!", ephemeral=True)
                 return
             # Show worker selection view for upgrade
-            upgrade_view = SelectWorkerView(view.user_id, view.factory_bot)
+            balance = await aget_effective_balance(str(view.user_id))
+            upgrade_view = SelectWorkerView(view.user_id, view.factory_bot, balance=balance)
             await interaction.response.send_message(
                 "Select a worker to upgrade:",
                 view=upgrade_view,
@@ -202,7 +184,8 @@ class FactoryView(View):
                 await interaction.response.send_message("This is not your factory!", ephemeral=True)
                 return
             # Show machine selection view for upgrade
-            upgrade_view = SelectMachineView(view.user_id, view.factory_bot)
+            balance = await aget_effective_balance(str(view.user_id))
+            upgrade_view = SelectMachineView(view.user_id, view.factory_bot, balance=balance)
             await interaction.response.send_message(
                 "Select a machine to upgrade:",
                 view=upgrade_view,
@@ -268,23 +251,14 @@ class FactoryView(View):
                     await interaction.response.send_message("🏗️ Your factory is already max level!", ephemeral=True)
                     return
 
-                balance = get_effective_balance(str(view.user_id))
-                if balance < self.upgrade_cost:
+                result = await asubmit_transfer(
+                    str(view.user_id), str(view.factory_bot.FACTORYBOT_ID), self.upgrade_cost,
+                    sender_name=str(interaction.user), recipient_name="Factory Bot", reason="upgrade factory"
+                )
+                if result["status"] == "insufficient_balance":
                     await interaction.response.send_message("❌ Not enough BOILIES to upgrade your factory.", ephemeral=True)
                     return
-
-                tx = {
-                    "type": "tip",
-                    "user_id": str(view.user_id),
-                    "username": str(interaction.user),
-                    "to": str(view.factory_bot.FACTORYBOT_ID),
-                    "to_username": "Factory Bot",
-                    "amount": self.upgrade_cost,
-                    "reason": "upgrade factory",
-                    "nonce": get_nonce(str(view.user_id))
-                }
-                success = safe_append_tx(tx)
-                if not success:
+                if not result["ok"]:
                     await interaction.response.send_message("❌ Still processing the previous action. Please try again.", ephemeral=True)
                     return
 
@@ -309,13 +283,13 @@ class FactoryView(View):
 
 
 class SelectWorkerView(discord.ui.View):
-    def __init__(self, user_id, factory_bot):
+    def __init__(self, user_id, factory_bot, balance=None):
         super().__init__(timeout=60)
         self.user_id = int(user_id)
         self.factory_bot = factory_bot
         self.factory_bot.data = self.factory_bot.load_data()
         self.factory = factory_bot.get_user_factory(self.user_id)
-        self.balance = get_effective_balance(str(self.user_id))
+        self.balance = balance if balance is not None else get_effective_balance(str(self.user_id))
 
         for idx, worker in enumerate(self.factory.get("workers", [])):
             stars = worker.get("stars", 0)
@@ -386,23 +360,14 @@ class SelectWorkerButton(discord.ui.Button):
                 return
 
             cost = int(WORKER_COST * (2 ** current_stars))
-            balance = get_effective_balance(str(view.user_id))
-            if balance < cost:
+            result = await asubmit_transfer(
+                str(view.user_id), str(view.factory_bot.FACTORYBOT_ID), cost,
+                sender_name=str(interaction.user), recipient_name="Factory Bot", reason="upgrade worker"
+            )
+            if result["status"] == "insufficient_balance":
                 await interaction.response.send_message("❌ Not enough BOILIES to upgrade this worker.", ephemeral=True)
                 return
-
-            tx = {
-                "type": "tip",
-                "user_id": str(view.user_id),
-                "username": str(interaction.user),
-                "to": str(view.factory_bot.FACTORYBOT_ID),
-                "to_username": "Factory Bot",
-                "amount": cost,
-                "reason": "upgrade worker",
-                "nonce": get_nonce(str(view.user_id))
-            }
-            success = safe_append_tx(tx)
-            if not success:
+            if not result["ok"]:
                 await interaction.response.send_message("❌ Still processing the previous action. Please try again.", ephemeral=True)
                 return
 
@@ -429,13 +394,13 @@ class SelectWorkerButton(discord.ui.Button):
 
 
 class SelectMachineView(discord.ui.View):
-    def __init__(self, user_id, factory_bot):
+    def __init__(self, user_id, factory_bot, balance=None):
         super().__init__(timeout=60)
         self.user_id = int(user_id)
         self.factory_bot = factory_bot
         self.factory_bot.data = self.factory_bot.load_data()
         self.factory = factory_bot.get_user_factory(self.user_id)
-        self.balance = get_effective_balance(str(self.user_id))
+        self.balance = balance if balance is not None else get_effective_balance(str(self.user_id))
         self.factory_level = self.factory.get("factory_level", 1)
         for idx, machine in enumerate(self.factory.get("machines", [])):
             stars = machine.get("stars", 0)
@@ -504,24 +469,14 @@ class SelectMachineButton(discord.ui.Button):
             return
 
         cost = int(MACHINE_COST * (2 ** current_stars))
-        balance = get_effective_balance(str(view.user_id))
-        if balance < cost:
+        result = await asubmit_transfer(
+            str(view.user_id), str(view.factory_bot.FACTORYBOT_ID), cost,
+            sender_name=str(interaction.user), recipient_name="Factory Bot", reason="upgrade machine"
+        )
+        if result["status"] == "insufficient_balance":
             await interaction.response.send_message("❌ Not enough BOILIES to upgrade this machine.", ephemeral=True)
             return
-
-        tx = {
-            "type": "tip",
-            "user_id": str(view.user_id),
-            "username": str(interaction.user),
-            "to": str(view.factory_bot.FACTORYBOT_ID),
-            "to_username": "Factory Bot",
-            "amount": cost,
-            "reason": "upgrade machine",
-            "nonce": get_nonce(str(view.user_id))
-        }
-
-        success = safe_append_tx(tx)
-        if not success:
+        if not result["ok"]:
             await interaction.response.send_message("❌ Failed to record transaction.", ephemeral=True)
             return
 
@@ -553,14 +508,10 @@ class FactoryBot:
         self._stop_event = None
 
     def load_data(self):
-        if not os.path.exists(self.DATA_FILE):
-            return {}
-        with open(self.DATA_FILE, "r") as f:
-            return json.load(f)
+        return serialization.read_file(self.DATA_FILE, {})
 
     def save_data(self):
-        with open(self.DATA_FILE, "w") as f:
-            json.dump(self.data, f, indent=2)
+        serialization.write_file(self.DATA_FILE, self.data)
 
     def get_rollable_boilies(self, factory, now, prod_rate, interval):
         elapsed = int((now - factory["last_harvest"]) // interval)
@@ -628,22 +579,14 @@ class FactoryBot:
                         self.factory_bot = factory_bot
 
                     async def callback(self, interaction: discord.Interaction):
-                        from core.tx_utils import get_effective_balance, get_nonce, safe_append_tx
-                        effective = get_effective_balance(str(interaction.user.id))
-                        if effective < 10_000:
+                        result = await asubmit_transfer(
+                            str(interaction.user.id), self.factory_bot.FACTORYBOT_ID, 10_000,
+                            sender_name=str(interaction.user), recipient_name="Factory System", reason="Initial Factory Build"
+                        )
+                        if result["status"] == "insufficient_balance":
                             await interaction.response.send_message("❌ Not enough BOILIES to build a factory.", ephemeral=True)
                             return
-                        tx = {
-                            "type": "tip",
-                            "user_id": str(interaction.user.id),
-                            "username": str(interaction.user),
-                            "to": self.factory_bot.FACTORYBOT_ID,
-                            "to_username": "Factory System",
-                            "amount": 10_000,
-                            "reason": "Initial Factory Build",
-                            "nonce": get_nonce(str(interaction.user.id))
-                        }
-                        if not safe_append_tx(tx):
+                        if not result["ok"]:
                             await interaction.response.send_message("⚠️ Transaction already pending. Please wait.", ephemeral=True)
                             return
                         new_factory = {
@@ -805,6 +748,7 @@ def run_bot(stop_event=None):
 
     BotClass = create_factory_bot()
     bot = BotClass
+    metrics.watch_discord(bot.bot, "factory")
 
     @bot.bot.event
     async def on_ready():
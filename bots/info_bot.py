@@ -2,14 +2,10 @@
 
 import discord
 import os
-import sys
 from dotenv import load_dotenv
-import json
 from datetime import datetime
-from paths import WALLET_FILE, DEBUG_FILE
-
-sys.stdout = open(DEBUG_FILE, "a")
-sys.stderr = sys.stdout
+from core.tx_utils import aload_wallet_snapshot
+from core import metrics
 
 
 def run_bot(shutdown_event=None):
@@ -20,6 +16,7 @@ def run_bot(shutdown_event=None):
 
     intents = discord.Intents.default()
     client = discord.Client(intents=intents)
+    metrics.watch_discord(client, "info")
     message_ref = None
 
     async def update_loop():
@@ -35,8 +32,7 @@ def run_bot(shutdown_event=None):
 
         while not shutdown_event.is_set():
             try:
-                with open(WALLET_FILE) as f:
-                    wallet_data = json.load(f)
+                wallet_data = await aload_wallet_snapshot()
 
                 sorted_users = sorted(wallet_data.items(), key=lambda x: x[1].get("carp_balance", 0), reverse=True)
 
@@ -91,5 +87,7 @@ def run_bot(shutdown_event=None):
 
 if __name__ == "__main__":
     import threading
+    from components import redirect_output
+    redirect_output()
     shutdown_event = threading.Event()
     run_bot(shutdown_event)
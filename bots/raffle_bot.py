@@ -6,20 +6,11 @@ import asyncio
 from dotenv import load_dotenv
 from datetime import datetime
 import random
-import sys
 from paths import RAFFLES_FILE, TICKETS_FILE, WINNERS_FILE, ASSETS_DIR
 
-from paths import DEBUG_FILE
 
-sys.stdout = open(DEBUG_FILE, "a")
-sys.stderr = sys.stdout
-
-
-from core.tx_utils import (
-    safe_append_tx,
-    get_nonce,
-    get_effective_balance
-)
+from core.tx_utils import asubmit_transfer
+from core import serialization, metrics
 
 load_dotenv()
 
@@ -156,24 +147,13 @@ class RaffleBot(discord.Client):
                 return
 
             total = 1000 * count
-            effective = get_effective_balance(user_id)
-
-            if effective < total:
+            result = await asubmit_transfer(
+                user_id, treasury, total, sender_name=str(interaction.user), recipient_name="Fishing Bot"
+            )
+            if result["status"] == "insufficient_balance":
                 await interaction.response.send_message("❌ Not enough BOILIES.", ephemeral=True)
                 return
-
-            nonce = get_nonce(user_id)
-            tx = {
-                "type": "tip",
-                "user_id": user_id,
-                "username": str(interaction.user),
-                "to": treasury,
-                "to_username": "Fishing Bot",
-                "amount": total,
-                "nonce": nonce
-            }
-            success = safe_append_tx(tx)
-            if not success:
+            if not result["ok"]:
                 await interaction.response.send_message("⚠️ Transaction already in mempool. Please wait.", ephemeral=True)
                 return
             try:
@@ -416,42 +396,23 @@ for path, default in [
     (WINNERS_FILE, [])
 ]:
     if not os.path.exists(path):
-        with open(path, "w") as f:
-            json.dump(default, f)
-
-if os.path.exists(RAFFLES_FILE):
-    with open(RAFFLES_FILE) as f:
-        raffles = json.load(f)
-else:
-    raffles = {}
-
-if os.path.exists(TICKETS_FILE):
-    with open(TICKETS_FILE) as f:
-        tickets = json.load(f)
-else:
-    tickets = {}
+        serialization.write_file(path, default)
 
-if os.path.exists(WINNERS_FILE):
-    with open(WINNERS_FILE) as f:
-        winners = json.load(f)
-else:
-    winners = []
+raffles = serialization.read_file(RAFFLES_FILE, {})
+tickets = serialization.read_file(TICKETS_FILE, {})
+winners = serialization.read_file(WINNERS_FILE, [])
 
 
 def save():
-    with open(RAFFLES_FILE, "w") as f:
-        json.dump(raffles, f, indent=2)
-    with open(TICKETS_FILE, "w") as f:
-        json.dump(tickets, f, indent=2)
-    with open(WINNERS_FILE, "w") as f:
-        json.dump(winners, f, indent=2)
+    serialization.write_file(RAFFLES_FILE, raffles)
+    serialization.write_file(TICKETS_FILE, tickets)
+    serialization.write_file(WINNERS_FILE, winners)
 
 
 # Save only the winners list to WINNERS_FILE
 def save_winners():
     try:
-        with open(WINNERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(winners, f, indent=2)
+        serialization.write_file(WINNERS_FILE, winners)
     except Exception as e:
         print(f"❌ Failed to save winners.json: {e}")
 
@@ -469,6 +430,7 @@ def run_bot(stop_event=None):
     import asyncio
     BotClass = build_bot()
     bot = BotClass
+    metrics.watch_discord(bot, "raffle")
 
     async def runner():
         async def shutdown_watcher():
@@ -497,4 +459,6 @@ def run_bot(stop_event=None):
 
 
 if __name__ == "__main__":
+    from components import redirect_output
+    redirect_output()
     run_bot()
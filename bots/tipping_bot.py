@@ -2,23 +2,37 @@
 
 import discord
 import os
-import sys
 from discord import app_commands
 from dotenv import load_dotenv
-from paths import DEBUG_FILE
 
 from core.tx_utils import (
-    safe_append_tx,
-    get_nonce,
-    get_or_create_wallet,
-    get_effective_balance
+    asubmit_transfer,
+    asubmit_multitip,
+    aget_or_create_wallet,
+    aget_user_history
 )
+from core.storage import MULTITIP_MAX_OUTPUTS
+from core import metrics
 
 load_dotenv()
 ADMIN_IDS = os.getenv("ADMIN_IDS", "").split(",")
-
-sys.stdout = open(DEBUG_FILE, "a")
-sys.stderr = sys.stdout
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+
+def format_history_entry(entry, user_id):
+    when = f"<t:{entry['logged_at']}:d>" if entry.get("logged_at") else "—"
+    amount = entry.get("amount", 0)
+    label = entry.get("type", "tx")
+    if label == "mint":
+        return f"{when} 🪙 +{amount} minted"
+    if label == "multitip":
+        if entry.get("user_id") == user_id:
+            return f"{when} 📤 -{amount} multitip to {len(entry.get('outputs', []))} users"
+        received = sum(out.get("amount", 0) for out in entry.get("outputs", []) if out.get("to") == user_id)
+        return f"{when} 📥 +{received} multitip from {entry.get('username') or entry.get('user_id')}"
+    if entry.get("user_id") == user_id and entry.get("to") != user_id:
+        return f"{when} 📤 -{amount} {label} to {entry.get('to_username') or entry.get('to')}"
+    return f"{when} 📥 +{amount} {label} from {entry.get('username') or entry.get('user_id')}"
 
 class BoilieBot(discord.Client):
     def __init__(self, shutdown_event):
@@ -38,6 +52,7 @@ class BoilieBot(discord.Client):
                 "• `/tip @user amount` – Send BOILIE to another user.\n"
                 "• `/multitip users amounts` – Send BOILIE to multiple users at once.\n"
                 "• `/balance` – Show your current BOILIE balance.\n"
+                "• `/history [page]` – Show your settled transactions, newest first.\n"
                 "• `/help` – Display this help message.\n"
             )
             await interaction.response.send_message(help_text, ephemeral=True)
@@ -45,21 +60,17 @@ class BoilieBot(discord.Client):
         @self.tree.command(name="tip", description="Send BOILIES to another user")
         @app_commands.describe(user="Recipient Discord user", amount="Amount of BOILIES to send")
         async def tip(interaction: discord.Interaction, user: discord.User, amount: int):
-            effective = get_effective_balance(str(interaction.user.id))
-            if effective < amount:
+            if amount <= 0:
+                await interaction.response.send_message("❌ Amount must be positive.", ephemeral=True)
+                return
+            result = await asubmit_transfer(
+                str(interaction.user.id), str(user.id), amount,
+                sender_name=str(interaction.user), recipient_name=str(user)
+            )
+            if result["status"] == "insufficient_balance":
                 await interaction.response.send_message("❌ Insufficient BOILIES.", ephemeral=True)
                 return
-            nonce = get_nonce(str(interaction.user.id))
-            tx = {
-                "type": "tip",
-                "user_id": str(interaction.user.id),
-                "username": str(interaction.user),
-                "to": str(user.id),
-                "to_username": str(user),
-                "amount": amount,
-                "nonce": nonce
-            }
-            if not safe_append_tx(tx):
+            if not result["ok"]:
                 await interaction.response.send_message("⚠️ Transaction already in mempool. Please wait.", ephemeral=True)
                 return
             await interaction.response.send_message(f"✅ Tip of {amount} BOILIES queued for {user.display_name}.", ephemeral=True)
@@ -71,7 +82,6 @@ class BoilieBot(discord.Client):
         @self.tree.command(name="multitip", description="Send BOILIES to multiple users")
         @app_commands.describe(users="Space-separated list of @users", amounts="Corresponding BOILIES amounts")
         async def multitip(interaction: discord.Interaction, users: str, amounts: str):
-            effective = get_effective_balance(str(interaction.user.id))
             user_list = users.split()
             amount_list = list(map(int, amounts.split()))
             if any(a <= 0 for a in amount_list):
@@ -80,57 +90,59 @@ class BoilieBot(discord.Client):
             if len(user_list) != len(amount_list):
                 await interaction.response.send_message("❌ Mismatched number of users and amounts.", ephemeral=True)
                 return
-            total = sum(amount_list)
-            if effective < total:
-                await interaction.response.send_message(f"❌ You need {total} BOILIES.", ephemeral=True)
+            if not user_list or len(user_list) > MULTITIP_MAX_OUTPUTS:
+                await interaction.response.send_message(f"❌ A multitip pays 1 to {MULTITIP_MAX_OUTPUTS} users.", ephemeral=True)
                 return
-            current_nonce = get_nonce(str(interaction.user.id))
-            skipped = 0
-            summary_lines = []
-            for i, mention in enumerate(user_list):
-                user_id_str = mention.strip('<@!>')
-                try:
-                    user_obj = await self.fetch_user(int(user_id_str))
-                    username = str(user_obj)
-                    display_name = user_obj.display_name
-                except Exception:
-                    username = mention
-                    display_name = username
-                tx = {
-                    "type": "tip",
-                    "user_id": str(interaction.user.id),
-                    "username": str(interaction.user),
-                    "to": user_id_str,
-                    "to_username": username,
-                    "amount": amount_list[i],
-                    "nonce": current_nonce
-                }
-                success = safe_append_tx(tx)
-                if success:
-                    summary_lines.append(f"• {interaction.user.display_name} → {display_name}: {amount_list[i]} BOILIES")
-                else:
-                    skipped += 1
-                current_nonce += 1
-            summary = "🍡 **Multitip Summary:**\n" + "\n".join(summary_lines) if summary_lines else "⚠️ All transactions were skipped due to duplicate nonces."
-            if skipped:
-                summary += f"\n⚠️ {skipped} transaction(s) were skipped due to duplicate nonces."
-            await interaction.response.send_message(summary, ephemeral=True)
-
-            for i, mention in enumerate(user_list):
+            recipients = []
+            for mention, amount in zip(user_list, amount_list):
                 user_id_str = mention.strip('<@!>')
-                try:
-                    if i >= len(amount_list):
-                        continue
-                    amount = amount_list[i]
-                    await interaction.channel.send(f"🎏 {interaction.user.display_name} just tipped {amount} BOILIES to <@{user_id_str}>!")
-                except Exception as e:
-                    print(f"⚠️ Failed to announce multitip for {user_id_str}: {e}")
+                user_obj = self.get_user(int(user_id_str)) if user_id_str.isdigit() else None
+                if user_obj is None:
+                    try:
+                        user_obj = await self.fetch_user(int(user_id_str))
+                    except Exception:
+                        user_obj = None
+                username = str(user_obj) if user_obj else mention
+                recipients.append((user_id_str, username, amount))
+
+            # One tx and one nonce for every recipient; the worker pays all of them or none
+            result = await asubmit_multitip(str(interaction.user.id), recipients, sender_name=str(interaction.user))
+            if result["status"] == "insufficient_balance":
+                await interaction.response.send_message(f"❌ You need {sum(amount_list)} BOILIES.", ephemeral=True)
+                return
+            if not result["ok"]:
+                await interaction.response.send_message("⚠️ Multitip could not be queued. Please check the users and try again.", ephemeral=True)
+                return
+            summary_lines = [f"• {interaction.user.display_name} → <@{rid}>: {amount} BOILIES" for rid, _, amount in recipients]
+            await interaction.response.send_message("🍡 **Multitip Summary:**\n" + "\n".join(summary_lines), ephemeral=True)
+            try:
+                mentions = ", ".join(f"<@{rid}> ({amount})" for rid, _, amount in recipients)
+                await interaction.channel.send(f"🎏 {interaction.user.display_name} just tipped BOILIES to {mentions}!")
+            except Exception as e:
+                print(f"⚠️ Failed to announce multitip: {e}")
 
         @self.tree.command(name="balance", description="Check your BOILIES balance")
         async def balance(interaction: discord.Interaction):
-            wallet = get_or_create_wallet(interaction.user)
+            wallet = await aget_or_create_wallet(interaction.user)
             await interaction.response.send_message(f"💰 Balance: {wallet['carp_balance']} BOILIES", ephemeral=True)
 
+        @self.tree.command(name="history", description="Show your BOILIES transaction history")
+        @app_commands.describe(page="Page number, newest transactions first")
+        async def history(interaction: discord.Interaction, page: int = 1):
+            user_id = str(interaction.user.id)
+            page = max(1, page)
+            total, entries = await aget_user_history(user_id, HISTORY_PAGE_SIZE, (page - 1) * HISTORY_PAGE_SIZE)
+            pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+            if not entries:
+                message = "📭 No settled transactions yet." if total == 0 else f"❌ Page {page} does not exist, you have {pages} page(s)."
+                await interaction.response.send_message(message, ephemeral=True)
+                return
+            lines = [format_history_entry(entry, user_id) for entry in entries]
+            await interaction.response.send_message(
+                f"🧾 **History** (page {page}/{pages}, {total} transactions):\n" + "\n".join(lines),
+                ephemeral=True
+            )
+
         @self.tree.command(name="mint", description="Mint BOILIES to a user (admin only)")
         async def mint(interaction: discord.Interaction, user: discord.User, amount: int):
             if str(interaction.user.id) not in ADMIN_IDS:
@@ -139,15 +151,8 @@ class BoilieBot(discord.Client):
             if amount <= 0:
                 await interaction.response.send_message("❌ Amount must be positive.", ephemeral=True)
                 return
-            nonce = get_nonce(str(user.id))
-            tx = {
-                "type": "mint",
-                "user_id": str(user.id),
-                "username": str(user),
-                "amount": amount,
-                "nonce": nonce
-            }
-            if not safe_append_tx(tx):
+            result = await asubmit_transfer(str(user.id), None, amount, sender_name=str(user), tx_type="mint")
+            if not result["ok"]:
                 await interaction.response.send_message("⚠️ Mint transaction already in mempool.", ephemeral=True)
                 return
             await interaction.response.send_message(f"✅ Mint of {amount} BOILIES queued for {user.display_name}.", ephemeral=True)
@@ -163,6 +168,7 @@ def run_bot(shutdown_event=None):
 
     BotClass = build_bot()
     bot = BotClass(shutdown_event)
+    metrics.watch_discord(bot, "tipping")
 
     async def runner():
         async def shutdown_watcher():
@@ -199,4 +205,6 @@ def run_bot(shutdown_event=None):
 
 
 if __name__ == "__main__":
+    from components import redirect_output
+    redirect_output()
     run_bot()
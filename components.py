@@ -0,0 +1,56 @@
+# components.py
+# The components BOILIE_control, supervisor.py and daemon.py can start, and how to reach them.
+#
+# Nothing here imports a component: its module (and discord.py with it, for the bots) is
+# only loaded by load_entry() when the component is started.
+import importlib
+import sys
+
+# entry is "module:function(stop_event)"; restart is "always", "on-failure" or "never";
+# asyncio components are pinged through their event loop, so a blocked loop counts as hung;
+# the others call heartbeat() from their own loop, so a stuck loop stops beating
+COMPONENTS = {
+    "TX Worker": {"entry": "core.tx_worker:process_pending_transactions", "restart": "always", "asyncio": False},
+    "Ledger Service": {"entry": "core.ledger_service:run_service", "restart": "always", "asyncio": True},
+    "Hourly Backups": {"entry": "backup_json:main", "restart": "on-failure", "asyncio": False},
+    "Tipping Bot": {"entry": "bots.tipping_bot:run_bot", "restart": "always", "asyncio": True},
+    "Catch Bot": {"entry": "bots.catch_bot:run_bot", "restart": "always", "asyncio": True},
+    "Raffle Bot": {"entry": "bots.raffle_bot:run_bot", "restart": "always", "asyncio": True},
+    "Info Bot": {"entry": "bots.info_bot:run_bot", "restart": "always", "asyncio": True},
+    "Factory Bot": {"entry": "bots.factory_bot:run_bot", "restart": "always", "asyncio": True},
+}
+
+_log_file = None
+_heartbeat = None
+
+
+def entry_module(name):
+    return COMPONENTS[name]["entry"].split(":")[0]
+
+
+def load_entry(name):
+    """Import the component's module now and return its function(stop_event)."""
+    module_name, func_name = COMPONENTS[name]["entry"].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def set_heartbeat(func):
+    # The supervisor's child process reports beats to its parent; everywhere else they go nowhere
+    global _heartbeat
+    _heartbeat = func
+
+
+def heartbeat():
+    """Called by a component's own loop whenever it makes progress."""
+    if _heartbeat is not None:
+        _heartbeat()
+
+
+def redirect_output():
+    # print() of this process goes to DEBUG_FILE from here on; called by entry points, never on import
+    global _log_file
+    if _log_file is None:
+        from paths import DEBUG_FILE
+        _log_file = open(DEBUG_FILE, "a", buffering=1)
+    sys.stdout = _log_file
+    sys.stderr = _log_file
@@ -0,0 +1,282 @@
+# audit.py
+# Recomputes every balance and nonce from the tx log and checks them against the wallet store.
+#
+#   python -m core.audit                                  # live ledger
+#   python -m core.audit --backup backup/backup_<ts>.zip  # a backup written by backup_json
+#   python -m core.audit --json
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+from core import serialization
+
+# Type codes of the tx_type column; anything else the worker would have rejected
+TX_TYPES = ("tip", "bait", "reward", "mint", "buyticket", "multitip")
+MINT = TX_TYPES.index("mint")
+MULTITIP = TX_TYPES.index("multitip")
+UNKNOWN = len(TX_TYPES)
+_TYPE_CODES = {name: code for code, name in enumerate(TX_TYPES)}
+
+
+class LogColumns:
+    """The tx log as parallel NumPy arrays, with user ids replaced by dense indices."""
+
+    def __init__(self):
+        self.user_ids = []
+        self._index = {}
+        self._sender = []
+        self._recipient = []
+        self._amount = []
+        self._type = []
+        self._nonce = []
+        self.tx_ids = []
+        # Multitip credits, one row per output
+        self._out_user = []
+        self._out_amount = []
+
+    def user_index(self, user_id):
+        idx = self._index.get(user_id)
+        if idx is None:
+            idx = self._index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return idx
+
+    def add(self, user_id, to, tx_type, amount, nonce, tx_id, outputs=None):
+        self._add_outputs(outputs or ())
+        self._sender.append(self.user_index(user_id))
+        self._recipient.append(self.user_index(to) if to else -1)
+        self._type.append(_TYPE_CODES.get(tx_type, UNKNOWN))
+        self._amount.append(amount or 0)
+        self._nonce.append(nonce if isinstance(nonce, int) else -1)
+        self.tx_ids.append(tx_id)
+
+    def add_entries(self, entries):
+        # Column by column, so the per-entry work stays inside list comprehensions
+        index = self.user_index
+        self._sender.extend([index(e.get("user_id")) for e in entries])
+        self._recipient.extend([index(e["to"]) if e.get("to") else -1 for e in entries])
+        self._type.extend([_TYPE_CODES.get(e.get("type"), UNKNOWN) for e in entries])
+        self._amount.extend([e.get("amount") or 0 for e in entries])
+        self._nonce.extend([e["nonce"] if isinstance(e.get("nonce"), int) else -1 for e in entries])
+        self.tx_ids.extend([e.get("tx_id") for e in entries])
+        self._add_outputs([out for e in entries if e.get("outputs") for out in e["outputs"]])
+
+    def _add_outputs(self, outputs):
+        index = self.user_index
+        self._out_user.extend([index(out.get("to")) for out in outputs])
+        self._out_amount.extend([out.get("amount") or 0 for out in outputs])
+
+    def freeze(self):
+        self.sender = np.asarray(self._sender, dtype=np.int64)
+        self.recipient = np.asarray(self._recipient, dtype=np.int64)
+        self.amount = np.asarray(self._amount, dtype=np.int64)
+        self.tx_type = np.asarray(self._type, dtype=np.int8)
+        self.nonce = np.asarray(self._nonce, dtype=np.int64)
+        self.out_user = np.asarray(self._out_user, dtype=np.int64)
+        self.out_amount = np.asarray(self._out_amount, dtype=np.int64)
+        self._sender = self._recipient = self._amount = self._type = self._nonce = None
+        self._out_user = self._out_amount = None
+        return self
+
+    def __len__(self):
+        return len(self.tx_ids)
+
+
+def recompute(cols, n_users):
+    """Balances, nonces and per-sender tx counts implied by the log, mirroring tx_worker.apply_tx."""
+    balances = np.zeros(n_users, dtype=np.int64)
+    nonces = np.zeros(n_users, dtype=np.int64)
+    sent = np.bincount(cols.sender, minlength=n_users)
+    known = cols.tx_type != UNKNOWN
+    # A mint credits its own user; every other type debits the sender and credits "to" if there is one,
+    # a multitip credits each of its outputs instead
+    debit = known & (cols.tx_type != MINT)
+    credit_to = np.where(cols.tx_type == MINT, cols.sender, cols.recipient)
+    credit = known & (credit_to >= 0)
+    np.subtract.at(balances, cols.sender[debit], cols.amount[debit])
+    np.add.at(balances, credit_to[credit], cols.amount[credit])
+    np.add.at(balances, cols.out_user, cols.out_amount)
+    np.maximum.at(nonces, cols.sender, cols.nonce)
+    return balances, nonces, sent
+
+
+def audit(cols, wallets):
+    started = time.perf_counter()
+    cols.freeze()
+    for user_id in wallets:
+        cols.user_index(user_id)
+    n_users = len(cols.user_ids)
+    balances, nonces, sent = recompute(cols, n_users)
+
+    stored_balance = np.zeros(n_users, dtype=np.int64)
+    stored_nonce = np.zeros(n_users, dtype=np.int64)
+    for user_id, wallet in wallets.items():
+        idx = cols.user_index(user_id)
+        stored_balance[idx] = wallet.get("carp_balance", 0)
+        stored_nonce[idx] = wallet.get("nonce", 0)
+
+    ids = cols.user_ids
+    is_mint = cols.tx_type == MINT
+    burned = (cols.tx_type != MINT) & (cols.tx_type != MULTITIP) & (cols.tx_type != UNKNOWN) & (cols.recipient < 0)
+    minted = int(cols.amount[is_mint].sum())
+    burned_total = int(cols.amount[burned].sum())
+    # Every settled tx advanced its sender's nonce by exactly one
+    gapped = np.nonzero(sent != nonces)[0]
+    tx_ids = [tx_id for tx_id in cols.tx_ids if tx_id]
+
+    report = {
+        "entries": len(cols),
+        "users": n_users,
+        "minted": minted,
+        "burned": burned_total,
+        "supply_expected": minted - burned_total,
+        "supply_log": int(balances.sum()),
+        "supply_wallets": int(stored_balance.sum()),
+        "balance_mismatches": {
+            ids[i]: [int(stored_balance[i]), int(balances[i])] for i in np.nonzero(stored_balance != balances)[0]
+        },
+        "nonce_mismatches": {
+            ids[i]: [int(stored_nonce[i]), int(nonces[i])] for i in np.nonzero(stored_nonce != nonces)[0]
+        },
+        "nonce_gaps": {ids[i]: [int(sent[i]), int(nonces[i])] for i in gapped},
+        "negative_balances": [ids[i] for i in np.nonzero(balances < 0)[0]],
+        "missing_nonces": int((cols.nonce < 0).sum()),
+        "unknown_types": int((cols.tx_type == UNKNOWN).sum()),
+        "duplicate_tx_ids": len(tx_ids) - len(set(tx_ids)),
+    }
+    report["ok"] = (
+        report["supply_expected"] == report["supply_log"] == report["supply_wallets"]
+        and not any(report[key] for key in (
+            "balance_mismatches", "nonce_mismatches", "nonce_gaps", "negative_balances",
+            "missing_nonces", "unknown_types", "duplicate_tx_ids",
+        ))
+    )
+    report["audit_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+
+# Sources
+def _columns_from_sqlite(conn):
+    cols = LogColumns()
+    rows = conn.execute(
+        "SELECT user_id, to_id, type, amount, json_extract(data, '$.nonce'), tx_id, json_extract(data, '$.outputs') "
+        "FROM tx_log ORDER BY seq"
+    )
+    for *row, outputs in rows:
+        cols.add(*row, outputs=json.loads(outputs) if outputs else None)
+    wallets = {
+        uid: {"carp_balance": bal, "nonce": nonce}
+        for uid, bal, nonce in conn.execute("SELECT user_id, carp_balance, nonce FROM wallets")
+    }
+    return cols, wallets
+
+
+def _add_jsonl(cols, data):
+    # JSON strings cannot contain raw newlines, so a segment becomes one array and a single parse
+    data = data.strip(b"\n")
+    if data:
+        cols.add_entries(json.loads(b"[" + data.replace(b"\n", b",") + b"]"))
+
+
+def load_live():
+    """(columns, wallets) of the current ledger, read under ledger_lock() so both are from the same pass."""
+    from paths import WALLET_FILE
+    from core.shards import ledger_lock
+    from core.storage import get_storage, SqliteStorage
+
+    storage = get_storage()
+    with ledger_lock():
+        if isinstance(storage, SqliteStorage):
+            return _columns_from_sqlite(storage.conn)
+        cols = LogColumns()
+        log = storage.tx_log
+        for segment in log.segments():
+            with open(log._segment_path(segment), "rb") as f:
+                _add_jsonl(cols, f.read(segment["bytes"]))
+        return cols, storage.load_document(WALLET_FILE)
+
+
+def load_backup(zip_path):
+    """(columns, wallets) from a backup zip; the SQLite ledger is used when the backup contains one."""
+    with zipfile.ZipFile(zip_path) as zf:
+        names = set(zf.namelist())
+        if "ledger.db" in names:
+            scratch = tempfile.mkdtemp(prefix="boilies-audit-")
+            try:
+                conn = sqlite3.connect(zf.extract("ledger.db", scratch))
+                try:
+                    return _columns_from_sqlite(conn)
+                finally:
+                    conn.close()
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+        cols = LogColumns()
+        if "tx_log/index.json" in names:
+            for segment in json.loads(zf.read("tx_log/index.json"))["segments"]:
+                _add_jsonl(cols, zf.read(f"tx_log/{segment['file']}")[:segment["bytes"]])
+        elif "tx_log.json" in names:
+            cols.add_entries(json.loads(zf.read("tx_log.json")).get("log", []))
+        wallets = serialization.loads(zf.read("wallet_store.json")) if "wallet_store.json" in names else {}
+        # Sharded data dirs keep the wallets in shards/wallet_store_NNN.json
+        for name in sorted(names):
+            if name.startswith("shards/wallet_store_") and name.endswith(".json"):
+                wallets.update(serialization.loads(zf.read(name)))
+        return cols, wallets
+
+
+def print_report(report, limit=20):
+    print(
+        f"📒 {report['entries']} log entries, {report['users']} users, loaded in {report['load_ms']} ms, "
+        f"audited in {report['audit_ms']} ms"
+    )
+    print(
+        f"🪙 Supply: expected {report['supply_expected']} (minted {report['minted']}, burned {report['burned']}), "
+        f"log {report['supply_log']}, wallets {report['supply_wallets']}"
+    )
+    for key, label in (
+        ("balance_mismatches", "balance (wallet, log)"),
+        ("nonce_mismatches", "nonce (wallet, log)"),
+        ("nonce_gaps", "nonce chain (txs sent, highest nonce)"),
+    ):
+        for uid, (stored, expected) in sorted(report[key].items())[:limit]:
+            print(f"❌ {uid}: {label} {stored} vs {expected}")
+        if len(report[key]) > limit:
+            print(f"   … {len(report[key]) - limit} more {key}")
+    for uid in report["negative_balances"][:limit]:
+        print(f"❌ {uid}: negative balance in the log")
+    for key in ("missing_nonces", "unknown_types", "duplicate_tx_ids"):
+        if report[key]:
+            print(f"❌ {report[key]} log entries with {key.replace('_', ' ')}")
+    print("✅ Wallets match the tx log." if report["ok"] else "❌ Ledger audit failed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute balances from the tx log and check ledger invariants")
+    parser.add_argument("--backup", help="Audit a backup zip instead of the live ledger")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cols, wallets = load_backup(args.backup) if args.backup else load_live()
+    load_ms = round((time.perf_counter() - started) * 1000, 2)
+    report = audit(cols, wallets)
+    report["source"] = os.path.basename(args.backup) if args.backup else "live"
+    report["load_ms"] = load_ms
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
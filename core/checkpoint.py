@@ -0,0 +1,88 @@
+# checkpoint.py
+import os
+import re
+import sys
+import time
+
+from paths import CHECKPOINT_DIR
+from core import serialization
+
+# A checkpoint is written after this many logged txs or this many seconds, whichever comes first
+CHECKPOINT_EVERY_TXS = int(os.getenv("CHECKPOINT_EVERY_TXS", "5000"))
+CHECKPOINT_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_INTERVAL_SECONDS", "900"))
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "5"))
+
+_NAME = re.compile(r"^checkpoint_(\d+)\.json$")
+
+
+def _checkpoint_files():
+    # [(seq, path)], newest first
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+    found = []
+    for name in os.listdir(CHECKPOINT_DIR):
+        match = _NAME.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(CHECKPOINT_DIR, name)))
+    return sorted(found, reverse=True)
+
+
+def write_checkpoint(wallets, seq, tx_id=None):
+    """Snapshot the wallets as of log position seq; older checkpoints beyond CHECKPOINT_KEEP are pruned."""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = os.path.join(CHECKPOINT_DIR, f"checkpoint_{seq:012d}.json")
+    # Written now even inside a group commit, so pruning below sees it
+    serialization.write_file(path, {"seq": seq, "tx_id": tx_id, "created_at": int(time.time()), "wallets": wallets}, defer=False)
+    for _, old in _checkpoint_files()[CHECKPOINT_KEEP:]:
+        os.remove(old)
+    return path
+
+
+def load_latest_checkpoint(max_seq=None):
+    # Newest readable checkpoint not ahead of max_seq; a damaged file falls back to the one before
+    for seq, path in _checkpoint_files():
+        if max_seq is not None and seq > max_seq:
+            continue
+        try:
+            return serialization.read_file(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping unreadable checkpoint {os.path.basename(path)}: {e}")
+    return None
+
+
+def latest_checkpoint_info():
+    # (seq, mtime) of the newest checkpoint without reading it, None if there is none
+    files = _checkpoint_files()
+    if not files:
+        return None
+    seq, path = files[0]
+    return seq, os.path.getmtime(path)
+
+
+def checkpoint_due(seq):
+    info = latest_checkpoint_info()
+    if info is None:
+        return True
+    last_seq, written_at = info
+    if seq <= last_seq:
+        return False
+    return seq - last_seq >= CHECKPOINT_EVERY_TXS or time.time() - written_at >= CHECKPOINT_INTERVAL_SECONDS
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "list":
+        for seq, path in _checkpoint_files():
+            print(f"{seq:>10}  {time.ctime(os.path.getmtime(path))}  {os.path.basename(path)}")
+    elif command in ("create", "recover"):
+        from core.tx_worker import create_checkpoint, recover_wallets
+        from core.storage import get_storage
+        from core.shards import ledger_lock
+        with ledger_lock():
+            if command == "create":
+                result = create_checkpoint(get_storage())
+            else:
+                result = recover_wallets(get_storage(), from_checkpoint="--from-checkpoint" in sys.argv)
+        sys.__stdout__.write(f"{result}\n")
+    else:
+        print("Usage: python -m core.checkpoint list | create | recover [--from-checkpoint]")
@@ -0,0 +1,249 @@
+# durability.py
+import collections
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# "none": atomic rename only, safe against a process crash but not a power loss
+# "batch": fsync before rename, shared by every write that arrives while the previous group is flushing,
+#          or within GROUP_COMMIT_WINDOW_MS when other writers are still mid-operation
+# "every": each write is fsynced and renamed on its own
+DURABILITY = os.getenv("DURABILITY", "batch").strip().lower()
+GROUP_COMMIT_WINDOW = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2")) / 1000
+REPLACE_RETRIES = 5
+
+WRITE_STATS = {"writes": 0, "commits": 0, "groups": 0, "fsyncs": 0, "bytes": 0}
+_latencies = collections.deque(maxlen=4096)
+_stats_lock = threading.Lock()
+_local = threading.local()
+
+# Group currently collecting writes from all threads; its leader flushes it
+_group = None
+_group_lock = threading.Lock()
+# One group flushes at a time; commits arriving meanwhile gather in the next group
+_flush_lock = threading.Lock()
+# group_commit() blocks open in any thread, i.e. writers that will commit shortly
+_open_scopes = 0
+
+
+class _Group:
+    def __init__(self):
+        self.entries = []
+        self.done = threading.Event()
+        self.error = None
+
+
+def _record(writes, fsyncs, started):
+    with _stats_lock:
+        WRITE_STATS["writes"] += writes
+        WRITE_STATS["commits"] += 1
+        WRITE_STATS["fsyncs"] += fsyncs
+        _latencies.append((time.perf_counter() - started) * 1000)
+
+
+def durability_stats():
+    """Counters plus commit latency percentiles (ms) over the most recent commits."""
+    with _stats_lock:
+        latencies = sorted(_latencies)
+        stats = dict(WRITE_STATS, level=DURABILITY)
+    for p in (50, 90, 99):
+        stats[f"p{p}_ms"] = round(latencies[min(len(latencies) - 1, len(latencies) * p // 100)], 3) if latencies else None
+    return stats
+
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _fsync_path(path):
+    # Windows only flushes handles opened for writing
+    fd = os.open(path, os.O_RDWR if os.name == "nt" else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dirs(paths):
+    # Makes the renames themselves durable; NTFS journals them and has no directory handles to fsync
+    if os.name == "nt":
+        return 0
+    dirs = {os.path.dirname(os.path.abspath(path)) for path in paths}
+    for directory in dirs:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return len(dirs)
+
+
+def _replace(tmp, path):
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            # Windows refuses to replace a file a reader has open; it is only open for one parse
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(0.01)
+
+
+def _flush(entries):
+    # entries: [(tmp or None, path, sync)]. All data is synced before the first rename,
+    # so a crash never exposes a renamed file whose contents did not reach the disk.
+    targets = []
+    for tmp, path, sync in entries:
+        target = tmp or path
+        if sync and target not in targets:
+            targets.append(target)
+    for target in targets:
+        _fsync_path(target)
+    renamed = []
+    for tmp, path, sync in entries:
+        if tmp is not None:
+            _replace(tmp, path)
+            if sync:
+                renamed.append(path)
+    return len(targets) + _fsync_dirs(renamed)
+
+
+def _commit(entries):
+    # Joins the open group or starts one; the starter flushes for everyone once the previous group is done.
+    # A lone writer pays no window; with others mid-operation the starter waits up to the window for them.
+    global _group
+    started = time.perf_counter()
+    with _group_lock:
+        group = _group
+        leader = group is None
+        if leader:
+            group = _group = _Group()
+        group.entries.extend(entries)
+    if leader:
+        _flush_lock.acquire()
+        if _open_scopes and GROUP_COMMIT_WINDOW > 0:
+            time.sleep(GROUP_COMMIT_WINDOW)
+        with _group_lock:
+            _group = None
+        try:
+            fsyncs = _flush(group.entries)
+            with _stats_lock:
+                WRITE_STATS["groups"] += 1
+                WRITE_STATS["fsyncs"] += fsyncs
+        except BaseException as e:
+            group.error = e
+        finally:
+            _flush_lock.release()
+        group.done.set()
+    else:
+        group.done.wait()
+    if group.error is not None:
+        raise group.error
+    _record(len(entries), 0, started)
+
+
+def count_bytes(nbytes):
+    # Bytes written to ledger files, including appends that are not synced here
+    with _stats_lock:
+        WRITE_STATS["bytes"] += nbytes
+
+
+def _write_tmp(path, data):
+    tmp = _tmp_path(path)
+    with open(tmp, "wb") as f:
+        f.write(data)
+    count_bytes(len(data))
+    return tmp
+
+
+def atomic_write(path, data, sync=True, defer=True):
+    """Replace path with data through a temp file and a rename, so readers never see a partial file.
+
+    sync=False is for derived files (e.g. snapshots) that need atomicity but not durability.
+    Inside group_commit() the rename is deferred to the end of the group unless defer=False,
+    which files guarded by their own lock (rather than the caller's) need.
+    """
+    scope = getattr(_local, "scope", None) if defer else None
+    sync = sync and DURABILITY != "none"
+    tmp = _write_tmp(path, data)
+    if scope is not None and DURABILITY == "batch":
+        previous = scope.get(path)
+        scope[path] = (tmp, sync or (previous is not None and previous[1]))
+        return
+    if sync and DURABILITY == "batch":
+        _commit([(tmp, path, True)])
+        return
+    started = time.perf_counter()
+    _record(1, _flush([(tmp, path, sync)]), started)
+
+
+def sync_appended(path, nbytes=0):
+    """Make bytes appended to path durable according to DURABILITY."""
+    count_bytes(nbytes)
+    if DURABILITY == "none":
+        return
+    scope = getattr(_local, "scope", None)
+    if DURABILITY == "batch":
+        if scope is not None:
+            if path not in scope:
+                scope[path] = (None, True)
+        else:
+            _commit([(None, path, True)])
+        return
+    started = time.perf_counter()
+    _record(1, _flush([(None, path, True)]), started)
+
+
+def read_path(path):
+    # A file written earlier in this thread's open group is read from its temp file
+    scope = getattr(_local, "scope", None)
+    if scope is not None:
+        entry = scope.get(path)
+        if entry is not None and entry[0] is not None:
+            return entry[0]
+    return path
+
+
+@contextmanager
+def group_commit():
+    """Defer renames and fsyncs of the writes made in this block to one group commit at its end.
+
+    Nested blocks join the outermost one. Callers keep their locks until the
+    block exits, so nobody reads the old files after the lock is released.
+    """
+    global _open_scopes
+    if getattr(_local, "scope", None) is not None:
+        yield
+        return
+    scope = _local.scope = {}
+    with _group_lock:
+        _open_scopes += 1
+    try:
+        yield
+    except BaseException:
+        for tmp, _ in scope.values():
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    finally:
+        _local.scope = None
+        with _group_lock:
+            _open_scopes -= 1
+    entries = [(tmp, path, sync) for path, (tmp, sync) in scope.items()]
+    if any(sync for _, _, sync in entries):
+        _commit(entries)
+    elif entries:
+        # Nothing to make durable, so there is no fsync to share
+        started = time.perf_counter()
+        _record(len(entries), _flush(entries), started)
+
+
+def grouped(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with group_commit():
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,170 @@
+# ledger_client.py
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import weakref
+from filelock import FileLock, Timeout
+
+from paths import LEDGER_SOCKET, LEDGER_SERVICE_LOCK
+
+# Route tx_utils through the ledger service instead of touching the data files directly
+LEDGER_SERVICE = os.getenv("LEDGER_SERVICE", "0").strip().lower() in ("1", "true", "yes")
+# TCP fallback for platforms without Unix sockets (Windows)
+LEDGER_PORT = int(os.getenv("LEDGER_PORT", "47812"))
+LEDGER_HOST = "127.0.0.1"
+USE_UNIX_SOCKET = hasattr(socket, "AF_UNIX") and os.name != "nt"
+CONNECT_RETRY_SECONDS = 2
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class LedgerServiceError(Exception):
+    pass
+
+
+def service_running():
+    lock = FileLock(LEDGER_SERVICE_LOCK)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        return True
+    lock.release()
+    return False
+
+
+def _encode(request_id, method, params):
+    return (json.dumps({"id": request_id, "method": method, "params": params}) + "\n").encode("utf-8")
+
+
+def _decode(line, request_id):
+    # The response to request_id, or None for a response to an earlier call that was abandoned
+    if not line:
+        raise ConnectionError("Ledger service closed the connection")
+    response = json.loads(line)
+    response_id = response.get("id")
+    if response_id != request_id:
+        if isinstance(response_id, int) and response_id < request_id:
+            return None
+        raise ConnectionError(f"Ledger service answered request {response_id} instead of {request_id}")
+    return response
+
+
+def _result(response):
+    if "error" in response:
+        raise LedgerServiceError(response["error"])
+    return response.get("result")
+
+
+class LedgerClient:
+    """Blocking client, one connection per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def _connect(self):
+        if USE_UNIX_SOCKET:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(LEDGER_SOCKET)
+        else:
+            sock = socket.create_connection((LEDGER_HOST, LEDGER_PORT))
+        return sock.makefile("rwb")
+
+    def _stream(self):
+        stream = getattr(self._local, "stream", None)
+        if stream is None:
+            deadline = time.monotonic() + CONNECT_RETRY_SECONDS
+            while True:
+                try:
+                    stream = self._connect()
+                    break
+                except OSError:
+                    # A service that is still starting holds its lock already
+                    if not service_running() or time.monotonic() > deadline:
+                        raise ServiceUnavailable("Ledger service is not running")
+                    time.sleep(0.05)
+            self._local.stream = stream
+        return stream
+
+    def call(self, method, **params):
+        for attempt in range(2):
+            stream = self._stream()
+            request_id = next(self._ids)
+            try:
+                stream.write(_encode(request_id, method, params))
+                stream.flush()
+                response = None
+                while response is None:
+                    response = _decode(stream.readline(), request_id)
+            except (OSError, ConnectionError):
+                self._local.stream = None
+                if attempt:
+                    raise ServiceUnavailable("Lost connection to the ledger service")
+                continue
+            return _result(response)
+
+
+class AsyncLedgerClient:
+    """asyncio client bound to the event loop it was created on."""
+
+    def __init__(self):
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+
+    async def _open(self):
+        if self._writer is None or self._writer.is_closing():
+            try:
+                if USE_UNIX_SOCKET:
+                    self._reader, self._writer = await asyncio.open_unix_connection(LEDGER_SOCKET)
+                else:
+                    self._reader, self._writer = await asyncio.open_connection(LEDGER_HOST, LEDGER_PORT)
+            except OSError:
+                self._writer = None
+                raise ServiceUnavailable("Ledger service is not running")
+
+    async def call(self, method, **params):
+        async with self._lock:
+            for attempt in range(2):
+                await self._open()
+                request_id = next(self._ids)
+                try:
+                    self._writer.write(_encode(request_id, method, params))
+                    await self._writer.drain()
+                    response = None
+                    while response is None:
+                        response = _decode(await self._reader.readline(), request_id)
+                except (OSError, ConnectionError):
+                    self._writer = None
+                    if attempt:
+                        raise ServiceUnavailable("Lost connection to the ledger service")
+                    continue
+                except asyncio.CancelledError:
+                    # The answer may still arrive; a fresh connection keeps it from reaching the next caller
+                    self._writer.close()
+                    self._writer = None
+                    raise
+                return _result(response)
+
+
+_client = LedgerClient()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    return _client
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncLedgerClient()
+    return client
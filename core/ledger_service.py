@@ -0,0 +1,320 @@
+# ledger_service.py
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from filelock import FileLock, Timeout
+
+from paths import WALLET_FILE, PENDING_FILE, LEDGER_SOCKET, LEDGER_SERVICE_LOCK
+from core.storage import get_storage, reserve_transfer, pending_debit, outflow_totals, outflow_mismatches
+from core.shards import shard_locks, ledger_lock
+from core.tx_utils import generate_tx_id
+from core.tx_worker import (
+    settle_batch, tx_user_ids, check_upgrade_completion, recover_wallets,
+    UPGRADE_CHECK_SECONDS, IDLE_POLL_SECONDS, HELD_RECHECK_SECONDS, MEMPOOL_STATS, MEMPOOL_DEPTH
+)
+from core import metrics
+from core.tx_notify import PendingListener, wait_for_pending, clear_pending
+from core.ledger_client import USE_UNIX_SOCKET, LEDGER_HOST, LEDGER_PORT
+
+
+class LedgerService:
+    """Owns wallets, nonces and the mempool in memory and serves them over a local socket.
+
+    Reads are answered straight from memory. Everything that changes state
+    runs on a single writer thread, which persists through the storage
+    backend: submitted txs go to the pending pool, settled batches to the
+    tx log and the wallet snapshot.
+    """
+
+    READ_METHODS = {"ping", "get_balance", "get_effective_balance", "get_nonce", "get_wallet", "get_wallets", "tx_id_exists", "stats", "check_outflow"}
+    WRITE_METHODS = {"submit_tx", "submit_transfer", "get_or_create_wallet"}
+
+    def __init__(self):
+        self.storage = get_storage()
+        self.wallets = {}
+        self.mempool = {}
+        self.outflow = {}
+        self.pending_nonces = {}
+        # Wallets and the mempool aggregates change together on the writer thread; reads that
+        # combine them on the loop thread take this lock so they never see one without the other
+        self.state_lock = threading.RLock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-writer")
+        self.settle_event = None
+        self.settled_batches = 0
+        self.held = 0
+
+    # State
+    def load(self):
+        with ledger_lock():
+            recover_wallets(self.storage)
+            self.wallets = self.storage.load_document(WALLET_FILE)
+            self.mempool = {}
+            self.outflow = {}
+            self.pending_nonces = {}
+            self._merge_pending(self.storage.load_document(PENDING_FILE).get("txs", []))
+        print(f"📒 Ledger service loaded {len(self.wallets)} wallets and {len(self.mempool)} pending txs.")
+
+    def _merge_pending(self, txs):
+        with self.state_lock:
+            self._merge_pending_locked(txs)
+
+    def _merge_pending_locked(self, txs):
+        for tx in txs:
+            if "tx_id" not in tx:
+                tx["tx_id"] = generate_tx_id(tx)
+            if tx["tx_id"] in self.mempool:
+                continue
+            self.mempool[tx["tx_id"]] = tx
+            self.pending_nonces.setdefault(tx.get("user_id"), set()).add(tx.get("nonce"))
+            if pending_debit(tx):
+                self.outflow[tx.get("user_id")] = self.outflow.get(tx.get("user_id"), 0) + pending_debit(tx)
+
+    def _drop_pending(self, tx_ids):
+        with self.state_lock:
+            self._drop_pending_locked(tx_ids)
+
+    def _drop_pending_locked(self, tx_ids):
+        for tx_id in tx_ids:
+            tx = self.mempool.pop(tx_id, None)
+            if tx is None:
+                continue
+            uid = tx.get("user_id")
+            nonces = self.pending_nonces.get(uid)
+            if nonces is not None:
+                nonces.discard(tx.get("nonce"))
+                if not nonces:
+                    del self.pending_nonces[uid]
+            if pending_debit(tx):
+                self.outflow[uid] = self.outflow.get(uid, 0) - pending_debit(tx)
+                if not self.outflow[uid]:
+                    del self.outflow[uid]
+
+    # Read API (event loop thread)
+    def ping(self):
+        return "pong"
+
+    def get_wallet(self, user_id):
+        return self.wallets.get(user_id)
+
+    def get_wallets(self):
+        # A copy, as the writer thread adds wallets while the response is being serialized;
+        # wallet dicts themselves are replaced, never changed in place
+        with self.state_lock:
+            return dict(self.wallets)
+
+    def get_balance(self, user_id):
+        return self.wallets.get(user_id, {}).get("carp_balance", 0)
+
+    def get_effective_balance(self, user_id):
+        with self.state_lock:
+            return self.get_balance(user_id) - self.outflow.get(user_id, 0)
+
+    def get_nonce(self, user_id):
+        wallet = self.wallets.get(user_id)
+        return wallet.get("nonce", 0) + 1 if wallet is not None else 1
+
+    def tx_id_exists(self, tx_id):
+        return tx_id in self.mempool or self.storage.has_tx_id(tx_id)
+
+    def check_outflow(self):
+        with self.state_lock:
+            mismatches = outflow_mismatches(self.outflow, outflow_totals(self.mempool.values()))
+        return {uid: list(pair) for uid, pair in mismatches.items()}
+
+    def stats(self):
+        return {
+            "wallets": len(self.wallets),
+            "mempool": len(self.mempool),
+            "held": self.held,
+            "settled_batches": self.settled_batches,
+            **MEMPOOL_STATS,
+        }
+
+    # Write API (writer thread)
+    def submit_tx(self, tx):
+        if "tx_id" not in tx:
+            tx["tx_id"] = generate_tx_id(tx)
+        if tx.get("nonce") in self.pending_nonces.get(tx.get("user_id"), ()) or tx["tx_id"] in self.mempool:
+            return {"ok": False, "tx_id": tx["tx_id"]}
+        with shard_locks(tx["user_id"]):
+            ok = self.storage.append_pending(tx)
+        if ok:
+            self._merge_pending([tx])
+        return {"ok": ok, "tx_id": tx["tx_id"]}
+
+    def submit_transfer(self, tx):
+        uid = tx["user_id"]
+        nonces = self.pending_nonces.get(uid, ())
+        result = reserve_transfer(tx, self.wallets.get(uid), self.outflow.get(uid, 0), nonces, generate_tx_id)
+        if not result["ok"]:
+            return result
+        if tx["tx_id"] in self.mempool:
+            return dict(result, ok=False, status="duplicate")
+        with shard_locks(tx["user_id"]):
+            ok = self.storage.append_pending(tx)
+        if not ok:
+            return dict(result, ok=False, status="duplicate")
+        self._merge_pending([tx])
+        return result
+
+    def get_or_create_wallet(self, user_id, username=None):
+        wallet = self.wallets.get(user_id)
+        if wallet is not None and (not username or wallet.get("name") == username) and "nonce" in wallet:
+            return wallet
+        wallet = dict(wallet) if wallet is not None else {"name": username or user_id, "carp_balance": 0, "nonce": 0}
+        if username:
+            wallet["name"] = username
+        wallet.setdefault("nonce", 0)
+        with shard_locks(user_id):
+            self.storage.put_wallet(user_id, wallet)
+        with self.state_lock:
+            self.wallets[user_id] = wallet
+        return wallet
+
+    def settle(self):
+        if not self.mempool:
+            return None
+        with ledger_lock():
+            txs = list(self.mempool.values())
+            # Settle against a copy so a failed commit leaves memory untouched
+            wallets = dict(self.wallets)
+            for uid in set(tx_user_ids(txs)):
+                if uid in wallets:
+                    wallets[uid] = dict(wallets[uid])
+            batch = settle_batch(self.storage, wallets, txs)
+        with self.state_lock:
+            # The debited balances and the outflow they replace swap in one step
+            self.wallets = batch.wallets
+            self._drop_pending_locked(batch.removed_tx_ids)
+        self.settled_batches += 1
+        self.held = batch.stats["held"]
+        return batch.stats
+
+    def reload_pending(self):
+        # Picks up txs that were appended directly to the pool, bypassing the service
+        with ledger_lock():
+            self._merge_pending(self.storage.load_document(PENDING_FILE).get("txs", []))
+
+    # Server
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    method = request.get("method")
+                    params = request.get("params") or {}
+                    if method in self.READ_METHODS:
+                        result = getattr(self, method)(**params)
+                    elif method in self.WRITE_METHODS:
+                        result = await loop.run_in_executor(self.writer, functools.partial(getattr(self, method), **params))
+                        if method in ("submit_tx", "submit_transfer") and result["ok"]:
+                            self.settle_event.set()
+                    else:
+                        raise ValueError(f"Unknown method: {method}")
+                    response = {"id": request_id, "result": result}
+                except Exception as e:
+                    response = {"id": request_id, "error": str(e)}
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _settle_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.settle_event.wait()
+            self.settle_event.clear()
+            try:
+                await loop.run_in_executor(self.writer, self.settle)
+            except Exception as e:
+                print(f"🔥 Ledger service settle failed: {e}")
+
+    async def _housekeeping(self, shutdown_event, listener):
+        loop = asyncio.get_running_loop()
+        last_upgrade_check = last_reload = last_held_check = time.monotonic()
+        while not shutdown_event.is_set():
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            if listener.sock is None and listener.start(warn=False):
+                # A TX worker that held the port hands it over once it sees the service running
+                print(f"📒 Ledger service now listening for TX notifications on port {listener.port}")
+            if wait_for_pending(0) or now - last_reload >= IDLE_POLL_SECONDS:
+                clear_pending()
+                last_reload = now
+                await loop.run_in_executor(self.writer, self.reload_pending)
+                self.settle_event.set()
+            elif self.held and now - last_held_check >= HELD_RECHECK_SECONDS:
+                # Gapped txs must get a chance to expire even when nothing new arrives
+                last_held_check = now
+                self.settle_event.set()
+            if now - last_upgrade_check >= UPGRADE_CHECK_SECONDS:
+                last_upgrade_check = now
+                await loop.run_in_executor(None, check_upgrade_completion)
+
+    async def serve(self, shutdown_event):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.writer, self.load)
+        # The live pool, including txs submitted since the last settle
+        MEMPOOL_DEPTH.set_function(lambda: len(self.mempool))
+        self.settle_event = asyncio.Event()
+        self.settle_event.set()
+        if USE_UNIX_SOCKET:
+            if os.path.exists(LEDGER_SOCKET):
+                os.remove(LEDGER_SOCKET)
+            server = await asyncio.start_unix_server(self._handle, path=LEDGER_SOCKET)
+            print(f"📒 Ledger service listening on {LEDGER_SOCKET}")
+        else:
+            server = await asyncio.start_server(self._handle, LEDGER_HOST, LEDGER_PORT)
+            print(f"📒 Ledger service listening on {LEDGER_HOST}:{LEDGER_PORT}")
+        listener = PendingListener()
+        listener.start()
+        settle_task = asyncio.create_task(self._settle_loop())
+        try:
+            await self._housekeeping(shutdown_event, listener)
+        finally:
+            listener.stop()
+            server.close()
+            await server.wait_closed()
+            settle_task.cancel()
+            await loop.run_in_executor(self.writer, self.settle)
+            self.writer.shutdown(wait=True)
+            if USE_UNIX_SOCKET and os.path.exists(LEDGER_SOCKET):
+                os.remove(LEDGER_SOCKET)
+
+
+def run_service(shutdown_event):
+    owner = FileLock(LEDGER_SERVICE_LOCK)
+    try:
+        owner.acquire(timeout=0)
+    except Timeout:
+        print("⚠️ Ledger service is already running.")
+        return
+    print("📒 Ledger service started...")
+    metrics.start_server()
+    try:
+        asyncio.run(LedgerService().serve(shutdown_event))
+    finally:
+        owner.release()
+    print("🛑 Ledger service stopped.")
+
+
+def main():
+    from components import redirect_output
+    redirect_output()
+    run_service(threading.Event())
+
+
+if __name__ == "__main__":
+    main()
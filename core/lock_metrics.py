@@ -0,0 +1,171 @@
+# lock_metrics.py
+# Wait and hold times of ledger lock acquisitions, per call site.
+#
+#   LOCK_METRICS=1 python -m core.tx_worker     # record while running
+#   python -m core.lock_metrics                 # print the latest dumps of every process
+import atexit
+import bisect
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from paths import METRICS_DIR
+from core import durability
+
+# Off by default; when off, lock helpers hand out the bare lock and nothing is timed
+LOCK_METRICS = os.getenv("LOCK_METRICS", "0").strip().lower() in ("1", "true", "yes")
+LOCK_METRICS_DUMP_SECONDS = int(os.getenv("LOCK_METRICS_DUMP_SECONDS", "60"))
+
+# Bucket upper bounds in ms: 1 µs doubling up to ~67 s
+BUCKET_BOUNDS = [0.001 * 2 ** i for i in range(27)]
+
+
+class Histogram:
+    """Fixed log-scale buckets, so recording is O(log buckets) and memory stays constant."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile, capped at the largest value seen
+        if not self.count:
+            return None
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 4) if self.count else None,
+            **{f"p{p}_ms": round(self.percentile(p), 4) if self.count else None for p in (50, 90, 99)},
+            "max_ms": round(self.max, 4),
+        }
+
+
+_sites = {}
+_sites_lock = threading.Lock()
+_dumper = None
+
+
+def caller_site(depth=2):
+    # "module.function" of the code that asked for the lock
+    frame = sys._getframe(depth)
+    module = frame.f_globals.get("__name__", "?").rsplit(".", 1)[-1]
+    return f"{module}.{frame.f_code.co_name}"
+
+
+def record(site, wait_ms, hold_ms):
+    with _sites_lock:
+        hists = _sites.get(site)
+        if hists is None:
+            hists = _sites[site] = (Histogram(), Histogram())
+        hists[0].observe(wait_ms)
+        hists[1].observe(hold_ms)
+    _ensure_dumper()
+
+
+@contextmanager
+def timed(lock, site):
+    """Acquire lock (any context manager) and record how long it took and how long it was held."""
+    requested = time.perf_counter()
+    with lock:
+        acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            released = time.perf_counter()
+            record(site, (acquired - requested) * 1000, (released - acquired) * 1000)
+
+
+def instrument(lock, site=None):
+    # The bare lock when metrics are off; callers pass site or get their own function name
+    if not LOCK_METRICS:
+        return lock
+    return timed(lock, site or caller_site(3))
+
+
+def lock_stats():
+    """{site: {"wait": summary, "hold": summary}} for this process, busiest sites first."""
+    with _sites_lock:
+        stats = {site: {"wait": wait.summary(), "hold": hold.summary()} for site, (wait, hold) in _sites.items()}
+    return dict(sorted(stats.items(), key=lambda item: -item[1]["hold"]["count"] * (item[1]["hold"]["mean_ms"] or 0)))
+
+
+def reset():
+    with _sites_lock:
+        _sites.clear()
+
+
+def metrics_file(pid=None):
+    return os.path.join(METRICS_DIR, f"locks_{pid or os.getpid()}.json")
+
+
+def dump():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    data = {"pid": os.getpid(), "process": os.path.basename(sys.argv[0] or "python"), "dumped_at": int(time.time()), "sites": lock_stats()}
+    durability.atomic_write(metrics_file(), json.dumps(data, indent=2).encode("utf-8"), sync=False, defer=False)
+
+
+def _dump_loop():
+    while True:
+        time.sleep(LOCK_METRICS_DUMP_SECONDS)
+        try:
+            dump()
+        except Exception as e:
+            print(f"⚠️ Failed to dump lock metrics: {e}")
+
+
+def _ensure_dumper():
+    global _dumper
+    if _dumper is None:
+        with _sites_lock:
+            if _dumper is None:
+                _dumper = threading.Thread(target=_dump_loop, name="lock-metrics-dump", daemon=True)
+                _dumper.start()
+                atexit.register(dump)
+
+
+def format_table(sites, limit=None):
+    lines = [f"{'site':<36} {'count':>8} {'wait p50':>9} {'wait p99':>9} {'wait max':>9} {'hold p50':>9} {'hold p99':>9} {'hold max':>9}"]
+    for site, s in list(sites.items())[:limit]:
+        wait, hold = s["wait"], s["hold"]
+        lines.append(
+            f"{site:<36} {hold['count']:>8} {wait['p50_ms']:>9.3f} {wait['p99_ms']:>9.3f} {wait['max_ms']:>9.3f} "
+            f"{hold['p50_ms']:>9.3f} {hold['p99_ms']:>9.3f} {hold['max_ms']:>9.3f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    files = sorted(glob.glob(os.path.join(METRICS_DIR, "locks_*.json")), key=os.path.getmtime)
+    if not files:
+        print(f"📭 No lock metrics in {METRICS_DIR}. Run the bots with LOCK_METRICS=1.")
+        return
+    for path in files:
+        with open(path) as f:
+            data = json.load(f)
+        print(f"🔒 {data['process']} (pid {data['pid']}), dumped {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['dumped_at']))}")
+        print(format_table(data["sites"]) if data["sites"] else "   no lock acquisitions recorded")
+
+
+if __name__ == "__main__":
+    main()
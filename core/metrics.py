@@ -0,0 +1,349 @@
+# metrics.py
+# Counters, gauges and histograms shared by the worker, the ledger service, the bots and the backups,
+# served in Prometheus text format on a local port.
+#
+#   curl http://127.0.0.1:47813/metrics
+#
+# Every process keeps its own values. Components started from BOILIE_control share one endpoint;
+# a component started on its own serves its values if the port is free.
+import bisect
+import ipaddress
+import os
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 keeps recording but serves nothing
+METRICS_PORT = int(os.getenv("METRICS_PORT", "47813"))
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# /profile starts and stops the profiler without any authentication, so it is only served
+# on a loopback METRICS_HOST unless METRICS_PROFILE_REMOTE is set
+PROFILE_ENDPOINTS = _is_loopback(METRICS_HOST) or os.getenv("METRICS_PROFILE_REMOTE", "0").strip().lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds: 1 ms doubling up to ~65 s
+LATENCY_BUCKETS = tuple(0.001 * 2 ** i for i in range(17))
+
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+_server = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels) or any(name not in labels for name in self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        # [(suffix, ((label, value), ...), number)]
+        with self._lock:
+            return [("", tuple(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        # Read when scraped, for values that already live somewhere else
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def samples(self):
+        # A function replaces whatever was set for the same labels
+        with self._lock:
+            functions = list(self._functions.items())
+            samples = [("", tuple(zip(self.labels, key)), value) for key, value in self._values.items() if key not in self._functions]
+        for key, func in functions:
+            try:
+                samples.append(("", tuple(zip(self.labels, key)), float(func())))
+            except Exception:
+                pass
+        return samples
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in states:
+            labels = tuple(zip(self.labels, key))
+            seen = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                seen += n
+                samples.append(("_bucket", labels + (("le", _format_value(bound)),), seen))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+def _register(cls, name, help_text, labels, **kwargs):
+    # Asking twice for the same name hands back the same metric
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, help_text, labels, **kwargs)
+        elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+            raise ValueError(f"Metric {name} is already registered as a different {metric.kind}")
+        return metric
+
+
+def counter(name, help_text, labels=()):
+    return _register(Counter, name, help_text, labels)
+
+
+def gauge(name, help_text, labels=()):
+    return _register(Gauge, name, help_text, labels)
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram, name, help_text, labels, buckets=buckets)
+
+
+def add_collector(func):
+    """func() returns [(name, kind, help, samples)] built at scrape time, samples as in Metric.samples()."""
+    with _registry_lock:
+        if func not in _collectors:
+            _collectors.append(func)
+
+
+def _ledger_io():
+    from core import durability
+    stats = durability.durability_stats()
+    return [
+        (f"boilies_ledger_{key}_total", "counter", f"Ledger file {key} since start-up", [("", (), stats[key])])
+        for key in ("writes", "commits", "groups", "fsyncs", "bytes")
+    ]
+
+
+def _lock_contention():
+    from core import lock_metrics
+    families = []
+    for part in ("wait", "hold"):
+        samples = []
+        for site, stats in lock_metrics.lock_stats().items():
+            s = stats[part]
+            labels = (("site", site),)
+            for p in (50, 90, 99):
+                if s[f"p{p}_ms"] is not None:
+                    samples.append(("", labels + (("quantile", f"0.{p}"),), s[f"p{p}_ms"] / 1000))
+            samples.append(("_sum", labels, (s["mean_ms"] or 0) * s["count"] / 1000))
+            samples.append(("_count", labels, s["count"]))
+        if samples:
+            families.append((f"boilies_lock_{part}_seconds", "summary", f"Ledger lock {part} time per call site", samples))
+    return families
+
+
+_collectors.extend([_ledger_io, _lock_contention])
+
+
+def render():
+    """Every metric of this process in Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_metrics.values())
+        collectors = list(_collectors)
+    families = [(m.name, m.kind, m.help, m.samples()) for m in metrics]
+    for collect in collectors:
+        try:
+            families.extend(collect())
+        except Exception as e:
+            print(f"⚠️ Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {_escape(help_text)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, content_type, text):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        if method == "GET" and url.path in ("/", "/metrics"):
+            self._reply(200, "text/plain; version=0.0.4; charset=utf-8", render())
+        elif url.path == "/profile" or url.path.startswith("/profile/"):
+            if not PROFILE_ENDPOINTS:
+                self.send_error(403, "Profiling is only served on a loopback METRICS_HOST, see METRICS_PROFILE_REMOTE")
+                return
+            # On-demand profiling of this process, see core.profiling
+            from core import profiling
+            query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+            self._reply(*profiling.handle(method, url.path, query))
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def log_message(self, format, *args):
+        # Scrapes would otherwise end up in debug.log every few seconds
+        pass
+
+
+def start_server():
+    """Serve /metrics from this process once; a port taken by another process is reported and left alone."""
+    global _server
+    with _registry_lock:
+        if _server is not None or not METRICS_PORT:
+            return
+        try:
+            _server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _Handler)
+        except OSError as e:
+            _server = False
+            print(f"⚠️ Metrics not served from this process, {METRICS_HOST}:{METRICS_PORT} unavailable: {e}")
+            return
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Metrics served on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if not PROFILE_ENDPOINTS:
+        print(f"🔒 Profiling endpoints disabled on non-loopback host {METRICS_HOST}")
+
+
+# Discord
+DISCORD_REQUEST_SECONDS = histogram(
+    "boilies_discord_request_seconds", "Discord REST call latency, including rate limit waits", ("bot", "method", "route")
+)
+DISCORD_REQUEST_ERRORS = counter("boilies_discord_request_errors_total", "Discord REST calls that raised", ("bot", "route"))
+BOT_UP = gauge("boilies_bot_up", "1 while the bot is connected to the gateway", ("bot",))
+BOT_LATENCY = gauge("boilies_bot_gateway_latency_seconds", "Gateway heartbeat latency", ("bot",))
+_webhooks_timed = False
+
+
+def _timed_request(request, bot):
+    async def timed_request(route, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await request(route, *args, **kwargs)
+        except Exception:
+            DISCORD_REQUEST_ERRORS.inc(bot=bot, route=route.path)
+            raise
+        finally:
+            DISCORD_REQUEST_SECONDS.observe(time.perf_counter() - started, bot=bot, method=route.method, route=route.path)
+    return timed_request
+
+
+def watch_discord(client, bot):
+    """Time every REST call of a discord client and report whether it is connected.
+
+    Interaction responses go through discord.py's shared webhook adapter
+    instead of the client, so they are timed once per process as bot
+    "interactions". Routes are reported as templates, never with ids or tokens.
+    """
+    global _webhooks_timed
+    client.http.request = _timed_request(client.http.request, bot)
+    BOT_UP.set_function(lambda: client.is_ready() and not client.is_closed(), bot=bot)
+    BOT_LATENCY.set_function(lambda: client.latency, bot=bot)
+    with _registry_lock:
+        if not _webhooks_timed:
+            from discord.webhook.async_ import async_context
+            adapter = async_context.get()
+            adapter.request = _timed_request(adapter.request, "interactions")
+            _webhooks_timed = True
+    start_server()
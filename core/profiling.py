@@ -0,0 +1,329 @@
+# profiling.py
+# On-demand sampling profiler for components that are already running, without restarting them under cProfile.
+#
+#   python -m core.profiling list                    # threads of the running process that can be sampled
+#   python -m core.profiling start "TX Worker"       # sample one component (its thread name), or "all"
+#   python -m core.profiling stop                    # write the results to data/profiles
+#   python -m core.profiling tasks "Catch Bot"       # asyncio task stacks of that component right now
+#
+# The commands go to the metrics endpoint of the process running the components (BOILIE_control, or a
+# component started on its own), see core.metrics. Each run writes:
+#   <target>_<time>.pstats      python -m pstats, snakeviz
+#   <target>_<time>.folded      flamegraph.pl, speedscope
+#   <target>_<time>.tasks.txt   asyncio task stacks when sampling started and stopped
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from paths import PROFILE_DIR
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Sampling stops by itself after this long, in case nobody comes back to stop it
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+TASK_STACK_LIMIT = 20
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def thread_matches(target, name):
+    return target == "all" or name == target or (target == "main" and name == "MainThread")
+
+
+def thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _frame_key(code):
+    return code.co_filename, code.co_firstlineno, getattr(code, "co_qualname", code.co_name)
+
+
+def _stack(frame):
+    # Root first, as pstats callers and folded stacks expect
+    stack = []
+    while frame is not None:
+        stack.append(_frame_key(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def running_loops():
+    """{thread id: event loop} of every asyncio loop running in this process.
+
+    Each bot starts its own loop in its own thread, so the loops are found on
+    the heap instead of every bot having to register one.
+    """
+    return {
+        loop._thread_id: loop
+        for loop in gc.get_objects()
+        if isinstance(loop, asyncio.AbstractEventLoop) and loop.is_running() and getattr(loop, "_thread_id", None)
+    }
+
+
+def task_stacks(target="all"):
+    """Text dump of the asyncio tasks of every matching thread, with the coroutine chain each one is awaiting."""
+    names = thread_names()
+    lines = []
+    for ident, loop in running_loops().items():
+        name = names.get(ident, str(ident))
+        if not thread_matches(target, name):
+            continue
+        # all_tasks() copies the task set and retries if the loop changes it meanwhile
+        tasks = sorted(asyncio.all_tasks(loop), key=lambda task: task.get_name())
+        lines.append(f"== {name}: {len(tasks)} tasks")
+        for task in tasks:
+            coro = task.get_coro()
+            lines.append(f"-- {task.get_name()}: {getattr(coro, '__qualname__', coro)}")
+            for frame in task.get_stack(limit=TASK_STACK_LIMIT):
+                code = frame.f_code
+                lines.append(f"     {code.co_filename}:{frame.f_lineno} in {getattr(code, 'co_qualname', code.co_name)}")
+    return "\n".join(lines) + "\n" if lines else f"No running asyncio loop in {target}.\n"
+
+
+def pstats_data(stacks, interval):
+    """Samples turned into the dict pstats.Stats loads: time is samples x interval, call counts are sample counts."""
+    stats = {}
+    for (_, stack), n in stacks.items():
+        seconds = n * interval
+        seen = set()
+        for i, func in enumerate(stack):
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            # Recursive frames count once towards cumulative time
+            if func not in seen:
+                seen.add(func)
+                entry[0] += n
+                entry[1] += n
+                entry[3] += seconds
+            if i:
+                cc, nc, tt, ct = entry[4].get(stack[i - 1], (0, 0, 0.0, 0.0))
+                leaf = seconds if i == len(stack) - 1 else 0.0
+                entry[4][stack[i - 1]] = (cc + n, nc + n, tt + leaf, ct + seconds)
+        if stack:
+            stats[stack[-1]][2] += seconds
+    return {func: (cc, nc, tt, ct, callers) for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def folded_lines(stacks):
+    # "thread;outer (file:line);...;inner (file:line) count"
+    for (thread, stack), n in sorted(stacks.items(), key=lambda item: -item[1]):
+        frames = [f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack]
+        yield ";".join([thread] + frames) + f" {n}\n"
+
+
+class Sampler:
+    """Walks the stacks of the target threads every interval from a thread of its own.
+
+    Unlike cProfile it adds no cost to the sampled code and can attach to a
+    thread that is already running; the price is that short calls are only
+    seen in proportion to how often they run.
+    """
+
+    def __init__(self, target="all", interval=PROFILE_INTERVAL_MS / 1000, max_seconds=PROFILE_MAX_SECONDS):
+        self.target = target
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.tasks_at_start = ""
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self.tasks_at_start = task_stacks(self.target)
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            names = thread_names()
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident)
+                if ident != own and name and thread_matches(self.target, name):
+                    self.stacks[(name, _stack(frame))] += 1
+            self.samples += 1
+            if time.monotonic() >= deadline:
+                print(f"⏱️ Profiling {self.target} hit PROFILE_MAX_SECONDS, stopping.")
+                threading.Thread(target=_stop_expired, args=(self,), daemon=True).start()
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stopped_at = time.time()
+
+    def status(self):
+        return {
+            "running": self.stopped_at is None,
+            "target": self.target,
+            "interval_ms": self.interval * 1000,
+            "started_at": int(self.started_at),
+            "seconds": round((self.stopped_at or time.time()) - self.started_at, 1),
+            "samples": self.samples,
+        }
+
+    def sample_seconds(self):
+        # Wall time per sample; longer than the interval when the sampler has to wait for the GIL
+        elapsed = (self.stopped_at or time.time()) - self.started_at
+        return max(self.interval, elapsed / self.samples) if self.samples else self.interval
+
+    def write(self, directory=PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', self.target)}_{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}")
+        files = {"pstats": f"{stem}.pstats", "folded": f"{stem}.folded", "tasks": f"{stem}.tasks.txt"}
+        with open(files["pstats"], "wb") as f:
+            marshal.dump(pstats_data(self.stacks, self.sample_seconds()), f)
+        with open(files["folded"], "w", encoding="utf-8") as f:
+            f.writelines(folded_lines(self.stacks))
+        with open(files["tasks"], "w", encoding="utf-8") as f:
+            f.write(f"# When sampling started\n{self.tasks_at_start}\n# When sampling stopped\n{task_stacks(self.target)}")
+        return files
+
+
+# One run per process at a time
+def start(target="all", interval_ms=None, max_seconds=None):
+    global _active
+    with _active_lock:
+        if target not in ("all", "main") and target not in thread_names().values():
+            raise LookupError(f"No thread named {target}")
+        if _active is not None:
+            raise RuntimeError(f"Already profiling {_active.target}")
+        _active = Sampler(target, (interval_ms or PROFILE_INTERVAL_MS) / 1000, max_seconds or PROFILE_MAX_SECONDS)
+        _active.start()
+    print(f"⏱️ Profiling {target} every {_active.interval * 1000:g} ms.")
+    return _active.status()
+
+
+def stop():
+    global _active
+    with _active_lock:
+        if _active is None:
+            raise RuntimeError("Not profiling")
+        sampler, _active = _active, None
+    sampler.stop()
+    files = sampler.write()
+    print(f"⏱️ Profile of {sampler.target} written: {files['pstats']}")
+    return dict(sampler.status(), files=files)
+
+
+def _stop_expired(sampler):
+    # Unless it was stopped by hand in the meantime
+    if _active is sampler:
+        try:
+            stop()
+        except RuntimeError:
+            pass
+
+
+def status():
+    sampler = _active
+    return dict(sampler.status() if sampler else {"running": False}, threads=sorted(set(thread_names().values())))
+
+
+def handle(method, path, query):
+    """/profile requests from the metrics endpoint; (HTTP status, content type, body)."""
+    target = query.get("target", "all")
+    try:
+        if method == "GET" and path == "/profile":
+            return 200, "application/json", json.dumps(status())
+        if method == "GET" and path == "/profile/tasks":
+            return 200, "text/plain; charset=utf-8", task_stacks(target)
+        if method == "POST" and path == "/profile/start":
+            interval = float(query["interval_ms"]) if "interval_ms" in query else None
+            seconds = int(query["seconds"]) if "seconds" in query else None
+            return 200, "application/json", json.dumps(start(target, interval, seconds))
+        if method == "POST" and path == "/profile/stop":
+            return 200, "application/json", json.dumps(stop())
+    except LookupError as e:
+        return 404, "application/json", json.dumps({"error": str(e)})
+    except (RuntimeError, ValueError) as e:
+        return 409, "application/json", json.dumps({"error": str(e)})
+    return 404, "application/json", json.dumps({"error": f"Unknown request: {method} {path}"})
+
+
+def request(method, path, port=None, **params):
+    """(HTTP status, body) of a /profile request to the metrics endpoint on port (default METRICS_PORT)."""
+    from core.metrics import METRICS_HOST, METRICS_PORT
+    url = f"http://{METRICS_HOST}:{port or METRICS_PORT}{path}"
+    if params:
+        url += "?" + urllib.parse.urlencode(params)
+    req = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+class RemoteProfiler:
+    """start/stop/status/task_stacks of this module, run in another process through its metrics endpoint."""
+
+    ERRORS = {404: LookupError, 409: RuntimeError}
+
+    def __init__(self, port=None):
+        self.port = port
+
+    def _call(self, method, path, **params):
+        code, body = request(method, path, self.port, **params)
+        if code != 200:
+            raise self.ERRORS.get(code, RuntimeError)(json.loads(body).get("error", body))
+        return body
+
+    def start(self, target="all", interval_ms=None, max_seconds=None):
+        params = {key: value for key, value in (("interval_ms", interval_ms), ("seconds", max_seconds)) if value}
+        return json.loads(self._call("POST", "/profile/start", target=target, **params))
+
+    def stop(self):
+        return json.loads(self._call("POST", "/profile/stop"))
+
+    def status(self):
+        return json.loads(self._call("GET", "/profile"))
+
+    def task_stacks(self, target="all"):
+        return self._call("GET", "/profile/tasks", target=target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile a running component through its metrics endpoint")
+    parser.add_argument("command", choices=["list", "start", "stop", "tasks"])
+    parser.add_argument("target", nargs="?", default="all", help='Thread name, e.g. "TX Worker", or "all"')
+    parser.add_argument("--interval-ms", type=float, default=PROFILE_INTERVAL_MS)
+    parser.add_argument("--seconds", type=int, default=PROFILE_MAX_SECONDS, help="Stop by itself after this long")
+    parser.add_argument("--port", type=int, help="Metrics port of the process (default METRICS_PORT; see supervisor --status)")
+    args = parser.parse_args()
+    remote = RemoteProfiler(args.port)
+    try:
+        if args.command == "list":
+            print(json.dumps(remote.status()))
+        elif args.command == "start":
+            print(json.dumps(remote.start(args.target, args.interval_ms, args.seconds)))
+        elif args.command == "stop":
+            print(json.dumps(remote.stop()))
+        else:
+            print(remote.task_stacks(args.target), end="")
+    except (LookupError, RuntimeError) as e:
+        print(f"⚠️ {e}")
+        sys.exit(1)
+    except urllib.error.URLError as e:
+        print(f"❌ No metrics endpoint reachable ({e.reason}). Is the controller running with METRICS_PORT set?")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# serialization.py
+import json
+import os
+
+from core import durability
+
+# Optional accelerators; plain compact JSON is used when they are missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Format for new writes: "json" (compact), "orjson" (same bytes, faster), "msgpack" (binary), "auto" prefers orjson.
+# Reads detect the format of each file, so existing indented JSON files keep working.
+DATA_FORMAT = os.getenv("DATA_FORMAT", "auto").strip().lower()
+
+_JSON_START = frozenset(b'{["-0123456789tfn')
+
+
+class JsonFormat:
+    name = "json"
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def loads(raw):
+        return json.loads(raw)
+
+
+class OrjsonFormat:
+    name = "orjson"
+
+    @staticmethod
+    def dumps(data):
+        # Non-string keys are stringified, as json.dumps does
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    @staticmethod
+    def loads(raw):
+        return orjson.loads(raw)
+
+
+class MsgpackFormat:
+    name = "msgpack"
+
+    @staticmethod
+    def dumps(data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def loads(raw):
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+FORMATS = {"json": JsonFormat, "orjson": OrjsonFormat, "msgpack": MsgpackFormat}
+AVAILABLE = {"json": True, "orjson": orjson is not None, "msgpack": msgpack is not None}
+
+
+def get_format(name=None):
+    name = name or DATA_FORMAT
+    if name == "auto":
+        name = "orjson" if AVAILABLE["orjson"] else "json"
+    if name not in FORMATS:
+        raise ValueError(f"Unknown DATA_FORMAT: {name}")
+    if not AVAILABLE[name]:
+        print(f"⚠️ DATA_FORMAT={name} but the package is not installed, writing compact JSON.")
+        return JsonFormat
+    return FORMATS[name]
+
+
+_writer = get_format()
+
+
+def detect(raw):
+    # Every data file holds an object or a list, and msgpack never encodes those with a JSON-like first byte
+    stripped = raw.lstrip()
+    if not stripped or stripped[0] in _JSON_START:
+        return OrjsonFormat if AVAILABLE["orjson"] else JsonFormat
+    if not AVAILABLE["msgpack"]:
+        raise ValueError("File is not JSON and msgpack is not installed")
+    return MsgpackFormat
+
+
+def dumps(data):
+    return _writer.dumps(data)
+
+
+def loads(raw):
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    return detect(raw).loads(raw)
+
+
+def read_file(path, default=None):
+    path = durability.read_path(path)
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_file(path, data, sync=True, defer=True):
+    # Temp file + fsync + rename, as configured by DURABILITY
+    durability.atomic_write(path, dumps(data), sync=sync, defer=defer)
@@ -0,0 +1,62 @@
+# shards.py
+import os
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from filelock import FileLock
+
+from paths import WALLET_FILE, LOCKFILE, SHARD_DIR
+from core.lock_metrics import instrument
+
+# Wallet state is split into this many shards by user id, each with its own files and lock.
+# Every process sharing a data directory must use the same value; 1 keeps the single-file layout.
+WALLET_SHARDS = max(1, int(os.getenv("WALLET_SHARDS", "16")))
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def shard_of(user_id, shards=None):
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(str(user_id).encode("utf-8")) % (shards or WALLET_SHARDS)
+
+
+def shard_file(base_path, shard, shards=None):
+    """Per-shard variant of a data file, e.g. shards/wallet_store_003.json."""
+    if (shards or WALLET_SHARDS) == 1:
+        return base_path
+    name, ext = os.path.splitext(os.path.basename(base_path))
+    return os.path.join(SHARD_DIR, f"{name}_{shard:03d}{ext}")
+
+
+def shard_lock(shard):
+    # One FileLock instance per file, so nested acquisitions in the same thread are reentrant
+    path = LOCKFILE if WALLET_SHARDS == 1 else shard_file(WALLET_FILE, shard) + ".lock"
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock = _locks[path] = FileLock(path)
+    return lock
+
+
+@contextmanager
+def _acquire(shards):
+    # Always in ascending shard order, so two multi-shard holders can never deadlock
+    with ExitStack() as stack:
+        for shard in sorted(set(shards)):
+            stack.enter_context(shard_lock(shard))
+        yield
+
+
+def shard_locks(*user_ids, site=None):
+    """Lock the shards holding the given users; unrelated users are not blocked.
+
+    With LOCK_METRICS on, wait and hold times are recorded under site (default: the caller's function).
+    """
+    return instrument(_acquire(shard_of(uid) for uid in user_ids), site)
+
+
+def ledger_lock(site=None):
+    """Lock every shard, for whole-ledger work such as a worker pass or recovery."""
+    return instrument(_acquire(range(WALLET_SHARDS)), site)
@@ -0,0 +1,84 @@
+# snapshot.py
+import os
+import threading
+import time
+
+from paths import SNAPSHOT_FILE, OUTFLOW_SNAPSHOT_FILE
+from core.shards import shard_file
+from core import serialization, durability
+
+# Readers parse a shard snapshot only when a new version has been published
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def snapshot_path(shard):
+    return shard_file(SNAPSHOT_FILE, shard)
+
+
+def outflow_path(shard):
+    return shard_file(OUTFLOW_SNAPSHOT_FILE, shard)
+
+
+def _file_key(stat):
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+
+def publish_snapshot(shard, wallets, outflow):
+    """Publish a new immutable version of a shard's wallets and pending outflow.
+
+    The version is written to a temp file and renamed over the old one, so a
+    reader sees either the previous or the new version, never a partial one.
+    Snapshots are rebuilt from the ledger files, so they are not fsynced.
+    Caller holds the shard's lock.
+    """
+    serialization.write_file(snapshot_path(shard), {"version": time.time_ns(), "wallets": wallets, "outflow": outflow}, sync=False)
+
+
+def publish_outflow(shard, outflow):
+    """Publish a shard's pending outflow on its own, on top of its current wallet snapshot.
+
+    Submits only change the outflow, so they write this small file instead of
+    the whole shard. It names the wallet snapshot it was taken against and is
+    ignored once a newer one is published, which carries its own outflow.
+    Caller holds the shard's lock.
+    """
+    try:
+        # Inside a group commit a just-published snapshot still sits in its temp file; the rename keeps its identity
+        base = _file_key(os.stat(durability.read_path(snapshot_path(shard))))
+    except FileNotFoundError:
+        return
+    serialization.write_file(outflow_path(shard), {"base": base, "outflow": outflow}, sync=False)
+
+
+def _read_cached(path):
+    # (file key, parsed content), parsed again only when the file was replaced; None if missing
+    try:
+        with open(path, "rb") as f:
+            key = _file_key(os.fstat(f.fileno()))
+            with _cache_lock:
+                cached = _cache.get(path)
+            if cached is not None and cached[0] == key:
+                return cached
+            cached = (key, serialization.loads(f.read()))
+    except (FileNotFoundError, PermissionError):
+        return None
+    with _cache_lock:
+        _cache[path] = cached
+    return cached
+
+
+def read_snapshot(shard):
+    # Never takes a lock; None when the shard has not been published yet
+    cached = _read_cached(snapshot_path(shard))
+    if cached is None:
+        return None
+    key, snapshot = cached
+    outflow = _read_cached(outflow_path(shard))
+    if outflow is not None and outflow[1].get("base") == key:
+        return dict(snapshot, outflow=outflow[1]["outflow"])
+    return snapshot
+
+
+def snapshot_exists(shard):
+    return os.path.exists(snapshot_path(shard))
@@ -0,0 +1,896 @@
+# storage.py
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from filelock import FileLock
+
+from paths import WALLET_FILE, WALLET_STATE_FILE, PENDING_FILE, PENDING_OUTFLOW_FILE, SHARD_DIR, TX_LOG_FILE, TX_LOG_DIR, REJECTED_LOG_FILE, LEDGER_DB
+from core.tx_log import SegmentedTxLog, INDEX_NAME
+from core.tx_index import TxIdIndex
+from core.shards import WALLET_SHARDS, shard_of, shard_file, ledger_lock
+from core.snapshot import publish_snapshot, publish_outflow, read_snapshot, snapshot_exists
+from core import serialization
+from core.durability import DURABILITY, group_commit, grouped
+
+# "json" keeps the classic whole-file ledger, "sqlite" uses the embedded WAL database
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+# Recipients one multitip tx may pay
+MULTITIP_MAX_OUTPUTS = int(os.getenv("MULTITIP_MAX_OUTPUTS", "25"))
+# SQLite's own fsync policy for each DURABILITY level; WAL commits are already grouped by SQLite
+SQLITE_SYNCHRONOUS = {"none": "OFF", "batch": "NORMAL", "every": "FULL"}
+
+
+def read_json_file(path):
+    # Any format written by core.serialization, including the old indented JSON
+    return serialization.read_file(path, {"txs": []} if "pending" in path else {})
+
+
+def write_json_file(path, data):
+    serialization.write_file(path, data)
+
+
+def stamp_submitted(tx):
+    # Lets the worker bound how long a tx with a nonce gap is held; set after the tx_id so ids are unaffected
+    tx.setdefault("submitted_at", round(time.time(), 3))
+
+
+def pending_debit(tx):
+    # A mint credits its user_id instead of spending from it
+    return 0 if tx.get("type") == "mint" else tx.get("amount", 0)
+
+
+def outflow_totals(txs):
+    totals = {}
+    for tx in txs:
+        debit = pending_debit(tx)
+        if debit:
+            totals[tx.get("user_id")] = totals.get(tx.get("user_id"), 0) + debit
+    return totals
+
+
+def multitip_error(tx):
+    # None when a multitip's outputs are well-formed and add up to its amount
+    outputs = tx.get("outputs")
+    if not isinstance(outputs, list) or not outputs:
+        return "Missing outputs"
+    if len(outputs) > MULTITIP_MAX_OUTPUTS:
+        return f"Too many outputs ({len(outputs)} > {MULTITIP_MAX_OUTPUTS})"
+    for out in outputs:
+        if not isinstance(out, dict) or not out.get("to") or not isinstance(out.get("amount"), int) or out["amount"] <= 0:
+            return "Invalid output"
+    if sum(out["amount"] for out in outputs) != tx.get("amount"):
+        return "Outputs do not add up to the amount"
+    return None
+
+
+def next_nonce(wallet_nonce, pending_nonces):
+    # Continue the sender's pending chain only while it runs unbroken from the wallet's nonce;
+    # after a rejection left a gap, start over from the wallet so new txs are not held behind it
+    pending = {n for n in pending_nonces if isinstance(n, int)}
+    if pending and pending == set(range(wallet_nonce + 1, max(pending) + 1)):
+        return max(pending) + 1
+    return wallet_nonce + 1
+
+
+def reserve_transfer(tx, wallet, outflow, pending_nonces, make_tx_id):
+    # Shared by every backend: balance check against the pending outflow, then the next free nonce
+    if tx.get("type") == "multitip" and multitip_error(tx):
+        return {"ok": False, "status": "invalid_outputs", "tx_id": None, "nonce": None, "balance": None}
+    wallet = wallet or {}
+    balance = wallet.get("carp_balance", 0) - outflow
+    debit = pending_debit(tx)
+    if debit > balance:
+        return {"ok": False, "status": "insufficient_balance", "tx_id": None, "nonce": None, "balance": balance}
+    tx["nonce"] = next_nonce(wallet.get("nonce", 0), pending_nonces)
+    tx["tx_id"] = make_tx_id(tx)
+    return {"ok": True, "status": "queued", "tx_id": tx["tx_id"], "nonce": tx["nonce"], "balance": balance - debit}
+
+
+def outflow_mismatches(stored, expected):
+    # {user_id: (stored, expected)} for every user whose aggregate drifted
+    return {
+        uid: (stored.get(uid, 0), expected.get(uid, 0))
+        for uid in set(stored) | set(expected)
+        if stored.get(uid, 0) != expected.get(uid, 0)
+    }
+
+
+class LedgerBatch:
+    """Effects of one worker pass, staged in memory and committed in one go."""
+
+    def __init__(self, wallets):
+        self.wallets = wallets
+        self.dirty_wallets = set()
+        self.log_entries = []
+        self.rejected = []
+        self.removed_tx_ids = set()
+        self.remaining_txs = []
+        self.tickets = None
+        self.stats = {}
+
+    def touch(self, *user_ids):
+        self.dirty_wallets.update(user_ids)
+
+    def settle(self, tx):
+        self.log_entries.append(tx)
+        self.removed_tx_ids.add(tx.get("tx_id"))
+
+    def reject(self, tx, reason):
+        self.rejected.append((tx, reason))
+        self.removed_tx_ids.add(tx.get("tx_id"))
+
+
+def read_outflow_file(path):
+    return serialization.read_file(path, {})
+
+
+def split_by_shard(items, user_id_of):
+    # {shard: [item, ...]} using the same user id that decides where the item is stored
+    shards = {}
+    for item in items:
+        shards.setdefault(shard_of(user_id_of(item)), []).append(item)
+    return shards
+
+
+def read_wallet_shards(shards=None):
+    wallets = {}
+    for shard in range(WALLET_SHARDS) if shards is None else shards:
+        wallets.update(read_json_file(shard_file(WALLET_FILE, shard)))
+    return wallets
+
+
+def read_pending_shards():
+    txs = [tx for shard in range(WALLET_SHARDS) for tx in read_json_file(shard_file(PENDING_FILE, shard)).get("txs", [])]
+    # Shards are read one after the other; restore submission order across them
+    txs.sort(key=lambda tx: tx.get("submitted_at", 0))
+    return txs
+
+
+def reshard_json_files():
+    """Move wallets and the pending pool to the WALLET_SHARDS layout if the data dir uses another one.
+
+    A data dir without a layout marker uses the classic single files. New files
+    and the marker are written before the old files are retired, so a crash
+    halfway just redoes the move on the next start.
+    """
+    layout_file = os.path.join(SHARD_DIR, "layout.json")
+
+    def current_layout():
+        return read_json_file(layout_file).get("shards", 1) if os.path.exists(layout_file) else 1
+
+    if current_layout() == WALLET_SHARDS:
+        return False
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    with FileLock(os.path.join(SHARD_DIR, "layout.lock")):
+        old = current_layout()
+        if old == WALLET_SHARDS:
+            return False
+        old_files = {base: [shard_file(base, s, old) for s in range(old)] for base in (WALLET_FILE, PENDING_FILE, PENDING_OUTFLOW_FILE)}
+        wallets = {}
+        for path in old_files[WALLET_FILE]:
+            wallets.update(read_json_file(path))
+        txs = [tx for path in old_files[PENDING_FILE] for tx in read_json_file(path).get("txs", [])]
+
+        wallet_shards = split_by_shard(wallets.items(), lambda item: item[0])
+        pending_shards = split_by_shard(txs, lambda tx: tx.get("user_id"))
+        outflow = outflow_totals(txs)
+        # Durable in one group commit before any old file is retired
+        with group_commit():
+            for shard in range(WALLET_SHARDS):
+                write_json_file(shard_file(WALLET_FILE, shard), dict(wallet_shards.get(shard, [])))
+                write_json_file(shard_file(PENDING_FILE, shard), {"txs": pending_shards.get(shard, [])})
+                write_json_file(shard_file(PENDING_OUTFLOW_FILE, shard), {uid: v for uid, v in outflow.items() if shard_of(uid) == shard})
+            write_json_file(layout_file, {"shards": WALLET_SHARDS, "updated_at": int(time.time())})
+
+        for path in (p for paths in old_files.values() for p in paths):
+            if os.path.exists(path):
+                if old == 1:
+                    os.replace(path, path + ".migrated")
+                else:
+                    os.remove(path)
+    print(f"📦 Resharded wallets from {old} to {WALLET_SHARDS} shard(s): {len(wallets)} wallets, {len(txs)} pending txs")
+    return True
+
+
+class JsonStorage:
+    """Whole-file JSON ledger, with wallets, pending pool and outflow split into WALLET_SHARDS files.
+
+    Each shard is guarded by its own lock (core.shards), so callers only lock
+    the shards of the users they touch. A worker pass locks all of them.
+    Every write republishes the shard's snapshot (core.snapshot) for lock-free reads;
+    submits only republish the shard's pending outflow.
+    Writing methods run in one group commit (core.durability), so all files they
+    touch are fsynced together and renamed in place only once every one is on disk.
+    """
+
+    name = "json"
+
+    def __init__(self):
+        resharded = reshard_json_files()
+        self.tx_log = SegmentedTxLog()
+        self.tx_index = TxIdIndex(rebuild_source=self._known_tx_ids)
+        if not os.path.exists(shard_file(PENDING_OUTFLOW_FILE, 0)):
+            self.rebuild_pending_outflow()
+        if resharded or not snapshot_exists(0):
+            with ledger_lock():
+                self._publish(range(WALLET_SHARDS))
+
+    def _known_tx_ids(self):
+        for tx in read_pending_shards():
+            yield tx.get("tx_id")
+        for entry in self.tx_log.iter_entries():
+            yield entry.get("tx_id")
+
+    def load_document(self, path):
+        if path == TX_LOG_FILE:
+            return {"log": list(self.tx_log.iter_entries())}
+        if path == WALLET_FILE:
+            return read_wallet_shards()
+        if path == PENDING_FILE:
+            return {"txs": read_pending_shards()}
+        return read_json_file(path)
+
+    @grouped
+    def save_document(self, path, data):
+        if path == TX_LOG_FILE:
+            self.tx_log.replace_all(data.get("log", []))
+            self.tx_index.rebuild(self._known_tx_ids())
+            # Sequence numbers restart with the new log; the wallets are taken as current
+            self.mark_log_applied(self.log_position()[0])
+        elif path == WALLET_FILE:
+            self._write_wallet_shards(data, range(WALLET_SHARDS))
+            self._publish(range(WALLET_SHARDS), wallets=data)
+        elif path == PENDING_FILE:
+            txs = data.get("txs", [])
+            self._write_pending_shards(txs, range(WALLET_SHARDS))
+            self.rebuild_pending_outflow(txs)
+        else:
+            write_json_file(path, data)
+
+    def _write_wallet_shards(self, wallets, shards):
+        by_shard = split_by_shard(wallets.items(), lambda item: item[0])
+        for shard in shards:
+            write_json_file(shard_file(WALLET_FILE, shard), dict(by_shard.get(shard, [])))
+
+    def _write_pending_shards(self, txs, shards):
+        by_shard = split_by_shard(txs, lambda tx: tx.get("user_id"))
+        for shard in shards:
+            write_json_file(shard_file(PENDING_FILE, shard), {"txs": by_shard.get(shard, [])})
+
+    def _publish(self, shards, wallets=None, outflow=None):
+        # wallets/outflow cover at least the given shards when passed; otherwise the shard files are read
+        wallet_shards = split_by_shard(wallets.items(), lambda item: item[0]) if wallets is not None else None
+        outflow_shards = split_by_shard(outflow.items(), lambda item: item[0]) if outflow is not None else None
+        for shard in shards:
+            publish_snapshot(
+                shard,
+                dict(wallet_shards.get(shard, [])) if wallet_shards is not None else read_json_file(shard_file(WALLET_FILE, shard)),
+                dict(outflow_shards.get(shard, [])) if outflow_shards is not None else read_outflow_file(shard_file(PENDING_OUTFLOW_FILE, shard)),
+            )
+
+    # Lock-free reads
+    def read_snapshot(self, user_id):
+        # (wallet, pending outflow) from the shard's last published version, None if there is none yet
+        snapshot = read_snapshot(shard_of(user_id))
+        if snapshot is None:
+            return None
+        return snapshot["wallets"].get(user_id), snapshot["outflow"].get(user_id, 0)
+
+    def snapshot_wallets(self):
+        wallets = {}
+        for shard in range(WALLET_SHARDS):
+            snapshot = read_snapshot(shard)
+            if snapshot is None:
+                return None
+            wallets.update(snapshot["wallets"])
+        return wallets
+
+    # Wallets
+    def get_wallet(self, user_id):
+        return read_json_file(shard_file(WALLET_FILE, shard_of(user_id))).get(user_id)
+
+    @grouped
+    def put_wallet(self, user_id, wallet):
+        shard = shard_of(user_id)
+        path = shard_file(WALLET_FILE, shard)
+        wallets = read_json_file(path)
+        wallets[user_id] = wallet
+        write_json_file(path, wallets)
+        self._publish([shard], wallets=wallets)
+
+    def load_wallets(self, user_ids):
+        # Whole shards are loaded, since a shard file is rewritten as a whole on commit
+        return read_wallet_shards({shard_of(uid) for uid in user_ids})
+
+    # Mempool
+    # Per-user pending outflow is kept next to each pool shard so lookups never scan it
+    def pending_outflow(self, user_id):
+        return read_outflow_file(shard_file(PENDING_OUTFLOW_FILE, shard_of(user_id))).get(user_id, 0)
+
+    @grouped
+    def rebuild_pending_outflow(self, txs=None, shards=None, wallets=None):
+        if txs is None:
+            txs = read_pending_shards()
+        totals = outflow_totals(txs)
+        shards = range(WALLET_SHARDS) if shards is None else shards
+        for shard in shards:
+            write_json_file(
+                shard_file(PENDING_OUTFLOW_FILE, shard),
+                {uid: amount for uid, amount in totals.items() if shard_of(uid) == shard}
+            )
+        self._publish(shards, wallets=wallets, outflow=totals)
+
+    def verify_pending_outflow(self):
+        stored = {}
+        for shard in range(WALLET_SHARDS):
+            stored.update(read_outflow_file(shard_file(PENDING_OUTFLOW_FILE, shard)))
+        return outflow_mismatches(stored, outflow_totals(read_pending_shards()))
+
+    @grouped
+    def append_pending(self, tx):
+        # The tx_id index covers the pending pool and the whole log history
+        if tx["tx_id"] in self.tx_index:
+            return False
+        shard = shard_of(tx["user_id"])
+        path = shard_file(PENDING_FILE, shard)
+        data = read_json_file(path)
+        txs = data.setdefault("txs", [])
+        if any(t["user_id"] == tx["user_id"] and t.get("nonce") == tx.get("nonce") for t in txs):
+            return False
+        stamp_submitted(tx)
+        txs.append(tx)
+        write_json_file(path, data)
+        self.tx_index.add(tx["tx_id"])
+        debit = pending_debit(tx)
+        if debit:
+            outflow_path = shard_file(PENDING_OUTFLOW_FILE, shard)
+            outflow = read_outflow_file(outflow_path)
+            outflow[tx["user_id"]] = outflow.get(tx["user_id"], 0) + debit
+            write_json_file(outflow_path, outflow)
+            publish_outflow(shard, outflow)
+        return True
+
+    @grouped
+    def submit_transfer(self, tx, make_tx_id):
+        # One read and one write of the sender's pool shard and outflow shard
+        uid = tx["user_id"]
+        shard = shard_of(uid)
+        path = shard_file(PENDING_FILE, shard)
+        outflow_path = shard_file(PENDING_OUTFLOW_FILE, shard)
+        data = read_json_file(path)
+        txs = data.setdefault("txs", [])
+        outflow = read_outflow_file(outflow_path)
+        wallets = read_json_file(shard_file(WALLET_FILE, shard))
+        nonces = [t.get("nonce") for t in txs if t.get("user_id") == uid]
+        result = reserve_transfer(tx, wallets.get(uid), outflow.get(uid, 0), nonces, make_tx_id)
+        if not result["ok"]:
+            return result
+        if tx["tx_id"] in self.tx_index:
+            return dict(result, ok=False, status="duplicate")
+        stamp_submitted(tx)
+        txs.append(tx)
+        write_json_file(path, data)
+        self.tx_index.add(tx["tx_id"])
+        if pending_debit(tx):
+            outflow[uid] = outflow.get(uid, 0) + pending_debit(tx)
+            write_json_file(outflow_path, outflow)
+            publish_outflow(shard, outflow)
+        return result
+
+    def has_tx_id(self, tx_id):
+        return tx_id in self.tx_index
+
+    # Logs
+    @grouped
+    def append_log(self, entry):
+        self.tx_log.append(entry)
+        self.tx_index.add(entry.get("tx_id"))
+
+    def log_position(self):
+        return self.tx_log.position()
+
+    def user_history(self, user_id, limit=10, offset=0):
+        # (total, logged txs newest first) through the per-user index, without any lock
+        return self.tx_log.user_history_count(user_id), self.tx_log.user_history(user_id, limit, offset)
+
+    def iter_log(self, since_seq=0):
+        return self.tx_log.iter_entries(since_seq)
+
+    def applied_log_seq(self):
+        # Last log seq reflected in the wallet shards, None before the marker was introduced
+        return read_json_file(WALLET_STATE_FILE).get("last_seq")
+
+    @grouped
+    def mark_log_applied(self, seq):
+        write_json_file(WALLET_STATE_FILE, {"last_seq": seq, "updated_at": int(time.time())})
+
+    @grouped
+    def append_rejected(self, entry, reason):
+        rej_log = read_json_file(REJECTED_LOG_FILE)
+        rej_log.setdefault("rejected", []).append({"reason": reason, "tx": entry})
+        write_json_file(REJECTED_LOG_FILE, rej_log)
+        # Rejected txs leave the pool without being logged, so they may be submitted again
+        self.tx_index.discard(entry.get("tx_id"))
+
+    @grouped
+    def commit_batch(self, batch):
+        # Caller holds every shard lock. One write per touched file, no matter how many txs the batch holds
+        records = self.tx_log.append_many(batch.log_entries)
+        if records:
+            self.tx_index.add_many(entry.get("tx_id") for entry in batch.log_entries)
+        if batch.rejected:
+            rej_log = read_json_file(REJECTED_LOG_FILE)
+            rej_log.setdefault("rejected", []).extend({"reason": reason, "tx": tx} for tx, reason in batch.rejected)
+            write_json_file(REJECTED_LOG_FILE, rej_log)
+            self.tx_index.discard_many(tx.get("tx_id") for tx, _ in batch.rejected)
+        wallet_shards = {shard_of(uid) for uid in batch.dirty_wallets}
+        if wallet_shards:
+            # batch.wallets holds every wallet of the shards it was loaded from
+            self._write_wallet_shards(batch.wallets, wallet_shards)
+        if records:
+            # A crash before this line makes recovery replay the batch; the nonces make that a no-op
+            self.mark_log_applied(records[-1]["seq"])
+        pending_shards = set()
+        if batch.removed_tx_ids:
+            pending_shards = {shard_of(tx.get("user_id")) for tx in batch.log_entries}
+            pending_shards.update(shard_of(tx.get("user_id")) for tx, _ in batch.rejected)
+            self._write_pending_shards(batch.remaining_txs, pending_shards)
+            self.rebuild_pending_outflow(batch.remaining_txs, shards=pending_shards, wallets=batch.wallets)
+        if wallet_shards - pending_shards:
+            # Shards that only received credits; remaining_txs is the whole pool, so its totals cover them too
+            self._publish(wallet_shards - pending_shards, wallets=batch.wallets, outflow=outflow_totals(batch.remaining_txs))
+
+
+class SqliteStorage:
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS wallets (
+            user_id TEXT PRIMARY KEY,
+            name TEXT,
+            carp_balance INTEGER NOT NULL DEFAULT 0,
+            nonce INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS pending (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tx_id TEXT UNIQUE,
+            user_id TEXT NOT NULL,
+            nonce INTEGER,
+            amount INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS pending_user_nonce ON pending (user_id, nonce);
+        CREATE TABLE IF NOT EXISTS tx_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tx_id TEXT,
+            user_id TEXT,
+            to_id TEXT,
+            type TEXT,
+            amount INTEGER,
+            data TEXT NOT NULL,
+            logged_at INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS tx_log_tx_id ON tx_log (tx_id);
+        CREATE INDEX IF NOT EXISTS tx_log_user ON tx_log (user_id, seq);
+        CREATE INDEX IF NOT EXISTS tx_log_to ON tx_log (to_id, seq);
+        CREATE TABLE IF NOT EXISTS tx_log_recipients (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rejected (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            reason TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pending_outflow (
+            user_id TEXT PRIMARY KEY,
+            amount INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path=LEDGER_DB):
+        self.path = path
+        self._local = threading.local()
+        self.conn.executescript(self.SCHEMA)
+        if not any(column[1] == "logged_at" for column in self.conn.execute("PRAGMA table_info(tx_log)")):
+            # Databases created before history showed dates; older entries get their submit time where they have one
+            with self.transaction() as conn:
+                conn.execute("ALTER TABLE tx_log ADD COLUMN logged_at INTEGER")
+                conn.execute(
+                    "UPDATE tx_log SET logged_at = CAST(json_extract(data, '$.submitted_at') AS INTEGER) "
+                    "WHERE json_extract(data, '$.submitted_at') IS NOT NULL"
+                )
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'pending_outflow'").fetchone() is None:
+            # Databases created before the aggregate existed
+            self.rebuild_pending_outflow()
+
+    @property
+    def conn(self):
+        # sqlite3 connections may not be shared between threads, and every bot runs in its own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS.get(DURABILITY, 'NORMAL')}")
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        return _SqliteTransaction(self.conn)
+
+    # Compatibility layer for load_json/save_json callers
+    def load_document(self, path):
+        if path == WALLET_FILE:
+            rows = self.conn.execute("SELECT user_id, name, carp_balance, nonce FROM wallets")
+            return {uid: {"name": name, "carp_balance": bal, "nonce": nonce} for uid, name, bal, nonce in rows}
+        if path == PENDING_FILE:
+            rows = self.conn.execute("SELECT data FROM pending ORDER BY seq")
+            return {"txs": [json.loads(data) for (data,) in rows]}
+        if path == TX_LOG_FILE:
+            rows = self.conn.execute("SELECT data FROM tx_log ORDER BY seq")
+            return {"log": [json.loads(data) for (data,) in rows]}
+        if path == REJECTED_LOG_FILE:
+            rows = self.conn.execute("SELECT reason, data FROM rejected ORDER BY seq")
+            return {"rejected": [{"reason": reason, "tx": json.loads(data)} for reason, data in rows]}
+        return read_json_file(path)
+
+    def save_document(self, path, data):
+        if path == WALLET_FILE:
+            self._replace_wallets(data)
+        elif path == PENDING_FILE:
+            self._replace_pending(data.get("txs", []))
+        elif path == TX_LOG_FILE:
+            with self.transaction() as conn:
+                conn.execute("DELETE FROM tx_log")
+                self._insert_log(conn, data.get("log", []))
+        elif path == REJECTED_LOG_FILE:
+            with self.transaction() as conn:
+                conn.execute("DELETE FROM rejected")
+                self._insert_rejected(conn, data.get("rejected", []))
+        else:
+            write_json_file(path, data)
+
+    def _replace_wallets(self, wallets):
+        # Only touch the rows that actually changed
+        current = self.load_document(WALLET_FILE)
+        changed = [
+            (uid, w.get("name"), w.get("carp_balance", 0), w.get("nonce", 0))
+            for uid, w in wallets.items()
+            if current.get(uid) != {"name": w.get("name"), "carp_balance": w.get("carp_balance", 0), "nonce": w.get("nonce", 0)}
+        ]
+        removed = [(uid,) for uid in current if uid not in wallets]
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO wallets (user_id, name, carp_balance, nonce) VALUES (?, ?, ?, ?)", changed
+            )
+            conn.executemany("DELETE FROM wallets WHERE user_id = ?", removed)
+
+    def _replace_pending(self, txs):
+        keep = {tx.get("tx_id") for tx in txs}
+        with self.transaction() as conn:
+            existing = {tx_id for (tx_id,) in conn.execute("SELECT tx_id FROM pending")}
+            conn.executemany("DELETE FROM pending WHERE tx_id = ?", [(t,) for t in existing - keep])
+            conn.execute("DELETE FROM pending WHERE tx_id IS NULL")
+            self._insert_pending(conn, [tx for tx in txs if tx.get("tx_id") not in existing or tx.get("tx_id") is None])
+            self._rebuild_outflow(conn)
+
+    @staticmethod
+    def _insert_pending(conn, txs):
+        conn.executemany(
+            "INSERT OR IGNORE INTO pending (tx_id, user_id, nonce, amount, data) VALUES (?, ?, ?, ?, ?)",
+            [(tx.get("tx_id"), tx.get("user_id"), tx.get("nonce"), tx.get("amount", 0), json.dumps(tx)) for tx in txs]
+        )
+
+    @staticmethod
+    def _add_outflow(conn, txs, sign=1):
+        conn.executemany(
+            "INSERT INTO pending_outflow (user_id, amount) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET amount = amount + excluded.amount",
+            [(uid, sign * amount) for uid, amount in outflow_totals(txs).items()]
+        )
+        conn.execute("DELETE FROM pending_outflow WHERE amount = 0")
+
+    @staticmethod
+    def _pending_txs(conn):
+        return [json.loads(data) for (data,) in conn.execute("SELECT data FROM pending ORDER BY seq")]
+
+    def _rebuild_outflow(self, conn):
+        conn.execute("DELETE FROM pending_outflow")
+        self._add_outflow(conn, self._pending_txs(conn))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('pending_outflow', datetime('now'))")
+
+    @staticmethod
+    def _insert_log(conn, entries):
+        sql = "INSERT INTO tx_log (tx_id, user_id, to_id, type, amount, data, logged_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+        now = int(time.time())
+        rows = [
+            (e.get("tx_id"), e.get("user_id"), e.get("to"), e.get("type"), e.get("amount"), json.dumps(e), e.get("logged_at", now))
+            for e in entries
+        ]
+        if not any(e.get("outputs") for e in entries):
+            conn.executemany(sql, rows)
+            return
+        # Multitip recipients are indexed by the seq their row received
+        for entry, row in zip(entries, rows):
+            seq = conn.execute(sql, row).lastrowid
+            if entry.get("outputs"):
+                conn.executemany(
+                    "INSERT OR IGNORE INTO tx_log_recipients (user_id, seq) VALUES (?, ?)",
+                    [(out.get("to"), seq) for out in entry["outputs"]]
+                )
+
+    @staticmethod
+    def _insert_rejected(conn, entries):
+        conn.executemany(
+            "INSERT INTO rejected (reason, data) VALUES (?, ?)",
+            [(e.get("reason"), json.dumps(e.get("tx"))) for e in entries]
+        )
+
+    # Wallets
+    def get_wallet(self, user_id):
+        row = self.conn.execute(
+            "SELECT name, carp_balance, nonce FROM wallets WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "carp_balance": row[1], "nonce": row[2]}
+
+    def put_wallet(self, user_id, wallet):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO wallets (user_id, name, carp_balance, nonce) VALUES (?, ?, ?, ?)",
+            (user_id, wallet.get("name"), wallet.get("carp_balance", 0), wallet.get("nonce", 0))
+        )
+
+    def load_wallets(self, user_ids):
+        user_ids = list(set(user_ids))
+        wallets = {}
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT user_id, name, carp_balance, nonce FROM wallets WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for uid, name, bal, nonce in rows:
+                wallets[uid] = {"name": name, "carp_balance": bal, "nonce": nonce}
+        return wallets
+
+    # Lock-free reads
+    # WAL readers see the last committed transaction and never wait for the writer
+    def read_snapshot(self, user_id):
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            return self.get_wallet(user_id), self.pending_outflow(user_id)
+        finally:
+            conn.execute("COMMIT")
+
+    def snapshot_wallets(self):
+        return self.load_document(WALLET_FILE)
+
+    # Mempool
+    def pending_outflow(self, user_id):
+        row = self.conn.execute("SELECT amount FROM pending_outflow WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def rebuild_pending_outflow(self):
+        with self.transaction() as conn:
+            self._rebuild_outflow(conn)
+
+    def verify_pending_outflow(self):
+        stored = dict(self.conn.execute("SELECT user_id, amount FROM pending_outflow"))
+        return outflow_mismatches(stored, outflow_totals(self._pending_txs(self.conn)))
+
+    def append_pending(self, tx):
+        with self.transaction() as conn:
+            if conn.execute(
+                "SELECT 1 FROM pending WHERE user_id = ? AND nonce = ?", (tx["user_id"], tx.get("nonce"))
+            ).fetchone():
+                return False
+            if conn.execute("SELECT 1 FROM pending WHERE tx_id = ?", (tx["tx_id"],)).fetchone():
+                return False
+            # tx_log.tx_id is indexed, so the whole history is checked
+            if conn.execute("SELECT 1 FROM tx_log WHERE tx_id = ?", (tx["tx_id"],)).fetchone():
+                return False
+            stamp_submitted(tx)
+            self._insert_pending(conn, [tx])
+            self._add_outflow(conn, [tx])
+        return True
+
+    def submit_transfer(self, tx, make_tx_id):
+        uid = tx["user_id"]
+        with self.transaction() as conn:
+            row = conn.execute("SELECT carp_balance, nonce FROM wallets WHERE user_id = ?", (uid,)).fetchone()
+            wallet = {"carp_balance": row[0], "nonce": row[1]} if row else None
+            nonces = [n for (n,) in conn.execute("SELECT nonce FROM pending WHERE user_id = ?", (uid,))]
+            row = conn.execute("SELECT amount FROM pending_outflow WHERE user_id = ?", (uid,)).fetchone()
+            result = reserve_transfer(tx, wallet, row[0] if row else 0, nonces, make_tx_id)
+            if not result["ok"]:
+                return result
+            if (
+                conn.execute("SELECT 1 FROM pending WHERE tx_id = ?", (tx["tx_id"],)).fetchone()
+                or conn.execute("SELECT 1 FROM tx_log WHERE tx_id = ?", (tx["tx_id"],)).fetchone()
+            ):
+                return dict(result, ok=False, status="duplicate")
+            stamp_submitted(tx)
+            self._insert_pending(conn, [tx])
+            self._add_outflow(conn, [tx])
+        return result
+
+    def has_tx_id(self, tx_id):
+        return bool(
+            self.conn.execute("SELECT 1 FROM pending WHERE tx_id = ?", (tx_id,)).fetchone()
+            or self.conn.execute("SELECT 1 FROM tx_log WHERE tx_id = ?", (tx_id,)).fetchone()
+        )
+
+    # Logs
+    def append_log(self, entry):
+        self._insert_log(self.conn, [entry])
+
+    def append_rejected(self, entry, reason):
+        self._insert_rejected(self.conn, [{"reason": reason, "tx": entry}])
+
+    def log_position(self):
+        row = self.conn.execute("SELECT seq, tx_id FROM tx_log ORDER BY seq DESC LIMIT 1").fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def user_history(self, user_id, limit=10, offset=0):
+        # Both sides come from an index, so only the matching rows are read
+        matching = (
+            "SELECT seq FROM tx_log WHERE user_id = ? UNION SELECT seq FROM tx_log WHERE to_id = ? "
+            "UNION SELECT seq FROM tx_log_recipients WHERE user_id = ?"
+        )
+        (total,) = self.conn.execute(f"SELECT COUNT(*) FROM ({matching})", (user_id,) * 3).fetchone()
+        entries = []
+        for seq, data, logged_at in self.conn.execute(
+            f"SELECT seq, data, logged_at FROM tx_log WHERE seq IN ({matching}) ORDER BY seq DESC LIMIT ? OFFSET ?",
+            (user_id,) * 3 + (limit, offset)
+        ):
+            entry = json.loads(data)
+            entry["seq"] = seq
+            if logged_at is not None:
+                entry["logged_at"] = logged_at
+            entries.append(entry)
+        return total, entries
+
+    def iter_log(self, since_seq=0):
+        for seq, data, logged_at in self.conn.execute("SELECT seq, data, logged_at FROM tx_log WHERE seq > ? ORDER BY seq", (since_seq,)):
+            entry = json.loads(data)
+            entry["seq"] = seq
+            if logged_at is not None:
+                entry["logged_at"] = logged_at
+            yield entry
+
+    def applied_log_seq(self):
+        # Wallets and log are committed in the same transaction
+        return self.log_position()[0]
+
+    def mark_log_applied(self, seq):
+        pass
+
+    def commit_batch(self, batch):
+        # The whole pass becomes a single transaction
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO wallets (user_id, name, carp_balance, nonce) VALUES (?, ?, ?, ?)",
+                [
+                    (uid, batch.wallets[uid].get("name"), batch.wallets[uid].get("carp_balance", 0), batch.wallets[uid].get("nonce", 0))
+                    for uid in batch.dirty_wallets
+                ]
+            )
+            self._insert_log(conn, batch.log_entries)
+            self._insert_rejected(conn, [{"reason": reason, "tx": tx} for tx, reason in batch.rejected])
+            conn.executemany("DELETE FROM pending WHERE tx_id = ?", [(tx_id,) for tx_id in batch.removed_tx_ids])
+            self._add_outflow(conn, batch.log_entries + [tx for tx, _ in batch.rejected], sign=-1)
+
+    # Migration and backups
+    def is_migrated(self):
+        return self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None
+
+    def import_json_files(self):
+        reshard_json_files()
+        wallets = read_wallet_shards()
+        txs = read_pending_shards()
+        if os.path.exists(os.path.join(TX_LOG_DIR, INDEX_NAME)):
+            log = list(SegmentedTxLog().iter_entries())
+        else:
+            log = read_json_file(TX_LOG_FILE).get("log", [])
+        rejected = read_json_file(REJECTED_LOG_FILE).get("rejected", [])
+        with self.transaction() as conn:
+            for table in ("wallets", "pending", "tx_log", "tx_log_recipients", "rejected"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany(
+                "INSERT INTO wallets (user_id, name, carp_balance, nonce) VALUES (?, ?, ?, ?)",
+                [(uid, w.get("name"), w.get("carp_balance", 0), w.get("nonce", 0)) for uid, w in wallets.items()]
+            )
+            self._insert_pending(conn, txs)
+            self._insert_log(conn, log)
+            self._insert_rejected(conn, rejected)
+            self._rebuild_outflow(conn)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', datetime('now'))")
+        return {"wallets": len(wallets), "pending": len(txs), "log": len(log), "rejected": len(rejected)}
+
+    def backup_to(self, dest_path):
+        dest = sqlite3.connect(dest_path)
+        try:
+            self.conn.backup(dest)
+        finally:
+            dest.close()
+
+
+class _SqliteTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "sqlite":
+                _storage = SqliteStorage()
+                if not _storage.is_migrated():
+                    counts = _storage.import_json_files()
+                    print(f"📦 Migrated JSON ledger into {LEDGER_DB}: {counts}")
+            else:
+                _storage = JsonStorage()
+    return _storage
+
+
+def migrate_json_to_sqlite(db_path=LEDGER_DB):
+    return SqliteStorage(db_path).import_json_files()
+
+
+def backup_database(dest_path):
+    if not os.path.exists(LEDGER_DB):
+        return False
+    SqliteStorage(LEDGER_DB).backup_to(dest_path)
+    return True
+
+
+def check_pending_outflow(repair=False):
+    # Compares the maintained per-user outflow with a full recompute from the pending pool
+    storage = get_storage()
+    with ledger_lock():
+        mismatches = storage.verify_pending_outflow()
+        if mismatches and repair:
+            storage.rebuild_pending_outflow()
+    return mismatches
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "migrate":
+        print(f"📦 Imported into {LEDGER_DB}: {migrate_json_to_sqlite()}")
+    elif command == "check-outflow":
+        repair = "--repair" in sys.argv
+        mismatches = check_pending_outflow(repair=repair)
+        for uid, (stored, expected) in sorted(mismatches.items()):
+            print(f"❌ {uid}: stored {stored}, recomputed {expected}")
+        if not mismatches:
+            print("✅ Pending outflow matches the pending pool.")
+        elif repair:
+            print(f"🔧 Rebuilt pending outflow for {len(mismatches)} users.")
+        sys.exit(1 if mismatches and not repair else 0)
+    else:
+        print("Usage: python -m core.storage migrate | check-outflow [--repair]")
@@ -0,0 +1,109 @@
+# tx_history.py
+import os
+import threading
+from array import array
+
+from core import durability
+
+HISTORY_NAME = "history.idx"
+# Per-user entries are kept flat in one array: seq, segment number, byte offset, byte length
+_FIELDS = 4
+
+
+def involved_users(record):
+    # Every user whose history shows the tx: the sender and, for transfers, the recipient(s)
+    users = [record.get("user_id")]
+    recipients = [out.get("to") for out in record.get("outputs") or ()] or [record.get("to")]
+    for to in recipients:
+        if to and to not in users:
+            users.append(to)
+    return [uid for uid in users if uid]
+
+
+def history_lines(located):
+    # located: [(record, segment number, offset, length)]
+    return "".join(
+        f"{record['seq']}\t{segment}\t{offset}\t{length}\t{uid}\n"
+        for record, segment, offset, length in located
+        for uid in involved_users(record)
+    )
+
+
+class UserHistoryIndex:
+    """Secondary index from user id to the log records that involve the user.
+
+    The file is append-only, one line per (record, user), written by the tx
+    log right after the records themselves. Every process keeps the index in
+    memory and only reads the bytes appended since its last lookup, so a
+    lookup costs the same however long the log grows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mutex = threading.RLock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self._entries = {}
+        self._offset = 0
+        self._inode = inode
+        self._last_seq = 0
+
+    def _refresh(self):
+        with self._mutex:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset(None)
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                # Rebuilt by another process; start over
+                self._reset(stat.st_ino)
+            if stat.st_size == self._offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            entries = self._entries
+            for line in complete.decode("utf-8").splitlines():
+                seq, segment, offset, length, uid = line.split("\t", 4)
+                positions = entries.get(uid)
+                if positions is None:
+                    positions = entries[uid] = array("q")
+                positions.extend((int(seq), int(segment), int(offset), int(length)))
+                self._last_seq = max(self._last_seq, int(seq))
+            self._offset += len(complete)
+
+    def append(self, located):
+        # Caller holds the tx log lock
+        if located:
+            data = history_lines(located).encode("utf-8")
+            with open(self.path, "ab") as f:
+                f.write(data)
+            durability.count_bytes(len(data))
+
+    def rewrite(self, located):
+        # Caller holds the tx log lock. Not fsynced; the tx log rebuilds it when it falls out of step
+        durability.atomic_write(self.path, history_lines(located).encode("utf-8"), sync=False, defer=False)
+
+    def last_seq(self):
+        self._refresh()
+        return self._last_seq
+
+    def count(self, user_id):
+        self._refresh()
+        with self._mutex:
+            return len(self._entries.get(user_id, ())) // _FIELDS
+
+    def positions(self, user_id, limit, offset=0):
+        """(seq, segment, offset, length) of the user's records, newest first, skipping the newest `offset`."""
+        self._refresh()
+        with self._mutex:
+            flat = self._entries.get(user_id)
+            if flat is None:
+                return []
+            total = len(flat) // _FIELDS
+            newest = total - 1 - offset
+            oldest = max(-1, newest - limit)
+            return [tuple(flat[i * _FIELDS:(i + 1) * _FIELDS]) for i in range(newest, oldest, -1)]
@@ -0,0 +1,121 @@
+# tx_index.py
+import os
+import threading
+from filelock import FileLock
+
+from paths import TX_INDEX_FILE
+from core import durability
+from core.lock_metrics import instrument
+
+# Rewrite the index once this many removal records have piled up
+COMPACT_AFTER_REMOVALS = 10_000
+
+
+def _key(tx_id):
+    # sha256 ids are kept as 32 raw bytes instead of 64-char strings
+    try:
+        return bytes.fromhex(tx_id)
+    except (TypeError, ValueError):
+        return tx_id
+
+
+def _unkey(key):
+    return key.hex() if isinstance(key, bytes) else key
+
+
+class TxIdIndex:
+    """Exact, persistent set of tx_ids that are pending or already logged.
+
+    The file is append-only ("+id" when a tx enters the pool, "-id" when it
+    leaves without being logged). Every process keeps the set in memory and
+    only reads the bytes appended since its last lookup.
+    """
+
+    def __init__(self, path=TX_INDEX_FILE, rebuild_source=None):
+        self.path = path
+        self._file_lock = FileLock(path + ".lock")
+        self._mutex = threading.RLock()
+        self._ids = set()
+        self._offset = 0
+        self._inode = None
+        self._removals = 0
+        with instrument(self._file_lock, "tx_index.open"):
+            if not os.path.exists(path) and rebuild_source is not None:
+                self._write_compacted({_key(tx_id) for tx_id in rebuild_source()})
+        self._refresh()
+
+    def _refresh(self):
+        with self._mutex:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._ids, self._offset, self._inode, self._removals = set(), 0, None, 0
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                # The file was compacted by another process; start over
+                self._ids, self._offset, self._inode, self._removals = set(), 0, stat.st_ino, 0
+            if stat.st_size == self._offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                op, tx_id = line[:1], line[1:].decode("utf-8")
+                if op == b"+":
+                    self._ids.add(_key(tx_id))
+                elif op == b"-":
+                    self._ids.discard(_key(tx_id))
+                    self._removals += 1
+            self._offset += len(complete)
+
+    def _append(self, lines):
+        if not lines:
+            return
+        with instrument(self._file_lock, "tx_index.append"):
+            data = "".join(lines).encode("utf-8")
+            with open(self.path, "ab") as f:
+                f.write(data)
+        # Outside the file lock, so appenders from other threads can share the fsync
+        durability.sync_appended(self.path, len(data))
+        self._refresh()
+
+    def _write_compacted(self, keys):
+        # Renamed at once: other processes read it under the file lock, not the caller's lock
+        durability.atomic_write(self.path, "".join(f"+{_unkey(k)}\n" for k in keys).encode("utf-8"), defer=False)
+
+    def __contains__(self, tx_id):
+        self._refresh()
+        return _key(tx_id) in self._ids
+
+    def __len__(self):
+        self._refresh()
+        return len(self._ids)
+
+    def add_many(self, tx_ids):
+        self._refresh()
+        self._append([f"+{tx_id}\n" for tx_id in set(tx_ids) if tx_id and _key(tx_id) not in self._ids])
+
+    def add(self, tx_id):
+        self.add_many([tx_id])
+
+    def discard_many(self, tx_ids):
+        self._refresh()
+        self._append([f"-{tx_id}\n" for tx_id in set(tx_ids) if tx_id and _key(tx_id) in self._ids])
+        if self._removals >= COMPACT_AFTER_REMOVALS:
+            self.compact()
+
+    def discard(self, tx_id):
+        self.discard_many([tx_id])
+
+    def compact(self):
+        with instrument(self._file_lock, "tx_index.compact"):
+            self._refresh()
+            with self._mutex:
+                self._write_compacted(self._ids)
+        self._refresh()
+
+    def rebuild(self, tx_ids):
+        with instrument(self._file_lock, "tx_index.rebuild"):
+            self._write_compacted({_key(tx_id) for tx_id in tx_ids if tx_id})
+        self._refresh()
@@ -0,0 +1,272 @@
+# tx_log.py
+import json
+import os
+import time
+from filelock import FileLock
+
+from paths import TX_LOG_DIR, TX_LOG_FILE
+from core import durability
+from core.tx_history import UserHistoryIndex, HISTORY_NAME
+from core.lock_metrics import instrument
+
+# Segments are rotated once they grow past this size
+SEGMENT_MAX_BYTES = int(os.getenv("TX_LOG_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+INDEX_NAME = "index.json"
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _segment_name(number):
+    return f"segment_{number:06d}.jsonl"
+
+
+def _segment_number(segment):
+    return int(segment["file"][len("segment_"):-len(".jsonl")])
+
+
+class SegmentedTxLog:
+    """Append-only JSON-Lines transaction log split into size-bounded segments.
+
+    index.json keeps one small entry per segment (seq range, first/last tx_id,
+    time range, byte size), so appending never touches older segments.
+    history.idx (core.tx_history) maps each user to the byte ranges of their records.
+    """
+
+    def __init__(self, directory=TX_LOG_DIR, segment_max_bytes=SEGMENT_MAX_BYTES, legacy_file=TX_LOG_FILE):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.legacy_file = legacy_file
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = FileLock(self.index_path + ".lock")
+        self.history = UserHistoryIndex(os.path.join(directory, HISTORY_NAME))
+        with instrument(self._lock, "tx_log.open"):
+            if not os.path.exists(self.index_path):
+                self._save_index({"next_seq": 1, "segments": []})
+                self.history.rewrite([])
+                self._import_legacy_log()
+            self._sync_history(self._load_index())
+
+    # Index handling
+    def _load_index(self):
+        with open(self.index_path, "r") as f:
+            index = json.load(f)
+        self._repair_tail(index)
+        return index
+
+    def _save_index(self, index):
+        # Renamed at once: appenders on other shards read it under self._lock, not the caller's lock.
+        # Not fsynced; _repair_tail rebuilds it from the segments after a power loss.
+        durability.atomic_write(self.index_path, json.dumps(index, separators=(",", ":")).encode("utf-8"), sync=False, defer=False)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment["file"])
+
+    def _repair_tail(self, index):
+        # A crash between writing a segment and saving the index leaves the index behind the file;
+        # a power loss can also leave it ahead of appends that were never synced
+        if not index["segments"]:
+            return
+        segment = index["segments"][-1]
+        path = self._segment_path(segment)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < segment["bytes"]:
+            self._rescan_tail(index, segment)
+            self._save_index(index)
+            return
+        if size == segment["bytes"]:
+            return
+        with open(path, "rb+") as f:
+            f.seek(segment["bytes"])
+            tail = f.read()
+            complete = tail[:tail.rfind(b"\n") + 1]
+            f.truncate(segment["bytes"] + len(complete))
+        for line in complete.splitlines():
+            self._track(index, segment, json.loads(line), len(line) + 1)
+        self._save_index(index)
+
+    def _rescan_tail(self, index, segment):
+        segment.update(count=0, bytes=0, first_tx_id=None, last_tx_id=None, first_time=None, last_time=None)
+        segment["last_seq"] = segment["first_seq"] - 1
+        index["next_seq"] = segment["first_seq"]
+        path = self._segment_path(segment)
+        with open(path, "rb+") as f:
+            data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            f.truncate(len(complete))
+        for line in complete.splitlines():
+            self._track(index, segment, json.loads(line), len(line) + 1)
+
+    def _new_segment(self, index):
+        number = len(index["segments"]) + 1
+        segment = {
+            "file": _segment_name(number),
+            "first_seq": index["next_seq"],
+            "last_seq": index["next_seq"] - 1,
+            "count": 0,
+            "bytes": 0,
+            "first_tx_id": None,
+            "last_tx_id": None,
+            "first_time": None,
+            "last_time": None,
+        }
+        index["segments"].append(segment)
+        return segment
+
+    @staticmethod
+    def _track(index, segment, record, size):
+        if segment["count"] == 0:
+            segment["first_tx_id"] = record.get("tx_id")
+            segment["first_time"] = record.get("logged_at")
+        segment["count"] += 1
+        segment["bytes"] += size
+        segment["last_seq"] = record["seq"]
+        segment["last_tx_id"] = record.get("tx_id")
+        segment["last_time"] = record.get("logged_at")
+        index["next_seq"] = record["seq"] + 1
+
+    # Writing
+    def append(self, entry):
+        return self.append_many([entry])[0]
+
+    def append_many(self, entries):
+        records = []
+        if not entries:
+            return records
+        with instrument(self._lock, "tx_log.append"):
+            index = self._load_index()
+            segment = index["segments"][-1] if index["segments"] else self._new_segment(index)
+            now = int(time.time())
+            chunk = []
+            located = []
+            for entry in entries:
+                if segment["bytes"] >= self.segment_max_bytes:
+                    self._write_chunk(segment, chunk)
+                    chunk = []
+                    segment = self._new_segment(index)
+                record = dict(entry)
+                record["seq"] = index["next_seq"]
+                record.setdefault("logged_at", now)
+                data = _encode(record)
+                chunk.append(data)
+                located.append((record, _segment_number(segment), segment["bytes"], len(data)))
+                self._track(index, segment, record, len(data))
+                records.append(record)
+            self._write_chunk(segment, chunk)
+            # After the records, so every history entry points at bytes already written
+            self.history.append(located)
+            self._save_index(index)
+        return records
+
+    def _write_chunk(self, segment, chunk):
+        if chunk:
+            path = self._segment_path(segment)
+            data = b"".join(chunk)
+            with open(path, "ab") as f:
+                f.write(data)
+            durability.sync_appended(path, len(data))
+
+    def replace_all(self, entries):
+        with instrument(self._lock, "tx_log.replace_all"):
+            for segment in self.segments():
+                os.remove(self._segment_path(segment))
+            self._save_index({"next_seq": 1, "segments": []})
+            self.history.rewrite([])
+            self.append_many([{k: v for k, v in e.items() if k != "seq"} for e in entries])
+
+    def _import_legacy_log(self):
+        if not os.path.exists(self.legacy_file):
+            return
+        with open(self.legacy_file, "r") as f:
+            entries = json.load(f).get("log", [])
+        self.append_many(entries)
+        os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        print(f"📦 Imported {len(entries)} tx log entries into {self.directory}")
+
+    # Reading
+    def segments(self):
+        with instrument(self._lock, "tx_log.segments"):
+            return self._load_index()["segments"]
+
+    def iter_segment(self, segment):
+        for record, _, _ in self._iter_located(segment):
+            yield record
+
+    def _iter_located(self, segment):
+        # (record, byte offset, byte length) for each complete record the index covers
+        with open(self._segment_path(segment), "rb") as f:
+            offset = 0
+            for line in f:
+                if offset + len(line) > segment["bytes"]:
+                    break
+                yield json.loads(line), offset, len(line)
+                offset += len(line)
+
+    # Per-user history
+    def _sync_history(self, index):
+        # Caller holds self._lock. A crash between the segment and history writes leaves the history
+        # behind the log; a power loss can leave it ahead of a truncated segment.
+        last_seq = index["next_seq"] - 1
+        history_seq = self.history.last_seq()
+        if history_seq == last_seq:
+            return
+        since = history_seq if history_seq < last_seq else 0
+        located = [
+            (record, _segment_number(segment), offset, length)
+            for segment in index["segments"] if segment["last_seq"] > since
+            for record, offset, length in self._iter_located(segment) if record["seq"] > since
+        ]
+        if since:
+            self.history.append(located)
+        else:
+            self.history.rewrite(located)
+        if located:
+            print(f"📇 Indexed {len(located)} tx log entries into the user history")
+
+    def user_history_count(self, user_id):
+        return self.history.count(user_id)
+
+    def user_history(self, user_id, limit=10, offset=0):
+        """The user's logged txs, newest first. Reads only the matching records and takes no lock."""
+        records = []
+        handles = {}
+        try:
+            for _, segment, start, length in self.history.positions(user_id, limit, offset):
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(os.path.join(self.directory, _segment_name(segment)), "rb")
+                f.seek(start)
+                records.append(json.loads(f.read(length)))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def iter_entries(self, since_seq=0):
+        for segment in self.segments():
+            if segment["last_seq"] <= since_seq:
+                continue
+            for record in self.iter_segment(segment):
+                if record["seq"] > since_seq:
+                    yield record
+
+    def tail(self, n):
+        entries = []
+        for segment in reversed(self.segments()):
+            entries = list(self.iter_segment(segment)) + entries
+            if len(entries) >= n:
+                break
+        return entries[-n:] if n else []
+
+    def position(self):
+        # (seq, tx_id) of the newest record, (0, None) while the log is empty
+        for segment in reversed(self.segments()):
+            if segment["count"]:
+                return segment["last_seq"], segment["last_tx_id"]
+        return 0, None
+
+    def __len__(self):
+        return sum(segment["count"] for segment in self.segments())
+
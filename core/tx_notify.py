@@ -0,0 +1,74 @@
+# tx_notify.py
+import os
+import socket
+import threading
+
+# Local UDP port the TX worker listens on when the bots run in other processes
+NOTIFY_PORT = int(os.getenv("TX_NOTIFY_PORT", "47811"))
+NOTIFY_HOST = "127.0.0.1"
+
+_pending_event = threading.Event()
+_send_lock = threading.Lock()
+_send_sock = None
+
+
+def notify_pending():
+    # Co-hosted worker (same interpreter, e.g. under BOILIE_control) wakes up through the event
+    _pending_event.set()
+    # A standalone worker wakes up through a datagram; nobody listening is fine
+    global _send_sock
+    try:
+        with _send_lock:
+            if _send_sock is None:
+                _send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            _send_sock.sendto(b"tx", (NOTIFY_HOST, NOTIFY_PORT))
+    except OSError:
+        pass
+
+
+def wait_for_pending(timeout):
+    return _pending_event.wait(timeout)
+
+
+def clear_pending():
+    _pending_event.clear()
+
+
+class PendingListener:
+    def __init__(self, port=NOTIFY_PORT):
+        self.port = port
+        self.sock = None
+        self.thread = None
+
+    def start(self, warn=True):
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((NOTIFY_HOST, self.port))
+            sock.settimeout(1.0)
+        except OSError as e:
+            if sock is not None:
+                sock.close()
+            if warn:
+                print(f"⚠️ TX notify listener unavailable on port {self.port} ({e}), relying on polling.")
+            return False
+        self.sock = sock
+        self.thread = threading.Thread(target=self._run, name="tx-notify-listener", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        sock = self.sock
+        while self.sock is not None:
+            try:
+                sock.recvfrom(64)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            _pending_event.set()
+
+    def stop(self):
+        sock, self.sock = self.sock, None
+        if sock is not None:
+            sock.close()
@@ -1,73 +1,83 @@
 # tx_utils.py
-import discord
+import asyncio
+import functools
 import json
 import os
 import hashlib
-from filelock import FileLock
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
 from paths import WALLET_FILE, PENDING_FILE, LOCKFILE, TX_LOG_FILE, REJECTED_LOG_FILE, TICKETS_FILE
+from core.storage import get_storage
+from core.shards import shard_locks
+from core import serialization, metrics
+from core.tx_notify import notify_pending
+from core.ledger_client import LEDGER_SERVICE, ServiceUnavailable, LedgerServiceError, get_client, get_async_client
+
+if TYPE_CHECKING:
+    # Only for annotations; the worker and the ledger service never load discord.py
+    import discord
 
 FISHING_BOT_ID = os.getenv("FISHING_BOT_ID")
-MAX_LOG_SCAN = 2000  # Limit number of TXs to scan for duplicates
+# Dedicated pool for the async API, so FileLock waits and JSON parsing never block a bot's event loop
+IO_EXECUTOR_WORKERS = int(os.getenv("TX_IO_WORKERS", "4"))
+_io_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="tx-io")
 
+TXS_SUBMITTED = metrics.counter("boilies_txs_submitted_total", "Transfers submitted to the pending pool, by outcome", ("type", "status"))
+
+
+def _service_call(method, **params):
+    # (True, result) when the ledger service answered, (False, None) to fall back to the data files
+    if not LEDGER_SERVICE:
+        return False, None
+    try:
+        return True, get_client().call(method, **params)
+    except ServiceUnavailable:
+        return False, None
+    except LedgerServiceError as e:
+        # The data files answer instead, so callers get the same result shape either way
+        print(f"⚠️ Ledger service failed {method}: {e}")
+        return False, None
 
-def get_or_create_wallet(user: discord.User):
-    uid = str(user.id)
-    with FileLock(LOCKFILE):
-        wallets = load_json(WALLET_FILE)
-        changed = False
-        if uid not in wallets:
-            wallets[uid] = {
-                "name": str(user),
-                "carp_balance": 0,
-                "nonce": 0
-            }
-            changed = True
-        else:
-            if wallets[uid].get("name") != str(user):
-                wallets[uid]["name"] = str(user)
-                changed = True
-            if "nonce" not in wallets[uid]:
-                wallets[uid]["nonce"] = 0
-                changed = True
-        if changed:
-            save_json(WALLET_FILE, wallets)
-    return wallets[uid]
+
+def get_or_create_wallet(user: "discord.User"):
+    return get_or_create_wallet_by_id(str(user.id), str(user))
 
 
 def get_or_create_wallet_by_id(user_id: str, username: str = None):
-    with FileLock(LOCKFILE):
-        wallets = load_json(WALLET_FILE)
+    served, wallet = _service_call("get_or_create_wallet", user_id=user_id, username=username)
+    if served:
+        return wallet
+    storage = get_storage()
+    with shard_locks(user_id):
+        wallet = storage.get_wallet(user_id)
         changed = False
-        if user_id not in wallets:
-            wallets[user_id] = {
+        if wallet is None:
+            wallet = {
                 "name": username or user_id,
                 "carp_balance": 0,
                 "nonce": 0
             }
             changed = True
         else:
-            if username and wallets[user_id].get("name") != username:
-                wallets[user_id]["name"] = username
+            if username and wallet.get("name") != username:
+                wallet["name"] = username
                 changed = True
-            if "nonce" not in wallets[user_id]:
-                wallets[user_id]["nonce"] = 0
+            if "nonce" not in wallet:
+                wallet["nonce"] = 0
                 changed = True
         if changed:
-            save_json(WALLET_FILE, wallets)
-    return wallets[user_id]
+            storage.put_wallet(user_id, wallet)
+    return wallet
 
 
+# Compatibility layer: ledger files are routed through the configured storage backend
 def load_json(path):
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-    return {"txs": []} if "pending" in path else {}
+    return get_storage().load_document(path)
 
 
 def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
+    get_storage().save_document(path, data)
 
 
 def generate_tx_id(tx):
@@ -81,84 +91,226 @@ def tx_exists(data, user_id, nonce):
 
 
 def tx_id_exists(tx_id):
-    for file in [PENDING_FILE, TX_LOG_FILE]:
-        data = load_json(file)
-        key = "txs" if "pending" in file else "log"
-        for entry in data.get(key, []):
-            if entry.get("tx_id") == tx_id:
-                return True
-    return False
+    served, exists = _service_call("tx_id_exists", tx_id=tx_id)
+    if served:
+        return exists
+    return get_storage().has_tx_id(tx_id)
 
 
 def get_nonce(user_id: str) -> int:
-    with FileLock(LOCKFILE):
-        wallets = load_json(WALLET_FILE)
-        if user_id in wallets:
-            return wallets[user_id].get("nonce", 0) + 1
+    served, nonce = _service_call("get_nonce", user_id=user_id)
+    if served:
+        return nonce
+    storage = get_storage()
+    # Read-only, so answered from the last published snapshot without waiting for the lock
+    snapshot = storage.read_snapshot(user_id)
+    if snapshot is not None:
+        wallet, _ = snapshot
+        return wallet.get("nonce", 0) + 1 if wallet is not None else 1
+    with shard_locks(user_id):
+        wallet = storage.get_wallet(user_id)
+        if wallet is not None:
+            return wallet.get("nonce", 0) + 1
     return 1
 
 
 def get_effective_balance(user_id):
-    with FileLock(LOCKFILE):
-        wallet = load_json(WALLET_FILE)
-        pending = load_json(PENDING_FILE)
+    served, balance = _service_call("get_effective_balance", user_id=user_id)
+    if served:
+        return balance
+    storage = get_storage()
+    snapshot = storage.read_snapshot(user_id)
+    if snapshot is not None:
+        wallet, pending_out = snapshot
+        return (wallet or {}).get("carp_balance", 0) - pending_out
+    with shard_locks(user_id):
+        wallet = storage.get_wallet(user_id) or {}
+        # Own outgoing pending TXs, kept as a per-user aggregate by the storage backend
+        pending_out = storage.pending_outflow(user_id)
+        return wallet.get("carp_balance", 0) - pending_out
+
+
+def load_wallet_snapshot():
+    """All wallets as of the last published snapshot, without taking any lock. Treat as read-only."""
+    served, wallets = _service_call("get_wallets")
+    if served:
+        return wallets
+    wallets = get_storage().snapshot_wallets()
+    if wallets is None:
+        return load_json(WALLET_FILE)
+    return wallets
+
+
+def get_user_history(user_id, limit=10, offset=0):
+    """(total, logged txs sent or received by the user, newest first). Read from the tx log, also while the ledger service runs."""
+    return get_storage().user_history(str(user_id), limit, offset)
 
-        # Subtract all own outgoing pending TXs
-        pending_out = sum(
-            tx.get("amount", 0)
-            for tx in pending.get("txs", [])
-            if tx.get("user_id") == user_id
-        )
 
-        balance = wallet.get(user_id, {}).get("carp_balance", 0)
-        return balance - pending_out
+def safe_append_tx(tx):
+    served, result = _service_call("submit_tx", tx=tx)
+    if served:
+        tx["tx_id"] = result["tx_id"]
+        return result["ok"]
+    storage = get_storage()
+    with shard_locks(tx["user_id"]):
+        if "tx_id" not in tx:
+            tx["tx_id"] = generate_tx_id(tx)
+        appended = storage.append_pending(tx)
+    if appended:
+        notify_pending()
+    return appended
 
 
-def safe_append_tx(tx):
-    with FileLock(LOCKFILE):
-        data = load_json(PENDING_FILE)
-        tx_log = load_json(TX_LOG_FILE)
+def transfer_tx(sender_id, recipient_id, amount, sender_name=None, recipient_name=None, tx_type="tip", **fields):
+    tx = {"type": tx_type, "user_id": str(sender_id), "username": sender_name or str(sender_id)}
+    if recipient_id is not None:
+        tx["to"] = str(recipient_id)
+        tx["to_username"] = recipient_name or str(recipient_id)
+    tx["amount"] = amount
+    tx.update(fields)
+    return tx
 
-        if tx_exists(data, tx["user_id"], tx["nonce"]):
-            return False
 
-        if "tx_id" not in tx:
-            tx["tx_id"] = generate_tx_id(tx)
+def _invalid_amount():
+    return {"ok": False, "status": "invalid_amount", "tx_id": None, "nonce": None, "balance": None}
+
+
+def _submit_transfer_local(tx):
+    # Only the sender's shard is read or written; the recipient is credited by the worker
+    storage = get_storage()
+    with shard_locks(tx["user_id"]):
+        result = storage.submit_transfer(tx, generate_tx_id)
+    if result["ok"]:
+        notify_pending()
+    return result
+
+
+def submit_transfer(sender_id, recipient_id, amount, sender_name=None, recipient_name=None, tx_type="tip", **fields):
+    """Check the balance, assign the next nonce and enqueue the tx in one locked step.
+
+    Returns {"ok", "status", "tx_id", "nonce", "balance"}. status is "queued",
+    "invalid_amount", "invalid_outputs", "insufficient_balance" or "duplicate"; balance is the
+    sender's effective balance after the transfer (or the shortfall check).
+    """
+    if amount <= 0:
+        return _invalid_amount()
+    tx = transfer_tx(sender_id, recipient_id, amount, sender_name, recipient_name, tx_type, **fields)
+    served, result = _service_call("submit_transfer", tx=tx)
+    if not served:
+        result = _submit_transfer_local(tx)
+    TXS_SUBMITTED.inc(type=tx_type, status=result["status"])
+    return result
 
-        # Check if tx_id already exists in pending
-        if any(t.get("tx_id") == tx["tx_id"] for t in data.get("txs", [])):
-            return False
 
-        # Check last MAX_LOG_SCAN txs in tx_log
-        if any(t.get("tx_id") == tx["tx_id"] for t in tx_log.get("log", [])[-MAX_LOG_SCAN:]):
-            return False
+def multitip_outputs(recipients):
+    # [(recipient_id, recipient_name, amount)] -> the "outputs" of a multitip tx
+    return [{"to": str(rid), "to_username": name or str(rid), "amount": amount} for rid, name, amount in recipients]
 
-        data["txs"].append(tx)
-        save_json(PENDING_FILE, data)
-        return True
+
+def submit_multitip(sender_id, recipients, sender_name=None):
+    """Pay several recipients with one tx under one nonce; the worker applies it all-or-nothing.
+
+    recipients is [(recipient_id, recipient_name, amount)]. Returns the same dict as submit_transfer.
+    """
+    if not recipients or any(amount <= 0 for _, _, amount in recipients):
+        return _invalid_amount()
+    total = sum(amount for _, _, amount in recipients)
+    return submit_transfer(sender_id, None, total, sender_name, tx_type="multitip", outputs=multitip_outputs(recipients))
 
 
 def append_to_tx_log(entry):
     if "tx_id" not in entry:
         entry["tx_id"] = generate_tx_id(entry)
-    tx_log = load_json(TX_LOG_FILE)
-    tx_log.setdefault("log", []).append(entry)
-    save_json(TX_LOG_FILE, tx_log)
+    get_storage().append_log(entry)
 
 
 def append_to_rejected_log(entry, reason):
-    rej_log = load_json(REJECTED_LOG_FILE)
-    rej_log.setdefault("rejected", []).append({"reason": reason, "tx": entry})
-    save_json(REJECTED_LOG_FILE, rej_log)
+    get_storage().append_rejected(entry, reason)
 
 
 def load_tickets():
-    if os.path.exists(TICKETS_FILE):
-        with open(TICKETS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return serialization.read_file(TICKETS_FILE, {})
 
 
 def save_tickets(data):
-    with open(TICKETS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
\ No newline at end of file
+    serialization.write_file(TICKETS_FILE, data)
+
+
+# Async API for use inside discord event loops
+async def _run_io(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args))
+
+
+async def _aservice_call(method, **params):
+    if not LEDGER_SERVICE:
+        return False, None
+    try:
+        return True, await get_async_client().call(method, **params)
+    except ServiceUnavailable:
+        return False, None
+    except LedgerServiceError as e:
+        print(f"⚠️ Ledger service failed {method}: {e}")
+        return False, None
+
+
+async def aget_or_create_wallet(user: "discord.User"):
+    return await aget_or_create_wallet_by_id(str(user.id), str(user))
+
+
+async def aget_or_create_wallet_by_id(user_id: str, username: str = None):
+    served, wallet = await _aservice_call("get_or_create_wallet", user_id=user_id, username=username)
+    if served:
+        return wallet
+    return await _run_io(get_or_create_wallet_by_id, user_id, username)
+
+
+async def aget_nonce(user_id: str) -> int:
+    served, nonce = await _aservice_call("get_nonce", user_id=user_id)
+    if served:
+        return nonce
+    return await _run_io(get_nonce, user_id)
+
+
+async def aget_effective_balance(user_id):
+    served, balance = await _aservice_call("get_effective_balance", user_id=user_id)
+    if served:
+        return balance
+    return await _run_io(get_effective_balance, user_id)
+
+
+async def aload_wallet_snapshot():
+    served, wallets = await _aservice_call("get_wallets")
+    if served:
+        return wallets
+    return await _run_io(load_wallet_snapshot)
+
+
+async def aget_user_history(user_id, limit=10, offset=0):
+    return await _run_io(get_user_history, user_id, limit, offset)
+
+
+async def asafe_append_tx(tx):
+    served, result = await _aservice_call("submit_tx", tx=tx)
+    if served:
+        tx["tx_id"] = result["tx_id"]
+        return result["ok"]
+    return await _run_io(safe_append_tx, tx)
+
+
+async def asubmit_transfer(sender_id, recipient_id, amount, sender_name=None, recipient_name=None, tx_type="tip", **fields):
+    if amount <= 0:
+        return _invalid_amount()
+    tx = transfer_tx(sender_id, recipient_id, amount, sender_name, recipient_name, tx_type, **fields)
+    served, result = await _aservice_call("submit_transfer", tx=tx)
+    if not served:
+        result = await _run_io(_submit_transfer_local, tx)
+    TXS_SUBMITTED.inc(type=tx_type, status=result["status"])
+    return result
+
+
+async def asubmit_multitip(sender_id, recipients, sender_name=None):
+    if not recipients or any(amount <= 0 for _, _, amount in recipients):
+        return _invalid_amount()
+    total = sum(amount for _, _, amount in recipients)
+    return await asubmit_transfer(sender_id, None, total, sender_name, tx_type="multitip", outputs=multitip_outputs(recipients))
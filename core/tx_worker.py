@@ -1,21 +1,48 @@
 # tx_worker.py
-import sys
+import os
+import re
 import time
-from filelock import FileLock
 from core.tx_utils import (
     load_json,
     save_json,
-    append_to_tx_log,
-    append_to_rejected_log,
+    generate_tx_id,
     load_tickets,
     save_tickets
 )
-
-from core.tx_utils import WALLET_FILE, PENDING_FILE, LOCKFILE
-from paths import FACTORY_FILE
-from paths import DEBUG_FILE
-sys.stdout = open(DEBUG_FILE, "a")
-sys.stderr = sys.stdout
+from core.storage import get_storage, LedgerBatch, multitip_error
+from core.shards import ledger_lock, shard_file, WALLET_SHARDS
+from core.checkpoint import write_checkpoint, load_latest_checkpoint, checkpoint_due
+from core.tx_notify import PendingListener, wait_for_pending, clear_pending
+from core.ledger_client import service_running
+from core import metrics
+from components import heartbeat
+
+from core.tx_utils import PENDING_FILE
+from paths import FACTORY_FILE, WALLET_FILE
+
+# Timing of the most recent committed batch
+LAST_BATCH_STATS = {}
+
+WAKEUP_TIMEOUT_SECONDS = 1
+IDLE_POLL_SECONDS = 60  # Safety net in case a notification got lost
+FALLBACK_POLL_SECONDS = 5
+UPGRADE_CHECK_SECONDS = 30
+# Txs whose nonce is ahead of the wallet wait this long for the missing ones before being rejected
+NONCE_GAP_HOLD_SECONDS = float(os.getenv("NONCE_GAP_HOLD_SECONDS", "30"))
+HELD_RECHECK_SECONDS = 5
+
+# Running totals since start-up, to see how many txs were held instead of rejected
+MEMPOOL_STATS = {"processed": 0, "rejected": 0, "released": 0, "gap_expired": 0}
+# When a held tx without submitted_at was first seen by this process
+_first_seen = {}
+
+TXS_PROCESSED = metrics.counter("boilies_txs_processed_total", "Txs settled into the tx log", ("type",))
+TXS_REJECTED = metrics.counter("boilies_txs_rejected_total", "Txs rejected by the worker", ("reason",))
+TXS_RELEASED = metrics.counter("boilies_txs_released_total", "Held txs applied once their nonce gap closed")
+MEMPOOL_DEPTH = metrics.gauge("boilies_mempool_depth", "Txs waiting in the pending pool")
+MEMPOOL_HELD = metrics.gauge("boilies_mempool_held", "Pending txs held back by a nonce gap")
+SETTLE_LATENCY = metrics.histogram("boilies_tx_settle_seconds", "Time from submit until the tx was settled or rejected")
+PASS_SECONDS = metrics.histogram("boilies_settle_pass_seconds", "Duration of one settle pass", ("stage",))
 
 def check_upgrade_completion():
     try:
@@ -54,132 +81,440 @@ def check_upgrade_completion():
         print(f"⚠️ Error checking upgrade completion: {e}")
 
 
+def apply_tx(batch, tx):
+    wallet = batch.wallets
+    try:
+        print(f"\n⚙️ Processing TX: {tx}")
+        uid = tx["user_id"]
+        if uid not in wallet:
+            print(f"➕ Creating wallet for user {uid}")
+            wallet[uid] = {"name": tx["username"], "carp_balance": 0, "nonce": 0}
+            batch.touch(uid)
+        elif wallet[uid]["name"] != tx["username"]:
+            print(f"📝 Updating username for {uid} to {tx['username']}")
+            wallet[uid]["name"] = tx["username"]
+            batch.touch(uid)
+
+        nonce = tx.get("nonce")
+        expected_nonce = wallet[uid]["nonce"] + 1
+        print(f"🔢 Nonce in TX: {nonce}, Expected: {expected_nonce}")
+
+        if nonce is None:
+            print("❌ Rejected: Missing nonce.")
+            batch.reject(tx, "Missing nonce")
+            return
+
+        if nonce != expected_nonce:
+            print("❌ Rejected: Invalid nonce.")
+            batch.reject(tx, f"Invalid nonce (expected {expected_nonce}, got {nonce})")
+            return
+
+        tx_type = tx["type"]
+
+        if tx_type in ["tip", "bait", "reward"]:
+            print(f"💸 Handling {tx_type} transaction")
+            to = tx["to"]
+            if wallet[uid]["carp_balance"] < tx["amount"]:
+                print("❌ Rejected: Insufficient balance.")
+                batch.reject(tx, "Insufficient balance")
+                return
+
+            if to not in wallet:
+                print(f"➕ Creating recipient wallet for {to}")
+                wallet[to] = {"name": tx["to_username"], "carp_balance": 0, "nonce": 0}
+            elif wallet[to]["name"] != tx["to_username"]:
+                print(f"📝 Updating recipient username for {to}")
+                wallet[to]["name"] = tx["to_username"]
+
+            wallet[uid]["carp_balance"] -= tx["amount"]
+            wallet[to]["carp_balance"] += tx["amount"]
+            wallet[uid]["nonce"] = nonce
+            batch.touch(uid, to)
+            batch.settle(tx)
+            print(f"✅ Processed {tx_type} transaction.")
+
+        elif tx_type == "multitip":
+            # One nonce for every output: either all recipients are paid or none are
+            outputs = tx.get("outputs")
+            print(f"💸 Handling multitip transaction with {len(outputs or [])} outputs")
+            error = multitip_error(tx)
+            if error:
+                print(f"❌ Rejected: {error}.")
+                batch.reject(tx, error)
+                return
+            if wallet[uid]["carp_balance"] < tx["amount"]:
+                print("❌ Rejected: Insufficient balance.")
+                batch.reject(tx, "Insufficient balance")
+                return
+
+            wallet[uid]["carp_balance"] -= tx["amount"]
+            for out in outputs:
+                to = out["to"]
+                recipient = wallet.get(to)
+                if recipient is None:
+                    recipient = wallet[to] = {"name": out.get("to_username", to), "carp_balance": 0, "nonce": 0}
+                elif out.get("to_username") and recipient["name"] != out["to_username"]:
+                    recipient["name"] = out["to_username"]
+                recipient["carp_balance"] += out["amount"]
+            wallet[uid]["nonce"] = nonce
+            batch.touch(uid, *(out["to"] for out in outputs))
+            batch.settle(tx)
+            print("✅ Processed multitip transaction.")
+
+        elif tx_type == "mint":
+            print("🪙 Handling mint transaction")
+            wallet[uid]["carp_balance"] += tx["amount"]
+            wallet[uid]["nonce"] = nonce
+            batch.touch(uid)
+            batch.settle(tx)
+            print("✅ Mint transaction processed.")
+
+        elif tx_type == "buyticket":
+            print("🎟 Handling buyticket transaction")
+            raffle_name = tx.get("raffle")
+            ticket_count = tx.get("ticket_count", 0)
+            amount = tx.get("amount", 0)
+            to = tx.get("to")
+
+            if not raffle_name or ticket_count <= 0 or amount <= 0:
+                print("❌ Rejected: Invalid raffle ticket data.")
+                batch.reject(tx, "Invalid buyticket fields")
+                return
+
+            if wallet[uid]["carp_balance"] < amount:
+                print("❌ Rejected: Insufficient balance.")
+                batch.reject(tx, "Insufficient balance for buyticket")
+                return
+
+            if batch.tickets is None:
+                batch.tickets = load_tickets()
+            tickets = batch.tickets
+            if raffle_name not in tickets:
+                tickets[raffle_name] = {}
+
+            current_tickets = tickets[raffle_name].get(uid, 0)
+            tickets[raffle_name][uid] = current_tickets + ticket_count
+
+            wallet[uid]["carp_balance"] -= amount
+            if to:
+                if to not in wallet:
+                    wallet[to] = {"name": tx.get("to_username", to), "carp_balance": 0, "nonce": 0}
+                wallet[to]["carp_balance"] += amount
+                batch.touch(to)
+            wallet[uid]["nonce"] = nonce
+            batch.touch(uid)
+            batch.settle(tx)
+            print(f"✅ Buyticket transaction processed: {ticket_count} tickets for {raffle_name}.")
+
+        else:
+            print("❌ Rejected: Unknown transaction type.")
+            batch.reject(tx, "Unknown transaction type")
+
+    except Exception as e:
+        print(f"🔥 Exception while processing TX: {e}")
+        batch.reject(tx, f"Exception: {e}")
+
+
+def expected_nonce(wallets, user_id):
+    return wallets.get(user_id, {}).get("nonce", 0) + 1
+
+
+def _held_since(tx, now):
+    if "submitted_at" in tx:
+        return tx["submitted_at"]
+    return _first_seen.setdefault(tx.get("tx_id"), now)
+
+
+def tx_user_ids(txs):
+    return (
+        [tx.get("user_id") for tx in txs]
+        + [tx.get("to") for tx in txs if tx.get("to")]
+        + [out.get("to") for tx in txs for out in tx.get("outputs") or () if isinstance(out, dict)]
+    )
+
+
+def reason_label(reason):
+    # "Invalid nonce (expected 3, got 5)" -> "Invalid nonce", so the reason label keeps a bounded set of values
+    return re.split(r" \(|:| \d", reason, maxsplit=1)[0]
+
+
+def record_batch_metrics(batch, now):
+    for tx in batch.log_entries:
+        TXS_PROCESSED.inc(type=tx.get("type", "unknown"))
+    for _, reason in batch.rejected:
+        TXS_REJECTED.inc(reason=reason_label(reason))
+    for tx in batch.log_entries + [tx for tx, _ in batch.rejected]:
+        if "submitted_at" in tx:
+            SETTLE_LATENCY.observe(max(0.0, now - tx["submitted_at"]))
+    TXS_RELEASED.inc(batch.stats["released"])
+    MEMPOOL_DEPTH.set(len(batch.remaining_txs))
+    MEMPOOL_HELD.set(batch.stats["held"])
+    for stage in ("stage", "commit", "total"):
+        PASS_SECONDS.observe(batch.stats[f"{stage}_ms"] / 1000, stage=stage)
+
+
+def reject_after_broken_nonce(batch, tx, nonce):
+    print(f"❌ Rejected: nonce {nonce} of {tx.get('user_id')} was rejected before it.")
+    batch.reject(tx, f"Previous nonce rejected (nonce {nonce})")
+
+
+def apply_chain(batch, tx, queue, broken):
+    # Apply tx, then whatever part of the user's held chain it unblocked. When a tx at the
+    # expected nonce is rejected the wallet nonce stays put, so the user's later nonces can
+    # never apply: they are rejected now instead of blocking the user until they expire.
+    # Returns how many held txs were released.
+    uid = tx.get("user_id")
+    released = 0
+    while True:
+        nonce = expected_nonce(batch.wallets, uid)
+        apply_tx(batch, tx)
+        if expected_nonce(batch.wallets, uid) != nonce:
+            broken.pop(uid, None)
+        elif tx.get("nonce") == nonce:
+            broken[uid] = nonce
+            for later in sorted(queue or ()):
+                reject_after_broken_nonce(batch, queue.pop(later), nonce)
+            return released
+        if not queue or expected_nonce(batch.wallets, uid) not in queue:
+            return released
+        tx = queue.pop(expected_nonce(batch.wallets, uid))
+        released += 1
+
+
+def settle_batch(storage, wallets, txs):
+    # Caller holds ledger_lock()
+    started = time.perf_counter()
+    batch = LedgerBatch(wallets)
+    now = time.time()
+    # Per-user queues of txs whose nonce is ahead of the wallet, keyed by nonce
+    held = {}
+    # Users whose tx at the expected nonce was rejected this pass, and that nonce
+    broken = {}
+    released = expired = 0
+    for tx in txs:
+        if "tx_id" not in tx:
+            tx["tx_id"] = generate_tx_id(tx)
+        uid, nonce = tx.get("user_id"), tx.get("nonce")
+        if isinstance(nonce, int) and nonce > expected_nonce(batch.wallets, uid):
+            queue = held.setdefault(uid, {})
+            if uid in broken:
+                reject_after_broken_nonce(batch, tx, broken[uid])
+            elif nonce in queue:
+                batch.reject(tx, f"Duplicate nonce {nonce}")
+            else:
+                queue[nonce] = tx
+            continue
+        released += apply_chain(batch, tx, held.get(uid), broken)
+
+    # Whatever is still gapped either keeps waiting or has waited long enough
+    still_held = set()
+    for uid, queue in held.items():
+        for nonce in sorted(queue):
+            tx = queue[nonce]
+            if now - _held_since(tx, now) >= NONCE_GAP_HOLD_SECONDS:
+                print(f"❌ Rejected: nonce gap for {uid} (expected {expected_nonce(batch.wallets, uid)}, got {nonce}).")
+                batch.reject(tx, f"Nonce gap (expected {expected_nonce(batch.wallets, uid)}, got {nonce})")
+                expired += 1
+            else:
+                still_held.add(tx["tx_id"])
+    for tx_id in list(_first_seen):
+        if tx_id not in still_held:
+            del _first_seen[tx_id]
+
+    # Remove processed or rejected TXs, matched by tx_id
+    processed = batch.log_entries
+    rejected = batch.rejected
+    batch.remaining_txs = [tx for tx in txs if tx["tx_id"] not in batch.removed_tx_ids]
+    staged = time.perf_counter()
+
+    storage.commit_batch(batch)
+    if batch.tickets is not None:
+        save_tickets(batch.tickets)
+    committed = time.perf_counter()
+    maybe_checkpoint(storage, batch)
+
+    batch.stats = {
+        "txs": len(txs),
+        "processed": len(processed),
+        "rejected": len(rejected),
+        "held": len(still_held),
+        "released": released,
+        "gap_expired": expired,
+        "stage_ms": round((staged - started) * 1000, 2),
+        "commit_ms": round((committed - staged) * 1000, 2),
+        "total_ms": round((committed - started) * 1000, 2),
+    }
+    LAST_BATCH_STATS.update(batch.stats)
+    for key in MEMPOOL_STATS:
+        MEMPOOL_STATS[key] += batch.stats[key]
+    record_batch_metrics(batch, time.time())
+    print(
+        f"⏱️ Batch committed: {batch.stats['processed']} processed, {batch.stats['rejected']} rejected, "
+        f"{batch.stats['held']} held "
+        f"in {batch.stats['total_ms']} ms (stage {batch.stats['stage_ms']} ms, commit {batch.stats['commit_ms']} ms)"
+    )
+    return batch
+
+
+def replay_log(wallets, entries):
+    # Re-applies logged txs through apply_tx; entries whose nonce the wallet already passed are skipped,
+    # so replaying a suffix that was partly applied is safe
+    batch = LedgerBatch(wallets)
+    seen = []
+    for entry in entries:
+        seen.append(entry.get("tx_id"))
+        apply_tx(batch, entry)
+    return batch, seen
+
+
+def create_checkpoint(storage):
+    # Caller holds ledger_lock()
+    seq, tx_id = storage.log_position()
+    path = write_checkpoint(storage.load_document(WALLET_FILE), seq, tx_id)
+    print(f"📸 Wallet checkpoint written at log seq {seq}: {path}")
+    return {"seq": seq, "tx_id": tx_id, "path": path}
+
+
+def recover_wallets(storage, from_checkpoint=False):
+    """Bring the wallets up to the end of the tx log after a crash or a damaged wallet file.
+
+    Starts from the wallet file when it is readable and only behind the log,
+    otherwise from the newest checkpoint, and replays just the log suffix.
+    Pending txs that already made it into the log are dropped. Caller holds
+    ledger_lock(). Returns a summary, or None when nothing had to be done.
+    """
+    last_seq, last_tx_id = storage.log_position()
+    wallets = None
+    if not from_checkpoint:
+        try:
+            wallets = storage.load_document(WALLET_FILE)
+        except ValueError as e:
+            print(f"🔥 Wallet store unreadable ({e}), restoring from the last checkpoint.")
+            for shard in range(WALLET_SHARDS):
+                path = shard_file(WALLET_FILE, shard)
+                if os.path.exists(path):
+                    os.replace(path, f"{path}.corrupt-{int(time.time())}")
+
+    if wallets is not None:
+        applied = storage.applied_log_seq()
+        if applied is None:
+            # First start with checkpointing: the wallet file is taken as current
+            storage.mark_log_applied(last_seq)
+            if load_latest_checkpoint() is None:
+                write_checkpoint(wallets, last_seq, last_tx_id)
+            return None
+        if applied >= last_seq:
+            return None
+        base, since, source = wallets, applied, "wallet file"
+    else:
+        checkpoint = load_latest_checkpoint(max_seq=last_seq)
+        if checkpoint is None:
+            base, since, source = {}, 0, "empty ledger"
+        else:
+            base, since, source = checkpoint["wallets"], checkpoint["seq"], f"checkpoint {checkpoint['seq']}"
+
+    started = time.perf_counter()
+    batch, replayed_ids = replay_log(base, storage.iter_log(since))
+    storage.save_document(WALLET_FILE, batch.wallets)
+    storage.mark_log_applied(last_seq)
+
+    replayed = set(replayed_ids)
+    pending = storage.load_document(PENDING_FILE).get("txs", [])
+    keep = [tx for tx in pending if tx.get("tx_id") not in replayed]
+    if len(keep) != len(pending):
+        storage.save_document(PENDING_FILE, {"txs": keep})
+
+    summary = {
+        "source": source,
+        "from_seq": since,
+        "to_seq": last_seq,
+        "replayed": len(batch.log_entries),
+        "skipped": len(batch.rejected),
+        "pending_dropped": len(pending) - len(keep),
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    print(f"🩹 Wallets recovered from {source}: {summary}")
+    return summary
+
+
+def maybe_checkpoint(storage, batch):
+    # Caller holds ledger_lock()
+    if not batch.log_entries:
+        return
+    seq, _ = storage.log_position()
+    if checkpoint_due(seq):
+        try:
+            create_checkpoint(storage)
+        except Exception as e:
+            print(f"⚠️ Wallet checkpoint failed: {e}")
+
+
+def run_worker_pass():
+    if service_running():
+        # The ledger service owns the mempool and settles it itself
+        return None
+    storage = get_storage()
+    with ledger_lock():
+        txs = load_json(PENDING_FILE).get("txs", [])
+        if not txs:
+            LAST_BATCH_STATS["held"] = 0
+            MEMPOOL_DEPTH.set(0)
+            MEMPOOL_HELD.set(0)
+            return None
+        # print(f"📦 Found {len(txs)} pending transaction(s).")
+        batch = settle_batch(storage, storage.load_wallets(tx_user_ids(txs)), txs)
+    return batch.stats
+
+
 def process_pending_transactions(shutdown_event):
     print("🔄 TX worker started...")
-    while not shutdown_event.is_set():
-        # print("🔄 Checking for pending transactions...")
-        with FileLock(LOCKFILE):
-            pending = load_json(PENDING_FILE)
-            wallet = load_json(WALLET_FILE)
-            txs = pending.get("txs", [])
-            # print(f"📦 Found {len(txs)} pending transaction(s).")
-            processed = []
-            rejected = []
-
-            for tx in txs:
+    metrics.start_server()
+    if not service_running():
+        try:
+            with ledger_lock():
+                recover_wallets(get_storage())
+        except Exception as e:
+            print(f"🔥 Wallet recovery failed: {e}")
+    listener = PendingListener()
+    idle_poll = None
+    last_pass = last_upgrade_check = 0
+    try:
+        while not shutdown_event.is_set():
+            heartbeat()
+            if service_running():
+                # The ledger service settles the pool; leave the notify port and the wakeups to it,
+                # or it only learns about direct appends on its idle reload
+                if idle_poll is not None:
+                    listener.stop()
+                    idle_poll = None
+                    print("📒 Ledger service is running, TX worker standing by.")
+                shutdown_event.wait(WAKEUP_TIMEOUT_SECONDS)
+                continue
+            if idle_poll is None:
+                # Without the listener only in-process submits wake us, so keep the old polling cadence
+                idle_poll = IDLE_POLL_SECONDS if listener.start() else FALLBACK_POLL_SECONDS
+                last_pass = 0
+            # Sleep until safe_append_tx signals new txs; the timeout only bounds shutdown latency
+            notified = wait_for_pending(WAKEUP_TIMEOUT_SECONDS)
+            now = time.monotonic()
+            # Held txs have to be re-checked so they can expire even if nothing new arrives
+            poll = min(idle_poll, HELD_RECHECK_SECONDS) if LAST_BATCH_STATS.get("held") else idle_poll
+            if notified or now - last_pass >= poll:
+                if service_running():
+                    # The service came up while we slept; the wakeup is left set for it
+                    continue
+                # print("🔄 Checking for pending transactions...")
+                clear_pending()
+                last_pass = now
                 try:
-                    print(f"\n⚙️ Processing TX: {tx}")
-                    uid = tx["user_id"]
-                    if uid not in wallet:
-                        print(f"➕ Creating wallet for user {uid}")
-                        wallet[uid] = {"name": tx["username"], "carp_balance": 0, "nonce": 0}
-                    elif wallet[uid]["name"] != tx["username"]:
-                        print(f"📝 Updating username for {uid} to {tx['username']}")
-                        wallet[uid]["name"] = tx["username"]
-
-                    nonce = tx.get("nonce")
-                    expected_nonce = wallet[uid]["nonce"] + 1
-                    print(f"🔢 Nonce in TX: {nonce}, Expected: {expected_nonce}")
-
-                    if nonce is None:
-                        print("❌ Rejected: Missing nonce.")
-                        append_to_rejected_log(tx, "Missing nonce")
-                        rejected.append(tx)
-                        continue
-
-                    if nonce != expected_nonce:
-                        print("❌ Rejected: Invalid nonce.")
-                        append_to_rejected_log(tx, f"Invalid nonce (expected {expected_nonce}, got {nonce})")
-                        rejected.append(tx)
-                        continue
-
-                    tx_type = tx["type"]
-
-                    if tx_type in ["tip", "bait", "reward"]:
-                        print(f"💸 Handling {tx_type} transaction")
-                        to = tx["to"]
-                        if wallet[uid]["carp_balance"] < tx["amount"]:
-                            print("❌ Rejected: Insufficient balance.")
-                            append_to_rejected_log(tx, "Insufficient balance")
-                            rejected.append(tx)
-                            continue
-
-                        if to not in wallet:
-                            print(f"➕ Creating recipient wallet for {to}")
-                            wallet[to] = {"name": tx["to_username"], "carp_balance": 0, "nonce": 0}
-                        elif wallet[to]["name"] != tx["to_username"]:
-                            print(f"📝 Updating recipient username for {to}")
-                            wallet[to]["name"] = tx["to_username"]
-
-                        wallet[uid]["carp_balance"] -= tx["amount"]
-                        wallet[to]["carp_balance"] += tx["amount"]
-                        wallet[uid]["nonce"] = nonce
-                        append_to_tx_log(tx)
-                        # if tx_type != "bait":
-                        #     append_to_tx_log({**tx, "type": "receive"})
-                        processed.append(tx)
-                        print(f"✅ Processed {tx_type} transaction.")
-
-                    elif tx_type == "mint":
-                        print("🪙 Handling mint transaction")
-                        wallet[uid]["carp_balance"] += tx["amount"]
-                        wallet[uid]["nonce"] = nonce
-                        append_to_tx_log(tx)
-                        processed.append(tx)
-                        print("✅ Mint transaction processed.")
-
-                    elif tx_type == "buyticket":
-                        print("🎟 Handling buyticket transaction")
-                        raffle_name = tx.get("raffle")
-                        ticket_count = tx.get("ticket_count", 0)
-                        amount = tx.get("amount", 0)
-
-                        if not raffle_name or ticket_count <= 0 or amount <= 0:
-                            print("❌ Rejected: Invalid raffle ticket data.")
-                            append_to_rejected_log(tx, "Invalid buyticket fields")
-                            rejected.append(tx)
-                            continue
-
-                        if wallet[uid]["carp_balance"] < amount:
-                            print("❌ Rejected: Insufficient balance.")
-                            append_to_rejected_log(tx, "Insufficient balance for buyticket")
-                            rejected.append(tx)
-                            continue
-
-                        tickets = load_tickets()
-                        if raffle_name not in tickets:
-                            tickets[raffle_name] = {}
-
-                        current_tickets = tickets[raffle_name].get(uid, 0)
-                        tickets[raffle_name][uid] = current_tickets + ticket_count
-                        save_tickets(tickets)
-
-                        wallet[uid]["carp_balance"] -= amount
-                        wallet[to]["carp_balance"] += amount
-                        wallet[uid]["nonce"] = nonce
-                        append_to_tx_log(tx)
-                        processed.append(tx)
-                        print(f"✅ Buyticket transaction processed: {ticket_count} tickets for {raffle_name}.")
-
-                    else:
-                        print("❌ Rejected: Unknown transaction type.")
-                        append_to_rejected_log(tx, "Unknown transaction type")
-                        rejected.append(tx)
-
+                    run_worker_pass()
                 except Exception as e:
-                    print(f"🔥 Exception while processing TX: {e}")
-                    append_to_rejected_log(tx, f"Exception: {e}")
-                    rejected.append(tx)
-
-            # Remove processed or rejected TXs
-            txs = [tx for tx in txs if tx not in processed and tx not in rejected]
-            pending["txs"] = txs
-            save_json(PENDING_FILE, pending)
-            save_json(WALLET_FILE, wallet)
-            check_upgrade_completion()
-            # print(f"✅ Updated wallet and pending tx files. Sleeping...\n")
-
-        time.sleep(5)
+                    print(f"🔥 TX worker pass failed: {e}")
+            if now - last_upgrade_check >= UPGRADE_CHECK_SECONDS:
+                last_upgrade_check = now
+                check_upgrade_completion()
+    finally:
+        listener.stop()
     print("🛑 TX worker stopped.")
 
 
@@ -187,6 +522,8 @@ import threading
 
 
 def main():
+    from components import redirect_output
+    redirect_output()
     shutdown_event = threading.Event()
     process_pending_transactions(shutdown_event)
 
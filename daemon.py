@@ -0,0 +1,123 @@
+# daemon.py
+# Runs a chosen set of components headless: no tkinter, no controller window, and no bot module
+# (or discord.py) imported unless that bot is started.
+#
+#   python daemon.py "TX Worker"                          # just the worker
+#   python daemon.py "TX Worker" "Ledger Service" --console
+#   python daemon.py --all
+#   DAEMON_COMPONENTS="TX Worker,Catch Bot" python daemon.py    # e.g. from a systemd unit
+#   python daemon.py --processes "TX Worker" "Catch Bot"  # one supervised process each, see supervisor.py
+#   python daemon.py --list
+#
+# Components run as threads named after them, as in BOILIE_control. Output goes to DEBUG_FILE
+# unless --console. SIGTERM or Ctrl+C stops them; a component that ends on its own is logged and
+# not restarted, and the daemon exits 1 once none is left, so a service manager can restart it.
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+from components import COMPONENTS, entry_module, load_entry, redirect_output
+
+DAEMON_COMPONENTS = [name.strip() for name in os.getenv("DAEMON_COMPONENTS", "").split(",") if name.strip()]
+STOP_GRACE_SECONDS = int(os.getenv("DAEMON_STOP_GRACE_SECONDS", "15"))
+CHECK_SECONDS = 1
+
+
+def _run(name, func, stop_event):
+    try:
+        func(stop_event)
+    except Exception as e:
+        print(f"🔥 {name} crashed: {e!r}")
+
+
+def start_component(name, stop_event):
+    """Import the component now and run it in a thread named after it; None if it cannot be imported."""
+    started = time.perf_counter()
+    try:
+        func = load_entry(name)
+    except Exception as e:
+        print(f"❌ {name} could not be loaded: {e!r}")
+        return None
+    print(f"🧩 {name} loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+    thread = threading.Thread(target=_run, args=(name, func, stop_event), name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def run(names):
+    """Run names until SIGTERM or Ctrl+C; False if every component ended on its own."""
+    from core import metrics
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    events = {name: threading.Event() for name in names}
+    threads = {}
+    running = metrics.gauge("boilies_component_running", "1 while a component started from the daemon is running", ("component",))
+    for name in names:
+        thread = start_component(name, events[name])
+        if thread is not None:
+            threads[name] = thread
+            running.set_function(thread.is_alive, component=name)
+    metrics.start_server()
+    print(f"🚀 Daemon running: {', '.join(threads) or 'nothing'} (pid {os.getpid()})")
+
+    alive = dict(threads)
+    while alive and not stopping.wait(CHECK_SECONDS):
+        for name, thread in list(alive.items()):
+            if not thread.is_alive():
+                print(f"⚠️ {name} ended on its own.")
+                del alive[name]
+    if not stopping.is_set():
+        print("❌ No component left running.")
+        return False
+
+    print("🛑 Stopping components...")
+    for event in events.values():
+        event.set()
+    deadline = time.monotonic() + STOP_GRACE_SECONDS
+    for name, thread in threads.items():
+        thread.join(max(0, deadline - time.monotonic()))
+        if thread.is_alive():
+            print(f"⚠️ {name} did not stop within {STOP_GRACE_SECONDS} s, leaving it behind.")
+    print("🛑 Daemon stopped.")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run components without the controller window")
+    parser.add_argument("components", nargs="*", help="Components to start (default: DAEMON_COMPONENTS)")
+    parser.add_argument("--all", action="store_true", help="Start every component")
+    parser.add_argument("--processes", action="store_true", help="Run each component in its own supervised process")
+    parser.add_argument("--console", action="store_true", help="Print to the terminal instead of DEBUG_FILE")
+    parser.add_argument("--list", action="store_true", help="List the components and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name in COMPONENTS:
+            print(f"{name:<16} {entry_module(name)}")
+        return
+    names = list(COMPONENTS) if args.all else args.components or DAEMON_COMPONENTS
+    if not names:
+        parser.error("Name the components to start, set DAEMON_COMPONENTS, or pass --all")
+    unknown = [name for name in names if name not in COMPONENTS]
+    if unknown:
+        parser.error(f"Unknown components: {', '.join(unknown)}. Choose from: {', '.join(COMPONENTS)}")
+
+    if not args.console:
+        redirect_output()
+    if args.processes:
+        import supervisor
+        ok = supervisor.serve(names)
+    else:
+        ok = run(names)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,8 @@ else:
 # Load environment variables from .env in the main directory
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-# File and directory paths
-DATA_DIR = os.path.join(BASE_DIR, "data")
+# File and directory paths (BOILIES_DATA_DIR points benchmarks and tooling at a scratch ledger)
+DATA_DIR = os.getenv("BOILIES_DATA_DIR") or os.path.join(BASE_DIR, "data")
 BACKUP_DIR = os.path.join(BASE_DIR, "backup")
 CORE_DIR = os.path.join(BASE_DIR, "core")
 BOTS_DIR = os.path.join(BASE_DIR, "bots")
@@ -20,14 +20,27 @@ FISH_IMAGES_DIR = os.path.join(BASE_DIR, "fish_images")
 ASSETS_DIR = os.path.join(BASE_DIR, "assets")
 
 # Individual files
-DEBUG_FILE = os.path.join(BASE_DIR, "debug.log")
+DEBUG_FILE = os.getenv("BOILIES_DEBUG_FILE") or os.path.join(BASE_DIR, "debug.log")
 WALLET_FILE = os.path.join(DATA_DIR, "wallet_store.json")
 LOCKFILE = WALLET_FILE + ".lock"
 TICKETS_FILE = os.path.join(DATA_DIR, "raffle_tickets.json")
 PENDING_FILE = os.path.join(DATA_DIR, "pending_tx.json")
+PENDING_OUTFLOW_FILE = os.path.join(DATA_DIR, "pending_outflow.json")
+SHARD_DIR = os.path.join(DATA_DIR, "shards")
 TX_LOG_FILE = os.path.join(DATA_DIR, "tx_log.json")
+TX_LOG_DIR = os.path.join(DATA_DIR, "tx_log")
+TX_INDEX_FILE = os.path.join(DATA_DIR, "tx_ids.idx")
+WALLET_STATE_FILE = os.path.join(DATA_DIR, "wallet_state.json")
+SNAPSHOT_FILE = os.path.join(DATA_DIR, "wallet_snapshot.json")
+OUTFLOW_SNAPSHOT_FILE = os.path.join(DATA_DIR, "outflow_snapshot.json")
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "checkpoints")
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
 REJECTED_LOG_FILE = os.path.join(DATA_DIR, "rejected_tx_log.json")
 LEADERBOARD_FILE = os.path.join(DATA_DIR, "fish_leaderboard.json")
 RAFFLES_FILE = os.path.join(DATA_DIR, "raffles.json")
 WINNERS_FILE = os.path.join(DATA_DIR, "raffle_winners.json")
 FACTORY_FILE = os.path.join(DATA_DIR, "factory_data.json")
+LEDGER_DB = os.path.join(DATA_DIR, "ledger.db")
+LEDGER_SOCKET = os.path.join(DATA_DIR, "ledger.sock")
+LEDGER_SERVICE_LOCK = os.path.join(DATA_DIR, "ledger_service.lock")
@@ -0,0 +1,448 @@
+# supervisor.py
+# Runs every component in a process of its own and keeps it running.
+#
+#   python supervisor.py                         # start all components
+#   python supervisor.py "TX Worker" "Catch Bot" # start only these; the rest can be started from a client
+#   python supervisor.py --status                # ask a running supervisor
+#   SUPERVISOR=1 python BOILIE_control.py        # the controller attaches as a client instead of running threads
+#
+# A component that exits or stops answering health pings is restarted according to its policy, with
+# exponential backoff. Each child serves its own metrics endpoint on METRICS_PORT + 1 + its position
+# in COMPONENTS; the supervisor serves its own on METRICS_PORT.
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from components import COMPONENTS, load_entry, redirect_output, set_heartbeat
+
+SUPERVISOR_PORT = int(os.getenv("SUPERVISOR_PORT", "47814"))
+SUPERVISOR_HOST = "127.0.0.1"
+HEALTH_PING_SECONDS = int(os.getenv("HEALTH_PING_SECONDS", "5"))
+# A child whose heartbeat is older than this is considered hung and killed
+HEALTH_TIMEOUT_SECONDS = int(os.getenv("HEALTH_TIMEOUT_SECONDS", "60"))
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = int(os.getenv("BACKOFF_MAX_SECONDS", "300"))
+# A child that ran this long without failing starts over at the base backoff
+BACKOFF_RESET_SECONDS = 60
+STOP_GRACE_SECONDS = 10
+TICK_SECONDS = 0.5
+# Defaults for every child, 0 for no limit; a component's "limits" overrides them
+DEFAULT_LIMITS = {
+    "memory_mb": int(os.getenv("SUPERVISOR_MEMORY_MB", "0")),
+    "cpu_seconds": int(os.getenv("SUPERVISOR_CPU_SECONDS", "0")),
+    "open_files": int(os.getenv("SUPERVISOR_OPEN_FILES", "0")),
+}
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def metrics_port(name):
+    from core.metrics import METRICS_PORT
+    return METRICS_PORT + 1 + list(COMPONENTS).index(name) if METRICS_PORT else 0
+
+
+# Child process
+def apply_limits(limits):
+    try:
+        import resource
+    except ImportError:
+        if limits["cpu_seconds"] or limits["open_files"]:
+            print("⚠️ CPU and open file limits need the resource module, not available on this platform.")
+        return
+    if limits["cpu_seconds"]:
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu_seconds"], limits["cpu_seconds"]))
+    if limits["open_files"]:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limits["open_files"], limits["open_files"]))
+
+
+def _beat(heartbeat):
+    heartbeat.value = time.time()
+
+
+def _run_child(name, stop, heartbeat, limits, port):
+    """Entry point of a child process: runs the component in a thread named after it and answers health pings."""
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    # Ctrl+C reaches the whole process group; the supervisor decides when children stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["METRICS_PORT"] = str(port)
+    apply_limits(limits)
+    redirect_output()
+    spec = COMPONENTS[name]
+    if not spec["asyncio"]:
+        # Beats come from the component's loop, never from this monitor, so a hung loop is noticed
+        set_heartbeat(lambda: _beat(heartbeat))
+    func = load_entry(name)
+
+    shutdown = threading.Event()
+    failure = []
+
+    def run():
+        try:
+            func(shutdown)
+        except BaseException as e:
+            failure.append(e)
+            print(f"🔥 {name} crashed: {e!r}")
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    loop = None
+    while thread.is_alive():
+        if shutdown.is_set():
+            thread.join(TICK_SECONDS)
+            continue
+        if stop.wait(HEALTH_PING_SECONDS):
+            shutdown.set()
+            continue
+        if spec["asyncio"]:
+            if loop is None or loop.is_closed():
+                from core.profiling import running_loops
+                loop = running_loops().get(thread.ident)
+            if loop is not None:
+                try:
+                    loop.call_soon_threadsafe(_beat, heartbeat)
+                except RuntimeError:
+                    loop = None
+    # Returning on its own, without being asked to, counts as a failure
+    sys.exit(0 if stop.is_set() and not failure else 1)
+
+
+# Supervisor
+class Child:
+    def __init__(self, name, spec, context):
+        self.name = name
+        self.spec = spec
+        self.context = context
+        self.limits = dict(DEFAULT_LIMITS, **spec.get("limits", {}))
+        self.process = None
+        self.stop_event = None
+        self.heartbeat = context.Value("d", 0.0, lock=False)
+        self.wanted = False
+        self.state = "stopped"
+        self.started_at = None
+        self.stop_deadline = None
+        self.next_start = 0
+        self.backoff = BACKOFF_BASE_SECONDS
+        self.restarts = 0
+        self.last_exit = None
+        self.kill_reason = None
+
+    def spawn(self):
+        self.stop_event = self.context.Event()
+        self.heartbeat.value = time.time()
+        self.process = self.context.Process(
+            target=_run_child, name=f"boilies-{self.name}",
+            args=(self.name, self.stop_event, self.heartbeat, self.limits, metrics_port(self.name)),
+        )
+        self.process.start()
+        self.started_at = time.time()
+        self.stop_deadline = None
+        self.kill_reason = None
+        self.state = "running"
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def memory_bytes(self):
+        # Resident set size from /proc; None where that is not available
+        if not self.alive():
+            return None
+        try:
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def kill(self, reason):
+        self.kill_reason = reason
+        self.process.kill()
+
+    def status(self):
+        memory = self.memory_bytes()
+        return {
+            "state": self.state,
+            "pid": self.process.pid if self.alive() else None,
+            "restart": self.spec["restart"],
+            "restarts": self.restarts,
+            "uptime": round(time.time() - self.started_at) if self.alive() else None,
+            "heartbeat_age": round(time.time() - self.heartbeat.value, 1) if self.alive() else None,
+            "memory_mb": round(memory / 2 ** 20, 1) if memory else None,
+            "last_exit": self.last_exit,
+            "next_start_in": round(max(0, self.next_start - time.time()), 1) if self.state == "backoff" else None,
+            "metrics_port": metrics_port(self.name),
+        }
+
+
+class Supervisor:
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.children = {name: Child(name, spec, self.context) for name, spec in COMPONENTS.items()}
+        self.events = collections.deque(maxlen=200)
+        self._event_ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
+        from core import metrics
+        self.restart_counter = metrics.counter("boilies_component_restarts_total", "Supervisor restarts per component and reason", ("component", "reason"))
+        running = metrics.gauge("boilies_component_running", "1 while a component started from the controller is running", ("component",))
+        memory = metrics.gauge("boilies_component_memory_bytes", "Resident memory of the component's process", ("component",))
+        for name, child in self.children.items():
+            running.set_function(lambda child=child: child.alive(), component=name)
+            memory.set_function(lambda child=child: child.memory_bytes(), component=name)
+
+    def log(self, text):
+        print(text)
+        with self.lock:
+            self.events.append((next(self._event_ids), f"{time.strftime('%H:%M:%S')} {text}"))
+
+    def _child(self, name):
+        child = self.children.get(name)
+        if child is None:
+            raise ValueError(f"Unknown component: {name}")
+        return child
+
+    # Control API
+    def start(self, name):
+        with self.lock:
+            child = self._child(name)
+            child.wanted = True
+            child.backoff = BACKOFF_BASE_SECONDS
+            child.next_start = 0
+            if not child.alive():
+                child.state = "starting"
+        return child.status()
+
+    def stop(self, name):
+        with self.lock:
+            child = self._child(name)
+            child.wanted = False
+            if child.alive():
+                child.stop_event.set()
+                child.stop_deadline = time.time() + STOP_GRACE_SECONDS
+                child.state = "stopping"
+                self.log(f"🛑 Stopping {name}")
+            else:
+                child.state = "stopped"
+        return child.status()
+
+    def restart(self, name):
+        self.stop(name)
+        return self.start(name)
+
+    def status(self, since=0):
+        with self.lock:
+            return {
+                "components": {name: child.status() for name, child in self.children.items()},
+                "events": [event for event in self.events if event[0] > since],
+            }
+
+    def ping(self):
+        return True
+
+    METHODS = {"start", "stop", "restart", "status", "ping"}
+
+    # Loop
+    def _exited(self, child, now):
+        code = child.process.exitcode
+        reason = child.kill_reason or ("exit" if code == 0 else f"exit code {code}")
+        child.last_exit = {"code": code, "reason": reason, "at": int(now)}
+        child.process = None
+        if child.stop_deadline is not None or not child.wanted:
+            # Stopped on request; a restart request wants it back right away
+            if child.wanted:
+                child.state = "starting"
+                child.next_start = now
+            else:
+                child.state = "stopped"
+            self.log(f"⚪ {child.name} stopped ({reason})")
+            return
+        failed = code != 0 or child.kill_reason is not None
+        if child.spec["restart"] == "never" or (child.spec["restart"] == "on-failure" and not failed):
+            child.wanted = False
+            child.state = "failed" if failed else "stopped"
+            self.log(f"🔴 {child.name} exited ({reason}), not restarting ({child.spec['restart']})")
+            return
+        if now - child.started_at >= BACKOFF_RESET_SECONDS:
+            child.backoff = BACKOFF_BASE_SECONDS
+        child.next_start = now + child.backoff
+        child.state = "backoff"
+        child.restarts += 1
+        self.restart_counter.inc(component=child.name, reason=child.kill_reason or "exit")
+        self.log(f"🔁 {child.name} exited ({reason}), restarting in {child.backoff} s")
+        child.backoff = min(BACKOFF_MAX_SECONDS, child.backoff * 2)
+
+    def tick(self):
+        now = time.time()
+        with self.lock:
+            for child in self.children.values():
+                if child.process is not None and not child.process.is_alive():
+                    child.process.join()
+                    self._exited(child, now)
+                elif child.alive():
+                    if child.stop_deadline is not None and now >= child.stop_deadline:
+                        self.log(f"💀 {child.name} did not stop within {STOP_GRACE_SECONDS} s, killing it")
+                        child.kill("stop timeout")
+                    elif child.wanted and now - child.heartbeat.value > HEALTH_TIMEOUT_SECONDS:
+                        self.log(f"💔 {child.name} missed health pings for {now - child.heartbeat.value:.0f} s, killing it")
+                        child.kill("health")
+                    elif child.wanted and child.limits["memory_mb"] and (child.memory_bytes() or 0) > child.limits["memory_mb"] * 2 ** 20:
+                        self.log(f"🐘 {child.name} is over its {child.limits['memory_mb']} MB memory limit, killing it")
+                        child.kill("memory")
+                elif child.wanted and now >= child.next_start:
+                    child.spawn()
+                    self.log(f"🟢 {child.name} started (pid {child.process.pid})")
+
+    def run(self, names):
+        for name in names:
+            self.start(name)
+        server = _serve(self)
+        print(f"🧭 Supervisor listening on {SUPERVISOR_HOST}:{SUPERVISOR_PORT}")
+        try:
+            while not self.stopping.wait(TICK_SECONDS):
+                self.tick()
+        finally:
+            server.shutdown()
+            self.shutdown()
+
+    def shutdown(self):
+        # Stop every child, give them the grace period, then kill what is left
+        for name, child in self.children.items():
+            if child.alive():
+                self.stop(name)
+        deadline = time.time() + STOP_GRACE_SECONDS
+        while any(child.alive() for child in self.children.values()) and time.time() < deadline:
+            time.sleep(TICK_SECONDS)
+        for child in self.children.values():
+            if child.alive():
+                child.process.kill()
+                child.process.join()
+        print("🛑 Supervisor stopped.")
+
+
+# Control protocol: one JSON request per line, as the ledger service uses
+def _serve(supervisor):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    method = request.get("method")
+                    if method not in Supervisor.METHODS:
+                        raise ValueError(f"Unknown method: {method}")
+                    response = {"id": request_id, "result": getattr(supervisor, method)(**(request.get("params") or {}))}
+                except Exception as e:
+                    response = {"id": request_id, "error": str(e)}
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+    class Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    server = Server((SUPERVISOR_HOST, SUPERVISOR_PORT), Handler)
+    threading.Thread(target=server.serve_forever, name="supervisor-control", daemon=True).start()
+    return server
+
+
+class SupervisorUnavailable(Exception):
+    pass
+
+
+class SupervisorClient:
+    """Blocking client for the controller and the command line, one connection per thread."""
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def call(self, method, **params):
+        for attempt in range(2):
+            stream = getattr(self._local, "stream", None)
+            try:
+                if stream is None:
+                    sock = socket.create_connection((SUPERVISOR_HOST, SUPERVISOR_PORT), timeout=self.timeout)
+                    stream = self._local.stream = sock.makefile("rwb")
+                stream.write((json.dumps({"id": next(self._ids), "method": method, "params": params}) + "\n").encode("utf-8"))
+                stream.flush()
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError("Supervisor closed the connection")
+            except OSError:
+                self._local.stream = None
+                if attempt:
+                    raise SupervisorUnavailable(f"No supervisor on {SUPERVISOR_HOST}:{SUPERVISOR_PORT}")
+                continue
+            response = json.loads(line)
+            if "error" in response:
+                raise ValueError(response["error"])
+            return response.get("result")
+
+    def running(self):
+        try:
+            return self.call("ping")
+        except SupervisorUnavailable:
+            return False
+
+
+def format_status(status):
+    lines = [f"{'component':<16} {'state':<9} {'pid':>7} {'uptime':>8} {'restarts':>8} {'memory':>9} {'ping age':>8} {'metrics':>7}  last exit"]
+    for name, s in status["components"].items():
+        last_exit = s["last_exit"]["reason"] if s["last_exit"] else ""
+        lines.append(
+            f"{name:<16} {s['state']:<9} {s['pid'] or '':>7} {s['uptime'] if s['uptime'] is not None else '':>8} "
+            f"{s['restarts']:>8} {s['memory_mb'] or '':>9} {s['heartbeat_age'] if s['heartbeat_age'] is not None else '':>8} {s['metrics_port'] or '':>7}  {last_exit}"
+        )
+    return "\n".join(lines)
+
+
+def serve(names):
+    """Supervise names from this process until SIGTERM or Ctrl+C; False if another supervisor is running."""
+    if SupervisorClient().running():
+        print(f"⚠️ A supervisor is already running on {SUPERVISOR_HOST}:{SUPERVISOR_PORT}.")
+        return False
+
+    from core import metrics
+    supervisor = Supervisor()
+    # SIGTERM (systemd, docker) stops the children as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.stopping.set())
+    metrics.start_server()
+    try:
+        supervisor.run(names)
+    except KeyboardInterrupt:
+        pass
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run each component in its own supervised process")
+    parser.add_argument("components", nargs="*", help="Components to start (default: all)")
+    parser.add_argument("--none", action="store_true", help="Start nothing; components are started by clients")
+    parser.add_argument("--status", action="store_true", help="Print the status of a running supervisor")
+    args = parser.parse_args()
+    unknown = [name for name in args.components if name not in COMPONENTS]
+    if unknown:
+        parser.error(f"Unknown components: {', '.join(unknown)}. Choose from: {', '.join(COMPONENTS)}")
+
+    if args.status:
+        try:
+            print(format_status(SupervisorClient().call("status")))
+        except SupervisorUnavailable as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        return
+    if not serve([] if args.none else args.components or list(COMPONENTS)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()